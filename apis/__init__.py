@@ -6,6 +6,7 @@ from .employee_api import api as employee_api
 from .subunit_api import api as subunit_api
 from .post_api import api as post_api
 from .feed_api import api as feed_api
+from .metrics_api import api as metrics_api
 
 
 api_bp = Blueprint('api', __name__)
@@ -45,6 +46,7 @@ api.add_namespace(subunit_api)
 api.add_namespace(post_api)
 api.add_namespace(feed_api)
 api.add_namespace(attachment_api)
+api.add_namespace(metrics_api)
 
 cors_headers = {
     "Access-Control-Allow-Origin": "*",
@@ -51,6 +51,9 @@ class Attachment(OptionsResource):
 
     @api.doc("attachment_download", params=required_query_params({"id": "Attachment ID"}), security='apikey')
     @api.response(200, description="Success (response contains a requested file)")
+    @api.response(206, description="Success (response contains the requested range of the file)")
+    @api.response(304, description="The file is not modified (it never is)")
+    @api.response(416, description="Requested range is not satisfiable")
     @api.response(404, description="Attachment not found")
     @jwt_required
     def get(self):
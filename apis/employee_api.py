@@ -1,13 +1,18 @@
+from os import path
+
 from flask_restx.namespace import Namespace
+from flask_restx.reqparse import RequestParser
+from flask_restx import fields
 from flask import request, abort
-from flask_jwt_extended import (jwt_required, get_jwt_identity, jwt_refresh_token_required,
-                                create_access_token, create_refresh_token)
+from flask_jwt_extended import jwt_required, get_jwt_identity, jwt_refresh_token_required
+from werkzeug.datastructures import FileStorage
 
 from services import employee_service, get_uuid
-from .utils import OptionsResource
+from .utils import OptionsResource, conditional, db_timeouts
 from models import required_query_params, query_param_to_set
 from models.employee_model import (AuthModel, FullEmployeeModel, EmployeeRegistrationModel,
-                                   TokenModel, EmployeeEditModel, EmployeeIdModel, EmployeeType)
+                                   TokenModel, EmployeeEditModel, EmployeeIdModel, EmployeeType,
+                                   EmployeeImportErrorModel)
 
 
 api = Namespace('employee', description='Employees-related actions')
@@ -42,10 +47,28 @@ id_model = api.model(
     EmployeeIdModel()
 )
 
+employee_import_result = api.model(
+    'employee_import_result_model',
+    {
+        "imported": fields.Integer(description="Count of imported employees", example=1),
+        "errors":
+            fields.List(
+                fields.Nested(api.model("employee_import_error_model", EmployeeImportErrorModel()))
+            )
+    }
+)
+
+import_parser: RequestParser = api.parser()
+import_parser.add_argument('file', location='files', type=FileStorage, required=True,
+                           help="CSV file with a header or NDJSON file with fields of employee registration model")
+import_parser.add_argument('format', location='args', choices=("csv", "ndjson"), required=False,
+                           help="Format of the file (taken from the file extension by default)")
+
 
 @api.route('')
 class Employee(OptionsResource):
     @api.doc('get_employee', security='apikey', params=required_query_params({'id': 'employee ID'}))
+    @conditional(lambda: employee_service.get_employee_etag(get_uuid(request)))
     @api.marshal_with(full_employee, code=200)
     @api.response(404, description="Employee not found")
     @jwt_required
@@ -78,12 +101,37 @@ class Employee(OptionsResource):
         return employee_service.register_employee(get_jwt_identity(), **api.payload), 201
 
 
+@api.route('/import')
+class EmployeeImport(OptionsResource):
+    @api.doc('import_employees', security='apikey')
+    @api.expect(import_parser, validate=True)
+    @api.marshal_with(employee_import_result, code=201)
+    @api.response(400, description="Cannot get or parse file from request")
+    @api.response(403, description="Non-admins can not import employees")
+    @api.response(409, description="Employees were changed during the import")
+    @api.response(413, description="Too many employees in the file (bigger files are imported with the CLI)")
+    @api.response(503, description="Too many logins at the moment, the import is not started")
+    @db_timeouts("bulk")
+    @jwt_required
+    def post(self):
+        """Register many employees from a file at a time (only for admins)"""
+        file: FileStorage = request.files.get('file')
+        data_format = request.args.get('format') or path.splitext(file.filename or '')[1].lstrip('.').lower()
+        if data_format not in ("csv", "ndjson", "jsonl"):
+            abort(400, "Can not detect the format of the file, specify it with the 'format' parameter")
+        try:
+            return employee_service.import_employees_file(get_jwt_identity(), file.stream, data_format), 201
+        except employee_service.ImportConflict:
+            abort(409, "Some of the employees were added or changed during the import, please retry it")
+
+
 @api.route('/auth')
 class Auth(OptionsResource):
     @api.doc('employee_auth')
     @api.marshal_with(token, code=200)
     @api.expect(auth, validate=True)
     @api.response(401, description="Invalid credentials")
+    @api.response(503, description="Too many logins at the moment")
     def post(self):
         """Log into an account"""
         return employee_service.get_token(**api.payload), 200
@@ -106,12 +154,7 @@ class AuthRefresh(OptionsResource):
     @jwt_refresh_token_required
     def post(self):
         """Refresh pair of tokens"""
-        identity = get_jwt_identity()
-        return {
-               'access_token': create_access_token(identity=identity),
-               'refresh_token': create_refresh_token(identity=identity),
-               'user_id': identity
-        }, 200
+        return employee_service.refresh_tokens(get_jwt_identity()), 200
 
 
 @api.route('/fired')
@@ -1,61 +1,76 @@
-from datetime import date
-
 from flask_restx.namespace import Namespace
 from flask import request, abort
 from flask_jwt_extended import jwt_required
 
-from services import post_service, get_page, get_uuid
-from .utils import OptionsResource
+from services import post_service, get_page_or_cursor, get_uuid
+from .utils import OptionsResource, conditional, serialized, get_date, db_timeouts
 from apis.post_api import counted_posts_list, full_post
-from models import required_query_params, DATETIME_FORMAT
+from models import required_query_params, update_dict, paging_query_params, DATETIME_FORMAT
 from models.post_model import PostType
+from utils.config import MAX_TOP_POSTS_COUNT
 
 
 api = Namespace("feed", "News feed api")
 
 
+def get_include_archived() -> bool:
+    if request.args.get("include_archived", '').lower() == 'true':
+        return True
+    elif request.args.get("include_archived", '').lower() == 'false':
+        return False
+    return abort(422, "Incorrect 'include_archived' parameter")
+
+
 @api.route('/news/organization')
 class OrgNews(OptionsResource):
-    @api.doc("get_org_news", security='apikey', params=required_query_params({'page': 'page number'}))
-    @api.marshal_with(counted_posts_list, code=200)
+    @api.doc("get_org_news", security='apikey', params=paging_query_params)
+    @conditional(lambda: post_service.get_posts_etag(request.full_path))
+    @serialized(counted_posts_list)
     @jwt_required
     def get(self):
         """Get news feed of all organization"""
-        return post_service.get_feed(PostType.organization_news, get_page(request)), 200
+        page, cursor = get_page_or_cursor(request)
+        return post_service.get_feed(PostType.organization_news, page, cursor=cursor), 200
 
 
 @api.route('/news/subunit')
 class SubunitNews(OptionsResource):
-    @api.doc("get_subunit_news", security='apikey', params=required_query_params(
-        {'page': 'page number', "id": "ID of the subunit"}
+    @api.doc("get_subunit_news", security='apikey', params=update_dict(
+        paging_query_params, required_query_params({"id": "ID of the subunit"})
     ))
-    @api.marshal_with(counted_posts_list, code=200)
+    @conditional(lambda: post_service.get_posts_etag(request.full_path))
+    @serialized(counted_posts_list)
     @jwt_required
     def get(self):
         """Get news feed of the subunit"""
-        return post_service.get_feed(PostType.subunit_news, get_page(request), get_uuid(request)), 200
+        page, cursor = get_page_or_cursor(request)
+        return post_service.get_feed(PostType.subunit_news, page, get_uuid(request), cursor), 200
 
 
 @api.route('/announcements/organization')
 class OrgAnnouncements(OptionsResource):
-    @api.doc("get_org_announcements", security='apikey', params=required_query_params({'page': 'page number'}))
-    @api.marshal_with(counted_posts_list, code=200)
+    @api.doc("get_org_announcements", security='apikey', params=paging_query_params)
+    @conditional(lambda: post_service.get_posts_etag(request.full_path))
+    @serialized(counted_posts_list)
     @jwt_required
     def get(self):
         """Get announcements feed of all organization"""
-        return post_service.get_feed(PostType.organization_announcement, get_page(request)), 200
+        page, cursor = get_page_or_cursor(request)
+        return post_service.get_feed(PostType.organization_announcement, page, cursor=cursor), 200
 
 
 @api.route('/announcements/subunit')
 class SubunitAnnouncements(OptionsResource):
-    @api.doc("get_subunit_announcements", security='apikey', params=required_query_params(
-        {'page': 'page number', "id": "ID of the subunit"}
+    @api.doc("get_subunit_announcements", security='apikey', params=update_dict(
+        paging_query_params, required_query_params({"id": "ID of the subunit"})
     ))
-    @api.marshal_with(counted_posts_list, code=200)
+    @conditional(lambda: post_service.get_posts_etag(request.full_path))
+    @serialized(counted_posts_list)
     @jwt_required
     def get(self):
         """Get announcements feed of the subunit"""
-        return post_service.get_feed(PostType.subunit_announcement, get_page(request), get_uuid(request)), 200
+        page, cursor = get_page_or_cursor(request)
+        return post_service.get_feed(PostType.subunit_announcement, page, get_uuid(request), cursor), 200
 
 
 @api.route('/biggest')
@@ -67,17 +82,28 @@ class BiggestPost(OptionsResource):
     @api.marshal_with(full_post, code=200)
     @api.response(404, description="Post not found")
     @api.response(422, description="Can not parse parameters")
+    @db_timeouts("report")
     @jwt_required
     def get(self):
         """Get biggest post by date"""
-        try:
-            day = date.fromisoformat(request.args.get("day", ''))
-        except ValueError:
-            return abort(422, "Incorrect date format")
-        if request.args.get("include_archived", '').lower() == 'true':
-            include_archived = True
-        elif request.args.get("include_archived", '').lower() == 'false':
-            include_archived = False
-        else:
-            return abort(422, "Incorrect 'include_archived' parameter")
-        return post_service.get_biggest_post(day, include_archived), 200
+        return post_service.get_biggest_post(get_date("day"), get_include_archived()), 200
+
+
+@api.route('/biggest/top')
+class BiggestPosts(OptionsResource):
+    @api.doc("get_biggest_posts", security='apikey', params=required_query_params({
+        "start": f"First day of the range in '{DATETIME_FORMAT}' format (example: '2020-12-01')",
+        "end": f"Last day of the range in '{DATETIME_FORMAT}' format (example: '2020-12-31')",
+        "include_archived": {'description': "Search in archived posts or not", "enum": ['true', 'false']},
+        "count": f"Count of posts to return (from 1 to {MAX_TOP_POSTS_COUNT})"
+    }))
+    @api.marshal_with(full_post, code=200, as_list=True)
+    @api.response(422, description="Can not parse parameters")
+    @db_timeouts("report")
+    @jwt_required
+    def get(self):
+        """Get the biggest posts published in the range of days (biggest first)"""
+        count = request.args.get("count", '')
+        if not count.isdigit():
+            abort(422, "Count must be integer")
+        return post_service.get_biggest_posts(get_date("start"), get_date("end"), get_include_archived(), int(count)), 200
@@ -0,0 +1,19 @@
+from flask_restx.namespace import Namespace
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from services import metrics_service
+from .utils import OptionsResource
+
+
+api = Namespace("metrics", "Metrics of the server")
+
+
+@api.route('/db')
+class DbPoolMetrics(OptionsResource):
+    @api.doc("get_db_pool_metrics", security='apikey')
+    @api.response(200, description="Success (the metrics are of the server process that handled the request)")
+    @api.response(403, description="Non-admins can not get metrics")
+    @jwt_required
+    def get(self):
+        """Get checkout wait times, saturation and churn of the database connection pool (only for admins)"""
+        return metrics_service.get_db_pool_metrics(get_jwt_identity()), 200
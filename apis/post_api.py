@@ -1,12 +1,17 @@
+from enum import Enum
+from typing import Set, Type
+
 from flask_restx.namespace import Namespace
 from flask_restx import fields
 from flask import request, abort
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
-from services import post_service, get_uuid, get_page
-from .utils import OptionsResource
-from models import pages_count_model, required_query_params, update_dict, query_param_to_set
-from models.post_model import PostCreateModel, PostFullModel, PostStatus, PostEditModel
+from services import post_service, get_uuid, get_page_or_cursor, decode_rank_cursor
+from .utils import OptionsResource, conditional, serialized, get_date, ndjson_response, db_timeouts
+from models import (pages_count_model, next_cursor_model, paging_query_params,
+                    required_query_params, update_dict, query_param_to_set, DATETIME_FORMAT)
+from models.post_model import (PostCreateModel, PostFullModel, PostStatus, PostType, PostEditModel,
+                               PostSearchResultModel, PostsStatusBatchModel, PostStatusOutcomeModel)
 
 
 api = Namespace("post", "Endpoints for news posts")
@@ -33,7 +38,44 @@ counted_posts_list = api.model(
             fields.List(
                 fields.Nested(full_post)
             ),
-        "pages_count": pages_count_model
+        "pages_count": pages_count_model,
+        "next_cursor": next_cursor_model
+    }
+)
+
+post_search_result = api.model(
+    "post_search_result_model",
+    PostSearchResultModel()
+)
+
+post_search_results = api.model(
+    'list_of_post_search_results',
+    {
+        "posts":
+            fields.List(
+                fields.Nested(post_search_result)
+            ),
+        "next_cursor": next_cursor_model,
+        "total": fields.Integer(
+            required=False,
+            description="Count of all the results (approximate for 'estimate'), null unless asked with 'total'",
+            example=42
+        )
+    }
+)
+
+posts_status_batch = api.model(
+    "posts_status_batch_model",
+    PostsStatusBatchModel()
+)
+
+posts_status_outcomes = api.model(
+    "list_of_post_status_outcomes",
+    {
+        "results":
+            fields.List(
+                fields.Nested(api.model("post_status_outcome_model", PostStatusOutcomeModel()))
+            )
     }
 )
 
@@ -46,6 +88,16 @@ posts_statistics = api.model(
 )
 
 
+def get_enum_set(param_name: str, enum: Type[Enum], value_name: str) -> Set[Enum]:
+    result = set()
+    for value in query_param_to_set(param_name):
+        try:
+            result.add(enum[value])
+        except KeyError:
+            abort(422, f"Incorrect {value_name} value '{value}'")
+    return result
+
+
 @api.route('')
 class Post(OptionsResource):
     @api.doc("create_post", security='apikey')
@@ -69,7 +121,8 @@ class Post(OptionsResource):
         return post_service.edit_post(get_jwt_identity(), get_uuid(request), **api.payload), 201
 
     @api.doc("get_post", security='apikey', params=required_query_params({"id": "Post ID"}))
-    @api.marshal_with(full_post, code=200)
+    @conditional(lambda: post_service.get_post_etag(get_uuid(request)))
+    @serialized(full_post)
     @api.response(404, description="Post not found")
     @jwt_required
     def get(self):
@@ -144,12 +197,13 @@ class ArchivePost(OptionsResource):
         """Archive a post (only for moderators and admins)"""
         return post_service.set_post_status(get_jwt_identity(), get_uuid(request), PostStatus.archived), 201
 
-    @api.doc("get_archived_posts", security='apikey', params=required_query_params({'page': 'page number'}))
-    @api.marshal_with(counted_posts_list, code=200)
+    @api.doc("get_archived_posts", security='apikey', params=paging_query_params)
+    @conditional(lambda: post_service.get_posts_etag(request.full_path))
+    @serialized(counted_posts_list)
     @jwt_required
     def get(self):
         """Get archived posts"""
-        return post_service.get_archived_posts(get_page(request)), 200
+        return post_service.get_archived_posts(*get_page_or_cursor(request)), 200
 
     @api.doc("unarchive_post", security='apikey', params=required_query_params({
         "id": "Post ID",
@@ -192,10 +246,14 @@ class PostStat(OptionsResource):
         "start_month": "Month to start from",
         "end_year": "Year to finish with",
         "end_month": "Month to finish with"
-    }), {"ids": "SubUnit IDs, separated by commas"}))
+    }), {
+        "ids": "SubUnit IDs, separated by commas",
+        "by_type": {'description': "Break down counts of each month by post types", "enum": ['true', 'false']}
+    }))
     @api.response(code=200, description="Success", model=posts_statistics)
     @api.response(code=400, description="Incorrect (non-integer) date parameters")
     @api.response(code=422, description="Invalid date given")
+    @db_timeouts("report")
     @jwt_required
     def get(self):
         """Get statistics of posts of the each subunit"""
@@ -211,13 +269,14 @@ class PostStat(OptionsResource):
             start_month,
             end_year,
             end_month,
-        )), subunit_ids=[get_uuid(e_id) for e_id in ids_raw] if ids_raw and all(ids_raw) else None), 200
+        )), subunit_ids=[get_uuid(e_id) for e_id in ids_raw] if ids_raw and all(ids_raw) else None,
+            by_type=(request.args.get('by_type', 'false') == 'true')), 200
 
 
 @api.route('/moderation')
 class PostModeration(OptionsResource):
     @api.doc("get_posts_moderation", security='apikey', params={
-        'page': {"description": 'page number', "required": True},
+        **paging_query_params,
         'statuses': {
             "description":
                 f"Post statuses to return, separated with commas (allowed values: {[status.name for status in PostStatus]})",
@@ -231,17 +290,100 @@ class PostModeration(OptionsResource):
     @jwt_required
     def get(self):
         """Get posts of given types and statuses by given subunit or whole organization (only for admins and moderators)"""
-        statuses_raw = query_param_to_set("statuses")
-        statuses = set()
-        for status in statuses_raw:
-            if status:
-                try:
-                    statuses.add(PostStatus[status])
-                except KeyError:
-                    abort(422, f"Incorrect status value '{status}'")
+        statuses = get_enum_set("statuses", PostStatus, "status")
+        page, cursor = get_page_or_cursor(request)
         return post_service.get_all_posts(
             get_jwt_identity(),
-            get_page(request),
+            page,
             statuses,
-            reverse=(request.args.get('reverse', 'true') == 'true')
+            reverse=(request.args.get('reverse', 'true') == 'true'),
+            cursor=cursor
+        ), 200
+
+
+@api.route('/search')
+class PostSearch(OptionsResource):
+    @api.doc("search_posts", security='apikey', params=update_dict(required_query_params({
+        "q": "Words to search for in titles and bodies of posts (each word also matches as a prefix)"
+    }), {
+        "types": f"Post types, separated with commas (allowed values: {[p_type.name for p_type in PostType]})",
+        "statuses":
+            f"Post statuses, separated with commas (allowed values: {[status.name for status in PostStatus]}), "
+            f"'{PostStatus.posted.name}' by default. Only moderators and admins can search posts "
+            f"of statuses other than '{PostStatus.posted.name}' and '{PostStatus.archived.name}'",
+        "id": "ID of the subunit of posts authors",
+        "start": f"First day of creation of posts in '{DATETIME_FORMAT}' format (example: '2020-12-01')",
+        "end": f"Last day of creation of posts in '{DATETIME_FORMAT}' format (example: '2020-12-31')",
+        "cursor": "cursor of the page (the 'next_cursor' field of the previous page)",
+        "total": "'exact' to count all the results, 'estimate' for a cheap approximate count by the planner"
+    }))
+    @serialized(post_search_results)
+    @api.response(code=403, description="Have no privileges to search posts of given statuses")
+    @api.response(code=422, description="Incorrect query, type, status, date or total value")
+    @jwt_required
+    def get(self):
+        """Search posts by words in their titles and bodies (the most relevant first)"""
+        cursor = request.args.get("cursor")
+        return post_service.search_posts(
+            get_jwt_identity(),
+            request.args.get("q", ''),
+            get_enum_set("types", PostType, "type"),
+            get_enum_set("statuses", PostStatus, "status"),
+            get_uuid(request, allow_empty=True) or None,
+            get_date("start", required=False),
+            get_date("end", required=False),
+            decode_rank_cursor(cursor) if cursor else None,
+            request.args.get("total") or None
         ), 200
+
+
+@api.route('/moderation/batch')
+class PostModerationBatch(OptionsResource):
+    @api.doc("set_posts_status", security='apikey')
+    @api.marshal_with(posts_status_outcomes, code=201)
+    @api.response(code=403, description="Have no privileges to change post statuses")
+    @api.response(code=422, description="Too many or no posts given")
+    @api.expect(posts_status_batch, validate=True)
+    @jwt_required
+    def post(self):
+        """Change status of many posts at once (only for moderators and admins)"""
+        return post_service.set_posts_status(
+            get_jwt_identity(), api.payload["ids"], PostStatus[api.payload["status"]]
+        ), 201
+
+
+@api.route('/export')
+class PostExport(OptionsResource):
+    @api.doc("export_posts", security='apikey', params={
+        "statuses":
+            f"Post statuses, separated with commas (allowed values: {[status.name for status in PostStatus]}), "
+            f"all statuses by default",
+        "id": "ID of the subunit of posts authors",
+        "start": f"First day of creation of posts in '{DATETIME_FORMAT}' format (example: '2020-12-01')",
+        "end": f"Last day of creation of posts in '{DATETIME_FORMAT}' format (example: '2020-12-31')",
+        "after": "ID of the last post received before the export was interrupted (to continue the export)",
+        "embed": {'description': "Embed authors and attachments instead of their IDs", "enum": ['true', 'false']},
+        "gzip": {'description': "Compress the export with gzip", "enum": ['true', 'false']}
+    })
+    @api.response(code=200, description="Success (response is a stream of posts as lines of JSON, the oldest first)")
+    @api.response(code=403, description="Non-admins can not export posts")
+    @api.response(code=404, description="Post to continue the export after is not found")
+    @api.response(code=422, description="Incorrect status or date value")
+    @db_timeouts("bulk")
+    @jwt_required
+    def get(self):
+        """Export posts (including archived ones) as an NDJSON file (only for admins)"""
+        after = request.args.get("after")
+        return ndjson_response(
+            post_service.get_posts_export(
+                get_jwt_identity(),
+                get_enum_set("statuses", PostStatus, "status"),
+                get_uuid(request, allow_empty=True) or None,
+                get_date("start", required=False),
+                get_date("end", required=False),
+                get_uuid(after) if after else None,
+                request.args.get("embed", 'false') == 'true'
+            ),
+            "posts.ndjson",
+            compress=(request.args.get("gzip", 'false') == 'true')
+        )
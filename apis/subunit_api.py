@@ -3,7 +3,7 @@ from flask import request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from services import subunit_service, get_uuid
-from .utils import OptionsResource
+from .utils import OptionsResource, conditional
 from models import required_query_params, update_dict
 from apis.employee_api import full_employee
 from models.subunit_model import CommonSubunitModel, SubunitEditModel, FullSubunitModel, fields
@@ -35,6 +35,7 @@ full_subunit = api.model(
 @api.route('')
 class Subunit(OptionsResource):
     @api.doc('get_subunit', security='apikey', params=required_query_params({'id': 'SubUnit ID'}))
+    @conditional(lambda: subunit_service.get_subunit_etag(get_uuid(request)))
     @api.marshal_with(full_subunit, code=200)
     @api.response(404, description="SubUnit not found")
     @jwt_required
@@ -1,5 +1,17 @@
-from flask_restx import Resource
+from functools import wraps
+from datetime import date
+from typing import Callable, Iterable
+
+from flask import request, current_app, abort, Response, stream_with_context, g
+from flask_restx import Resource, marshal
+from flask_restx.model import Model
+from flask_restx.utils import unpack
 from flask_restx.namespace import Namespace
+from flask_jwt_extended import verify_jwt_in_request, verify_jwt_in_request_optional, get_jwt_identity
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+from utils.serializer import dumps, ndjson_chunks, gzip_chunks
 
 
 api = Namespace("")
@@ -9,3 +21,106 @@ class OptionsResource(Resource):
     @api.hide
     def options(self):
         return None, 200
+
+
+def get_date(param_name: str, required: bool = True) -> date or None:
+    if not required and not request.args.get(param_name):
+        return None
+    try:
+        return date.fromisoformat(request.args.get(param_name, ''))
+    except ValueError:
+        return abort(422, f"Incorrect '{param_name}' date format")
+
+
+def get_optional_jwt_identity() -> str or None:
+    """Identity of the access token of the request, None if there is no valid one (endpoints report token errors)"""
+    try:
+        verify_jwt_in_request_optional()
+    except (JWTExtendedException, PyJWTError):
+        return None
+    return get_jwt_identity()
+
+
+def conditional(etag_getter: Callable[[], str or None]):
+    """
+    Adds an ETag to the response of the endpoint and answers '304 Not Modified'
+    (without calling the endpoint at all) if the client already has the same version of the resource
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            etag = etag_getter()
+            if etag and request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+            result = func(*args, **kwargs)
+            if not etag:
+                return result
+            if isinstance(result, Response):
+                result.set_etag(etag)
+                return result
+            data, code, headers = unpack(result)
+            headers = dict(headers or {})
+            headers["ETag"] = f'"{etag}"'
+            return data, code, headers
+        return wrapper
+    return decorator
+
+
+def db_timeouts(endpoint_class: str):
+    """
+    Makes transactions of the endpoint use the statement and lock timeouts of the class from 'DB_TIMEOUTS' config
+    (must be placed above the decorators that may query the database, like 'conditional')
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            g.db_timeouts_class = endpoint_class
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def json_response(data, code: int = 200, headers: dict = None) -> Response:
+    """Encodes the data like the restx JSON representation does, with the encoder set by 'JSON_ENCODER' config"""
+    settings = dict(current_app.config.get("RESTX_JSON", {}))
+    if current_app.debug:
+        settings.setdefault("indent", 4)
+    body = dumps(data, settings, current_app.config.get("JSON_ENCODER", "json"))
+    return Response(body, code, headers, mimetype="application/json")
+
+
+def ndjson_response(items: Iterable, filename: str, compress: bool = False) -> Response:
+    """
+    Streams the items as an NDJSON (or gzipped NDJSON) file while they are produced;
+    the request context (and its DB session) lives until the stream is finished
+    """
+    chunks = ndjson_chunks(items, current_app.config.get("JSON_ENCODER", "json"))
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+    response = Response(
+        stream_with_context(chunks), mimetype="application/gzip" if compress else "application/x-ndjson"
+    )
+    response.headers.set("Content-Disposition", "attachment", filename=filename)
+    return response
+
+
+def serialized(model: Model, code: int = 200):
+    """
+    Replacement of 'marshal_with' for endpoints that return data already serialized by the model
+    (see utils.serializer): the model is only documented and applied if the client asks for a fields mask
+    """
+    def decorator(func):
+        @api.response(code, "Success", model)
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            data, status, headers = unpack(func(*args, **kwargs))
+            mask = request.headers.get(current_app.config.get("RESTX_MASK_HEADER", "X-Fields"))
+            if mask:
+                data = marshal(data, model, mask=mask)
+            return json_response(data, status, headers)
+        return wrapper
+    return decorator
@@ -0,0 +1,13 @@
+from flask import Flask
+
+from .attachment_commands import bind_attachment_commands
+from .employee_commands import bind_employee_commands
+from .job_commands import bind_job_commands
+from .post_commands import bind_post_commands
+
+
+def bind_commands(app: Flask):
+    bind_attachment_commands(app)
+    bind_employee_commands(app)
+    bind_job_commands(app)
+    bind_post_commands(app)
@@ -0,0 +1,30 @@
+import click
+from flask import Flask
+
+from services import attachment_service
+
+
+def bind_attachment_commands(app: Flask):
+    @app.cli.command("backfill-attachments")
+    @click.option("--batch-size", default=256, show_default=True, help="Attachments to process per transaction")
+    def backfill_attachments(batch_size: int):
+        """Store filename, content type, size and checksum of already uploaded attachments in DB"""
+        result = attachment_service.backfill_attachments_metadata(batch_size)
+        click.echo(f"Filled: {result['filled']}, files not found: {result['missing']}")
+        click.echo("Run 'recalculate-post-sizes' to take the filled sizes into account")
+
+    @app.cli.command("migrate-attachments-to-blobs")
+    @click.option("--batch-size", default=256, show_default=True, help="Attachments to select per query")
+    @click.option("--pause", default=0.0, show_default=True, help="Seconds to sleep between batches")
+    @click.option("--checkpoint", default=None, help="File to keep the progress in (in UPLOAD_FOLDER by default)")
+    @click.option("--restart", is_flag=True, help="Ignore the saved progress and check all attachments again")
+    def migrate_attachments_to_blobs(batch_size: int, pause: float, checkpoint: str, restart: bool):
+        """Move files of attachments from the legacy directories tree to the content-addressed blob store"""
+        result = attachment_service.migrate_attachments_to_blobs(batch_size, pause, checkpoint, restart)
+        click.echo(f"Migrated: {result['migrated']}, files not found: {result['missing']}")
+
+    @app.cli.command("sweep-blobs")
+    @click.option("--batch-size", default=256, show_default=True, help="Blobs to remove per transaction")
+    def sweep_blobs(batch_size: int):
+        """Remove blobs that are not referenced by any attachment"""
+        click.echo(f"Removed blobs: {attachment_service.sweep_unreferenced_blobs(batch_size)}")
@@ -0,0 +1,25 @@
+from os import path
+
+import click
+from flask import Flask
+
+from services import employee_service
+
+
+def bind_employee_commands(app: Flask):
+    @app.cli.command("import-employees")
+    @click.argument("file", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "data_format", type=click.Choice(["csv", "ndjson"]), default=None,
+                  help="Format of the file (taken from the file extension by default)")
+    def import_employees(file: str, data_format: str):
+        """Register employees from a CSV file with a header or an NDJSON file"""
+        data_format = data_format or ("csv" if path.splitext(file)[1].lower() == ".csv" else "ndjson")
+        with open(file, 'r', encoding='utf-8-sig', newline='') as data:
+            rows = employee_service.parse_import_rows(data.read(), data_format)
+        try:
+            result = employee_service.import_employees(rows)
+        except employee_service.ImportConflict:
+            raise click.ClickException("Some of the employees were added or changed during the import, please retry it")
+        for error in result["errors"]:
+            click.echo(f"Row {error['row']} ({error['email'] or 'no email'}): {error['error']}", err=True)
+        click.echo(f"Imported: {result['imported']}, rejected: {len(result['errors'])}")
@@ -0,0 +1,26 @@
+import click
+from flask import Flask
+
+from services import job_service
+
+
+def bind_job_commands(app: Flask):
+    @app.cli.command("jobs-stats")
+    def jobs_stats():
+        """Show counts of background jobs by name and status, and how late the queued ones are"""
+        stats = job_service.get_jobs_stats()
+        if not stats:
+            click.echo("There are no jobs")
+        for row in stats:
+            lag = f", lag {row['lag']:.0f} s" if row["lag"] is not None else ""
+            click.echo(f"{row['name']}: {row['count']} {row['status']}{lag}")
+
+    @app.cli.command("enqueue-job")
+    @click.argument("name")
+    def enqueue_job(name: str):
+        """Add a job (without arguments) to the queue to be run by worker.py"""
+        try:
+            job_service.enqueue(name)
+        except LookupError as error:
+            raise click.BadParameter(str(error), param_hint="NAME")
+        click.echo(f"Job {name} is enqueued")
@@ -0,0 +1,78 @@
+import gzip
+
+import click
+from flask import Flask
+
+from repositories import post_repository
+from services import post_service
+from models.post_model import PostStatus
+from utils.serializer import dumps
+
+
+def bind_post_commands(app: Flask):
+    @app.cli.command("recalculate-post-sizes")
+    def recalculate_post_sizes():
+        """Recalculate the stored size of every post (title, body and attachments)"""
+        post_repository.update_posts_size()
+        click.echo("Post sizes are recalculated")
+
+    @app.cli.command("rebuild-counters")
+    def rebuild_counters():
+        """Recount posts and attachments counters that are used for pages counts"""
+        post_repository.rebuild_counters()
+        click.echo("Counters are rebuilt")
+
+    @app.cli.command("rebuild-post-stats")
+    def rebuild_post_stats():
+        """Rebuild the monthly posts statistics rollup from posts"""
+        post_repository.rebuild_post_stats()
+        click.echo("Monthly posts statistics are rebuilt")
+
+    @app.cli.command("rebuild-search-vectors")
+    def rebuild_search_vectors():
+        """Recalculate the full-text search vectors of all posts"""
+        post_repository.rebuild_search_vectors()
+        click.echo("Search vectors are rebuilt")
+
+    @app.cli.command("archive-expired-posts")
+    @click.option("--batch-size", default=500, show_default=True, help="Posts to archive per transaction")
+    def archive_expired_posts(batch_size: int):
+        """Archive posts with expired archivation date (unless it is already running elsewhere)"""
+        result = post_service.archive_expired_posts(batch_size)
+        if result is None:
+            click.echo("Archivation is already running in another process")
+        else:
+            click.echo(f"Archived: {result['archived']} in {result['batches']} batches, {result['seconds']} s")
+
+    @app.cli.command("export-posts")
+    @click.argument("output", type=click.Path(dir_okay=False))
+    @click.option("--statuses", default="", help="Post statuses separated with commas (all statuses by default)")
+    @click.option("--subunit", default=None, help="ID of the subunit of posts authors")
+    @click.option("--start", type=click.DateTime(["%Y-%m-%d"]), default=None, help="First day of creation of posts")
+    @click.option("--end", type=click.DateTime(["%Y-%m-%d"]), default=None, help="Last day of creation of posts")
+    @click.option("--after", default=None, help="ID of the last exported post (appends to the output to continue)")
+    @click.option("--embed", is_flag=True, help="Embed authors and attachments instead of their IDs")
+    def export_posts(output: str, statuses: str, subunit: str, start, end, after: str, embed: bool):
+        """Export posts as NDJSON (gzipped if the output name ends with '.gz'), the oldest first"""
+        try:
+            post_statuses = {PostStatus[status] for status in statuses.split(',') if status}
+        except KeyError as error:
+            raise click.BadParameter(f"Incorrect status {error}", param_hint="--statuses")
+        posts = post_service.export_posts(
+            post_statuses, subunit, start and start.date(), end and end.date(), after, embed
+        )
+        exported, last_id = 0, after
+        opener = gzip.open if output.endswith(".gz") else open
+        # a gzip file is closed properly even if the export fails, so the next part can be appended to it
+        with opener(output, 'at' if after else 'wt', encoding='utf-8') as file:
+            try:
+                for post in posts:
+                    file.write(dumps(post, {}))
+                    exported += 1
+                    last_id = post["id"]
+            except BaseException:
+                click.echo(f"Export is interrupted after {exported} posts", err=True)
+                if last_id:
+                    click.echo(f"Run it again with '--after {last_id}' to continue", err=True)
+                raise
+        click.echo(f"Exported: {exported}")
@@ -0,0 +1,267 @@
+"""
+Server-sent events of posts that appear in or leave the feed, for clients that would otherwise poll it.
+Events are raised by public.posts_notify_events (see sql/orgfeed_db.sql) with NOTIFY, so they are sent only
+after the changes are committed. One asyncio process holds all the idle streams and a single LISTEN connection,
+so it must connect to PostgreSQL directly: LISTEN does not work through PgBouncer in transaction mode.
+
+    GET /api/v1/events/posts?types=organization_news,subunit_news&subunit=<ID>
+    Authorization: Bearer <access token> (or the 'token' query parameter, EventSource can not set headers)
+
+Every event is 'event: <published|edited|archived|removed|resync>' with 'data: {"id", "type", "subunit"}'.
+'resync' (without data) is sent when events may have been lost, clients should reload the feed then
+"""
+import os
+import json
+import signal
+import asyncio
+import logging
+import resource
+from time import time
+from typing import Dict, Set, Tuple
+from urllib.parse import urlsplit, parse_qs
+from uuid import UUID
+
+import jwt
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from models.post_enums import PostType
+from utils.config import (EVENTS_KEEPALIVE_INTERVAL, EVENTS_MAX_CLIENTS, EVENTS_CLIENT_QUEUE_SIZE,
+                          EVENTS_RECONNECT_DELAY, EVENTS_REQUEST_TIMEOUT)
+
+
+EVENTS_PATH = "/api/v1/events/posts"
+CHANNEL = "post_events"
+
+logger = logging.getLogger("events_server")
+
+
+class Subscriber:
+    def __init__(self, post_types: Set[int] or None, subunit_id: str or None, expires_at: float):
+        self.post_types = post_types
+        self.subunit_id = subunit_id
+        self.expires_at = expires_at
+        self.queue = asyncio.Queue(EVENTS_CLIENT_QUEUE_SIZE)
+
+    def matches(self, event: dict) -> bool:
+        if self.post_types is not None and event["type"] not in self.post_types:
+            return False
+        return self.subunit_id is None or event["subunit"] == self.subunit_id
+
+    def send(self, message: bytes or None) -> None:
+        """Queues the message (None ends the stream), a client that can not keep up gets 'resync' and is disconnected"""
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+            return
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(sse_message("resync"))
+        self.queue.put_nowait(None)
+
+
+subscribers: Set[Subscriber] = set()
+
+
+def sse_message(event: str, data: dict = None) -> bytes:
+    message = f"event: {event}\n"
+    if data is not None:
+        message += f"data: {json.dumps(data)}\n"
+    return (message + "\n").encode()
+
+
+def broadcast(event: dict) -> None:
+    message = sse_message(event["event"], {
+        "id": event["id"],
+        "type": PostType(event["type"]).name,
+        "subunit": event["subunit"]
+    })
+    for subscriber in subscribers:
+        if subscriber.matches(event):
+            subscriber.send(message)
+
+
+class Listener:
+    """Keeps the LISTEN connection and broadcasts its notifications, reconnecting when the connection is lost"""
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.connection = None
+
+    def connect(self) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            self.connection = psycopg2.connect(self.dsn)
+            self.connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+        except psycopg2.Error as e:
+            logger.warning(
+                "Can not listen to PostgreSQL (%s), retrying in %s s", str(e).strip(), EVENTS_RECONNECT_DELAY
+            )
+            self.close()
+            loop.call_later(EVENTS_RECONNECT_DELAY, self.connect)
+            return
+        loop.add_reader(self.connection.fileno(), self.receive)
+        logger.info("Listening to '%s'", CHANNEL)
+        # anything could have happened while the connection was lost
+        for subscriber in subscribers:
+            subscriber.send(sse_message("resync"))
+
+    def receive(self) -> None:
+        try:
+            self.connection.poll()
+        except psycopg2.Error as e:
+            logger.warning("Lost the PostgreSQL connection (%s)", str(e).strip())
+            asyncio.get_event_loop().remove_reader(self.connection.fileno())
+            self.close()
+            self.connect()
+            return
+        while self.connection.notifies:
+            notification = self.connection.notifies.pop(0)
+            try:
+                broadcast(json.loads(notification.payload))
+            except (ValueError, KeyError) as e:
+                logger.warning("Incorrect notification %r: %s", notification.payload, e)
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def http_response(writer: asyncio.StreamWriter, status: str, body: str) -> None:
+    writer.write((
+        f"HTTP/1.1 {status}\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Length: {len(body.encode())}\r\n"
+        f"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n{body}"
+    ).encode())
+
+
+async def read_request(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str]]:
+    request_line = (await reader.readline()).decode("latin-1").split()
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if len(request_line) != 3:
+        raise ValueError("Incorrect request line")
+    return request_line[0], request_line[1], headers
+
+
+def get_subscriber(target: str, headers: Dict[str, str]) -> Subscriber:
+    """Checks the token and parses the filters of the request, raises PermissionError or ValueError"""
+    query = parse_qs(urlsplit(target).query)
+    token = query.get("token", [''])[0]
+    if headers.get("authorization", '').startswith("Bearer "):
+        token = headers["authorization"][len("Bearer "):]
+    try:
+        claims = jwt.decode(token, os.environ["JWT_KEY"], algorithms=["HS256"])
+    except jwt.PyJWTError:
+        raise PermissionError("Missing, invalid or expired access token")
+    if claims.get("type") != "access":
+        raise PermissionError("Only access tokens are allowed")
+    post_types = None
+    if query.get("types", [''])[0]:
+        try:
+            post_types = {PostType[name].value for name in query["types"][0].split(',')}
+        except KeyError:
+            raise ValueError(f"Incorrect post type (allowed values: {[post_type.name for post_type in PostType]})")
+    subunit_id = query.get("subunit", [''])[0] or None
+    if subunit_id:
+        subunit_id = str(UUID(subunit_id))
+    return Subscriber(post_types, subunit_id, claims.get("exp", float("inf")))
+
+
+async def stream_events(writer: asyncio.StreamWriter, subscriber: Subscriber) -> None:
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+        b"X-Accel-Buffering: no\r\nAccess-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n"
+        b"retry: 5000\n\n"
+    )
+    await writer.drain()
+    while True:
+        timeout = min(EVENTS_KEEPALIVE_INTERVAL, subscriber.expires_at - time())
+        if timeout <= 0:
+            return  # the client reconnects with a fresh token
+        try:
+            message = await asyncio.wait_for(subscriber.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            message = b": keepalive\n\n"
+        if message is None:
+            return
+        writer.write(message)
+        await writer.drain()
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        try:
+            method, target, headers = await asyncio.wait_for(read_request(reader), EVENTS_REQUEST_TIMEOUT)
+        except (ValueError, asyncio.TimeoutError):
+            http_response(writer, "400 Bad Request", "Incorrect request")
+            return
+        if urlsplit(target).path.rstrip('/') != EVENTS_PATH:
+            http_response(writer, "404 Not Found", "Not found")
+            return
+        if method != "GET":
+            http_response(writer, "405 Method Not Allowed", "Only GET is allowed")
+            return
+        if len(subscribers) >= EVENTS_MAX_CLIENTS:
+            http_response(writer, "503 Service Unavailable", "Too many clients, try again later")
+            return
+        try:
+            subscriber = get_subscriber(target, headers)
+        except PermissionError as e:
+            http_response(writer, "401 Unauthorized", str(e))
+            return
+        except ValueError as e:
+            http_response(writer, "422 Unprocessable Entity", str(e) or "Incorrect subunit ID")
+            return
+        subscribers.add(subscriber)
+        try:
+            await stream_events(writer, subscriber)
+        finally:
+            subscribers.discard(subscriber)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def raise_open_files_limit() -> None:
+    """Every client is an open socket, so the soft limit of open files (often 1024) is raised to the hard one"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def serve(host: str, port: int, dsn: str) -> None:
+    loop = asyncio.get_event_loop()
+    listener = Listener(dsn)
+    listener.connect()
+    server = await asyncio.start_server(handle_client, host, port)
+    stopping = loop.create_future()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, lambda: stopping.done() or stopping.set_result(None))
+    logger.info("Serving events on %s:%s", host, port)
+    await stopping
+    logger.info("Stopping with %s clients", len(subscribers))
+    server.close()
+    for subscriber in subscribers:
+        subscriber.send(None)
+    await server.wait_closed()
+    listener.close()
+
+
+if __name__ == "__main__":
+    if not os.environ.get("JWT_KEY"):
+        raise RuntimeError("Cannot find some env variables related to security")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    raise_open_files_limit()
+    asyncio.run(serve(
+        os.environ.get("EVENTS_HOST", "0.0.0.0"),
+        int(os.environ.get("EVENTS_PORT", 5001)),
+        # must not be PgBouncer (see the module docstring); PGPASSWORD is used by libpq
+        os.environ.get("EVENTS_DB_DSN", "dbname=orgfeed_db user=orgfeed_user")
+    ))
@@ -68,6 +68,19 @@ pages_count_model = fields.Integer(
 )
 
 
+next_cursor_model = fields.String(
+    required=False,
+    description="Cursor of the next page (pass it as the 'cursor' query parameter), null on the last page",
+    example='MjAxOS0wOC0xOFQxMzo0MTowNXxkMWQzZWU0Mi03MzFjLTA0ZDktMGVlZS0xNmQzZTdhNjI5NDg='
+)
+
+
+paging_query_params = {
+    "page": "page number (required if 'cursor' is not given)",
+    "cursor": "cursor of the page (the 'next_cursor' field of the previous page), replaces 'page'"
+}
+
+
 def required_query_params(request_args: Dict[str, str or Dict[str, str]]) -> Dict[str, Dict[str, str or bool]]:
     result = {}
     for item in request_args:
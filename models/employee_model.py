@@ -95,3 +95,17 @@ class TokenModel(ModelCreator):
 
 class EmployeeRegistrationModel(CommonEmployeeModel, PasswordModel):
     pass
+
+
+class EmployeeImportErrorModel(ModelCreator):
+    row = fields.Integer(
+        required=True,
+        description="Number of the row in the file (starting from 1, the CSV header is not counted)",
+        example=1
+    )
+    email = create_email_field(description="Email from the row (if any)")
+    error = fields.String(
+        required=True,
+        description="Why the row was not imported",
+        example="User with this email already exists"
+    )
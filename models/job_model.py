@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class JobStatus(Enum):
+    queued = 0
+    running = 1
+    done = 2
+    failed = 3
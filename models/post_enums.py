@@ -0,0 +1,16 @@
+from enum import Enum
+
+
+class PostType(Enum):
+    organization_news = 0
+    subunit_news = 1
+    organization_announcement = 2
+    subunit_announcement = 3
+
+
+class PostStatus(Enum):
+    under_consideration = 0
+    posted = 1
+    archived = 2
+    returned_for_improvement = 3
+    rejected = 4
@@ -1,25 +1,10 @@
-from enum import Enum
-
 from flask_restx import fields
 
 from apis.attachment_api import attachment
 from apis.employee_api import full_employee
 from . import ModelCreator, create_id_field, create_datetime_field, copy_field
-
-
-class PostType(Enum):
-    organization_news = 0
-    subunit_news = 1
-    organization_announcement = 2
-    subunit_announcement = 3
-
-
-class PostStatus(Enum):
-    under_consideration = 0
-    posted = 1
-    archived = 2
-    returned_for_improvement = 3
-    rejected = 4
+from .post_enums import PostType, PostStatus
+from utils.config import MAX_BATCH_SIZE
 
 
 class AttachmentsListModel(ModelCreator):
@@ -101,3 +86,70 @@ class PostFullModel(PostBaseModel):
         fields.Nested(attachment),
         description="List of an attachments of the post"
     )
+
+
+class PostExportModel(PostFullModel):
+    author = create_id_field(
+        required=True,
+        description="ID of the author of the post"
+    )
+    approved_by = create_id_field(
+        required=False,
+        description="ID of the employee who approved the post"
+    )
+    attachments = fields.List(
+        create_id_field(required=True, description="Attachment ID"),
+        description="IDs of attachments of the post"
+    )
+
+
+class PostSearchResultModel(ModelCreator):
+    id = copy_field(PostFullModel.id)
+    title = copy_field(PostBaseModel.title)
+    post_type = copy_field(PostBaseModel.post_type)
+    status = copy_field(PostFullModel.status)
+    created_on = copy_field(PostFullModel.created_on)
+    published_on = copy_field(PostFullModel.published_on)
+    author = fields.Nested(full_employee)
+    rank = fields.Float(
+        required=True,
+        description="Relevance of the post to the query (the more the better)",
+        example=0.6079271
+    )
+    snippet = fields.String(
+        required=True,
+        description="HTML-escaped fragments of the body with matched words wrapped into <mark> tags",
+        example="The <mark>demo</mark> day is at this friday at 5:00 PM"
+    )
+
+
+class PostsStatusBatchModel(ModelCreator):
+    ids = fields.List(
+        create_id_field(
+            required=True,
+            description="ID of the post to change status of"
+        ),
+        required=True,
+        description=f"IDs of the posts to change status of (up to {MAX_BATCH_SIZE})",
+        min_items=1,
+        max_items=MAX_BATCH_SIZE
+    )
+    status = fields.String(
+        required=True,
+        description="Status to give to the posts",
+        example=PostStatus.posted.name,
+        enum=[p_status.name for p_status in PostStatus]
+    )
+
+
+class PostStatusOutcomeModel(ModelCreator):
+    id = create_id_field(
+        required=True,
+        description="Post ID"
+    )
+    outcome = fields.String(
+        required=True,
+        description="What happened to the post: its status is changed, it already had the status or it does not exist",
+        example="updated",
+        enum=["updated", "unchanged", "not_found"]
+    )
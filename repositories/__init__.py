@@ -1,13 +1,20 @@
 import uuid
+import json
+from random import choice
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 from injector import inject, Injector
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import UUID
+from flask import g, has_app_context, _app_ctx_stack
+from flask_sqlalchemy import SQLAlchemy, BaseQuery, SignallingSession
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR, JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred, scoped_session, sessionmaker, Session
 from sqlalchemy.orm.state import InstanceState
-from sqlalchemy import Column, String, SmallInteger, Boolean, CheckConstraint, ForeignKey, DateTime, Index
+from sqlalchemy import (Column, String, SmallInteger, Integer, BigInteger, Boolean, CheckConstraint,
+                        ForeignKey, DateTime, Date, Index)
+
+from utils.database import replica_bind_keys
 
 
 class DbGetter:
@@ -20,6 +27,43 @@ db = Injector().get(DbGetter).db
 Base = declarative_base()
 
 
+class ReplicaSession(SignallingSession):
+    """Session bound to one of the read replicas (see utils.database.replica_binds), chosen randomly"""
+    def __init__(self, database: SQLAlchemy, **options):
+        replica = choice(replica_bind_keys(database.get_app().config))
+        options.update(bind=database.get_engine(bind=replica), binds={})
+        super().__init__(database, **options)
+
+
+# like db.session, lives till the end of the app context (removed in server.py)
+replica_session = scoped_session(
+    sessionmaker(class_=ReplicaSession, database=db, query_cls=BaseQuery), scopefunc=_app_ctx_stack.__ident_func__
+)
+
+
+def read_session() -> Session:
+    """
+    Session for read-only queries: a replica's one if the request may read from replicas
+    (decided in server.py), the primary's one otherwise. Objects loaded by it must not be changed
+    """
+    if has_app_context() and g.get("read_from_replica"):
+        return replica_session
+    return db.session
+
+
+@contextmanager
+def primary_reads():
+    """Makes read_session return the primary's session inside the block"""
+    read_from_replica = has_app_context() and g.get("read_from_replica", False)
+    if read_from_replica:
+        g.read_from_replica = False
+    try:
+        yield
+    finally:
+        if read_from_replica:
+            g.read_from_replica = True
+
+
 def get_dict(self):
     result = dict(self.__dict__)
     items_to_remove = []
@@ -34,6 +78,19 @@ def get_dict(self):
 Base.get_dict = get_dict
 
 
+def estimate_count(base_request: BaseQuery) -> int:
+    """
+    Row count of the query estimated by the PostgreSQL planner: cheap, but approximate.
+    Opt-in for ad-hoc filters that are not covered by the maintained counters
+    """
+    connection = base_request.session.connection()
+    compiled = base_request.statement.compile(dialect=connection.dialect)
+    plan = connection.execute(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
 class Employee(Base):
     __tablename__ = 'employees'
 
@@ -49,6 +106,10 @@ class Employee(Base):
     subunit = Column(UUID(), ForeignKey('subunits.id', ondelete='NO ACTION'), nullable=False)
     user_type = Column(SmallInteger(), nullable=False, default=0)
     fired = Column(Boolean(), nullable=False, default=False)
+    updated_on = Column(DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # incremented whenever user_type or fired changes, tokens and cached permissions with an older one are stale
+    permission_version = Column(Integer(), nullable=False, default=0)
 
     subunit_ref = relationship("Subunit", back_populates='employees', foreign_keys=subunit)
 
@@ -59,6 +120,7 @@ class Employee(Base):
 
     employees_full_name_subunit_idx = Index('employees_full_name_subunit_idx', full_name, subunit)
     employees_subunit_fired_user_type_idx = Index('employees_subunit_fired_user_type_idx', subunit, fired, user_type)
+    employees_updated_on_idx = Index('employees_updated_on_idx', updated_on)
 
 
 class Subunit(Base):
@@ -75,6 +137,7 @@ class Subunit(Base):
     leader = Column(UUID(), ForeignKey('employees.id', ondelete='NO ACTION'), nullable=False)
     phone = Column(String(), nullable=False)
     email = Column(String(256), nullable=False, unique=True)
+    updated_on = Column(DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     leader_ref = relationship("Employee", back_populates="leader_in_subunit", foreign_keys=leader)
 
@@ -109,14 +172,32 @@ class Post(Base):
     status = Column(SmallInteger(), nullable=False, default=0)
     body = Column(String(81920), nullable=False)
 
+    # size of title, body and all attachments in bytes, kept up to date by post_repository.update_posts_size
+    # (and by attachment_repository.delete_attachment)
+    size = Column(Integer(), nullable=False, default=0)
+    updated_on = Column(DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # weighted words of title and body maintained by a trigger (see sql/orgfeed_db.sql), never loaded by default
+    search_vector = deferred(Column(TSVECTOR(), nullable=True))
+
     approver = relationship("Employee", back_populates="approved_posts", foreign_keys=approved_by)
     creator = relationship("Employee", back_populates="created_posts", foreign_keys=author)
 
     attachments = relationship("Attachment", back_populates='post_ref', primaryjoin="Post.id == Attachment.post")
 
     posts_title_idx = Index("posts_title_idx", title)
+    # posts waiting for archivation (2 is PostStatus.archived)
+    posts_archived_on_idx = Index("posts_archived_on_idx", archived_on, postgresql_where=(status != 2))
     posts_status_author_published_on_created_on_idx =\
         Index("posts_status_author_published_on_created_on_idx", status, author, published_on, created_on)
+    posts_status_type_created_on_id_idx = Index("posts_status_type_created_on_id_idx", status, type, created_on, id)
+    posts_status_created_on_id_idx = Index("posts_status_created_on_id_idx", status, created_on, id)
+    # biggest posts: the planner takes the first one for short periods and the second one for long ones
+    posts_status_published_on_size_idx = Index("posts_status_published_on_size_idx", status, published_on, size)
+    posts_status_size_id_published_on_idx =\
+        Index("posts_status_size_id_published_on_idx", status, size.desc(), id, published_on)
+    posts_updated_on_idx = Index("posts_updated_on_idx", updated_on)
+    posts_search_vector_idx = Index("posts_search_vector_idx", search_vector.columns[0], postgresql_using="gin")
 
 
 class Attachment(Base):
@@ -134,9 +215,84 @@ class Attachment(Base):
     id = Column(UUID(), nullable=False, primary_key=True, default=lambda: str(uuid.uuid4()))
     author = Column(UUID(), ForeignKey('employees.id', ondelete='NO ACTION'), nullable=False)
     post = Column(UUID(), ForeignKey('posts.id', ondelete='NO ACTION'))
+    filename = Column(String(256), nullable=True)
+    content_type = Column(String(256), nullable=True)
+    size = Column(Integer(), nullable=True)
+    checksum = Column(String(64), nullable=True)
+    blob = Column(String(64), ForeignKey('blobs.checksum', ondelete='NO ACTION'), nullable=True)
 
     author_ref = relationship("Employee", back_populates="uploaded_attachments", foreign_keys=author)
     post_ref = relationship("Post", back_populates="attachments", foreign_keys=post)
 
     attachments_author_idx = Index("attachments_author_idx", author)
     attachments_post_idx = Index("attachments_post_idx", post)
+    attachments_blob_idx = Index("attachments_blob_idx", blob)
+
+
+class Blob(Base):
+    """Attachment file stored by its SHA-256, 'ref_count' (count of attachments) is maintained by triggers"""
+    __tablename__ = 'blobs'
+
+    checksum = Column(String(64), nullable=False, primary_key=True)
+    size = Column(Integer(), nullable=False)
+    ref_count = Column(Integer(), nullable=False, default=0)
+    created_on = Column(DateTime(), nullable=False, default=datetime.utcnow)
+
+    blobs_unreferenced_idx = Index("blobs_unreferenced_idx", checksum, postgresql_where=(ref_count == 0))
+
+
+class Job(Base):
+    """Background job, claimed by workers with FOR UPDATE SKIP LOCKED (see services/job_service.py)"""
+    __tablename__ = 'jobs'
+
+    id = Column(UUID(), nullable=False, primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = Column(String(), nullable=False)
+    arguments = Column(JSONB(), nullable=False, default=dict)
+    status = Column(SmallInteger(), nullable=False, default=0)
+
+    # the job is not enqueued again while a job with the same key exists (used for periodic jobs)
+    dedup_key = Column(String(), nullable=True, unique=True)
+    attempts = Column(Integer(), nullable=False, default=0)
+    max_attempts = Column(Integer(), nullable=False, default=5)
+    run_at = Column(DateTime(), nullable=False, default=datetime.utcnow)
+
+    # a running job is claimed again after this time (if its worker died)
+    locked_until = Column(DateTime(), nullable=True)
+    last_error = Column(String(), nullable=True)
+    created_on = Column(DateTime(), nullable=False, default=datetime.utcnow)
+    finished_on = Column(DateTime(), nullable=True)
+
+    # unfinished jobs (0 and 1 are JobStatus.queued and JobStatus.running)
+    jobs_status_run_at_idx = Index("jobs_status_run_at_idx", status, run_at, postgresql_where=(status < 2))
+    jobs_finished_on_idx = Index("jobs_finished_on_idx", finished_on, postgresql_where=finished_on.isnot(None))
+
+
+class PostCounter(Base):
+    """Count of posts by type, status and author`s subunit, maintained by triggers (see sql/orgfeed_db.sql)"""
+    __tablename__ = 'post_counters'
+
+    type = Column(SmallInteger(), nullable=False, primary_key=True)
+    status = Column(SmallInteger(), nullable=False, primary_key=True)
+    subunit = Column(UUID(), nullable=False, primary_key=True)
+    count = Column(BigInteger(), nullable=False, default=0)
+
+
+class AttachmentCounter(Base):
+    """Count of attachments by author, maintained by triggers (see sql/orgfeed_db.sql)"""
+    __tablename__ = 'attachment_counters'
+
+    author = Column(UUID(), nullable=False, primary_key=True)
+    count = Column(BigInteger(), nullable=False, default=0)
+
+
+class PostStatsMonthly(Base):
+    """Count and size of published posts by author`s subunit, type and month, maintained by triggers"""
+    __tablename__ = 'post_stats_monthly'
+
+    subunit = Column(UUID(), nullable=False, primary_key=True)
+    post_type = Column(SmallInteger(), nullable=False, primary_key=True)
+    month = Column(Date(), nullable=False, primary_key=True)
+    count = Column(BigInteger(), nullable=False, default=0)
+    bytes = Column(BigInteger(), nullable=False, default=0)
+
+    post_stats_monthly_month_subunit_idx = Index("post_stats_monthly_month_subunit_idx", month, subunit)
@@ -1,10 +1,17 @@
 from typing import List, Tuple
-from os import path, listdir, removedirs, remove, makedirs, stat
+from os import path, listdir, rmdir, remove, makedirs, stat, link, replace
+from shutil import copyfileobj
+from hashlib import sha256
+from mimetypes import guess_type
 
 from flask import current_app
+from sqlalchemy.dialects.postgresql import insert
 from werkzeug.datastructures import FileStorage
+from werkzeug.security import safe_join
 
-from . import db, Attachment
+from . import db, Attachment, Post, AttachmentCounter, Blob
+from utils.config import FILE_READ_CHUNK_SIZE
+from utils.upload import HashingFile, create_upload_file
 
 
 def common_attachment_path():
@@ -12,6 +19,7 @@ def common_attachment_path():
 
 
 def path_from_id(attachment_id: str) -> str:
+    """Directory of the attachment in the legacy layout (a level per UUID digit), new files go to the blob store"""
     attachment_path_inner = str.join('/', list(attachment_id.replace('-', '')))
     return path.join(common_attachment_path(), attachment_path_inner)
 
@@ -29,13 +37,24 @@ def get_attachment_path_and_filename(attachment_id: str) -> Tuple[str, str] or T
     return None, None
 
 
+def prune_empty_dirs(directory: str, root: str) -> None:
+    """Removes the directory and its parents while they are empty, stopping at the root (which is kept)"""
+    root = path.normpath(root)
+    directory = path.normpath(directory)
+    while directory != root and directory.startswith(root):
+        try:
+            rmdir(directory)
+        except OSError:
+            return
+        directory = path.dirname(directory)
+
+
 def remove_attachment_file_by_id(attachment: str):
     attachment_path = path_from_id(attachment)
     if path.exists(attachment_path):
         for file in listdir(attachment_path):
             remove(path.join(attachment_path, file))
-        removedirs(attachment_path)
-        makedirs(common_attachment_path(), exist_ok=True)
+        prune_empty_dirs(attachment_path, common_attachment_path())
 
 
 def get_attachment_size(attachment_id: str) -> int:
@@ -45,22 +64,157 @@ def get_attachment_size(attachment_id: str) -> int:
     return stat(path.join(attachment_path, filename)).st_size
 
 
+def get_file_size_and_checksum(file_path: str) -> Tuple[int, str]:
+    checksum = sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(FILE_READ_CHUNK_SIZE), b''):
+            checksum.update(chunk)
+    return stat(file_path).st_size, checksum.hexdigest()
+
+
+def fill_attachment_metadata(attachment: Attachment, file_path: str, content_type: str = None) -> Attachment:
+    attachment.filename = path.basename(file_path)
+    attachment.content_type = content_type or guess_type(file_path)[0] or 'application/octet-stream'
+    attachment.size, attachment.checksum = get_file_size_and_checksum(file_path)
+    return attachment
+
+
+def common_blobs_path():
+    return path.join(current_app.config["UPLOAD_FOLDER"], "blobs")
+
+
+def blob_path(checksum: str) -> str:
+    return path.join(common_blobs_path(), checksum[:2], checksum[2:4], checksum)
+
+
+def get_attachment_file_path(attachment: Attachment) -> str or None:
+    """Path of the attachment file in the blob store or (for not migrated attachments) in the legacy tree"""
+    if attachment.blob:
+        return blob_path(attachment.blob)
+    if attachment.filename:
+        return safe_join(path_from_id(attachment.id), attachment.filename)
+    attachment_path, filename = get_attachment_path_and_filename(attachment.id)
+    return path.join(attachment_path, filename) if filename else None
+
+
+def put_blob_file(source_path: str, checksum: str) -> None:
+    """Atomically puts the file to the blob store (as a hard link if possible), does nothing if the blob exists"""
+    target_path = blob_path(checksum)
+    if path.exists(target_path):
+        return
+    makedirs(path.dirname(target_path), exist_ok=True)
+    try:
+        link(source_path, target_path)
+        return
+    except FileExistsError:
+        return
+    except OSError:
+        pass
+    with open(source_path, 'rb') as source:
+        target = create_upload_file(path.dirname(target_path), delete=False)
+        try:
+            copyfileobj(source, target, FILE_READ_CHUNK_SIZE)
+            target.close()
+            replace(target.name, target_path)
+        except BaseException:
+            target.close()
+            remove(target.name)
+            raise
+
+
+def spool_uploaded_file(file: FileStorage) -> HashingFile:
+    """Returns the hashed temporary file of the upload, copies the upload to a new one if there is no such file"""
+    if isinstance(file.stream, HashingFile):
+        file.stream.flush()
+        return file.stream
+    file.stream.seek(0)
+    spooled = create_upload_file()
+    copyfileobj(file.stream, spooled, FILE_READ_CHUNK_SIZE)
+    spooled.flush()
+    return spooled
+
+
+def reserve_blob(checksum: str, size: int) -> None:
+    """
+    Commits the blob row before its file is written, so if the attachment referencing the blob is never
+    committed, the row stays with 'ref_count' 0 and the sweep removes the file with it. Then locks the row
+    till the end of transaction, so the sweep can not remove the blob before the attachment is committed
+    """
+    statement = insert(Blob).values(checksum=checksum, size=size, ref_count=0)
+    while True:
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[Blob.checksum], set_={"size": statement.excluded.size}
+        ))
+        db.session.commit()
+        # the sweep may remove the unreferenced row between the commit and the lock
+        if db.session.query(Blob.checksum).filter(Blob.checksum == checksum).with_for_update().first():
+            return
+
+
 def add_attachment(attachment: Attachment, file: FileStorage) -> Attachment:
-    attachment_path = path_from_id(attachment.id)
-    makedirs(attachment_path)
-    file.save(full_path_by_id(attachment.id, file.filename))
+    upload = spool_uploaded_file(file)
+    try:
+        attachment.size, attachment.checksum = upload.size, upload.hexdigest()
+        reserve_blob(attachment.checksum, attachment.size)
+        put_blob_file(upload.name, attachment.checksum)
+    finally:
+        if upload is not file.stream:
+            upload.close()
+    attachment.blob = attachment.checksum
+    attachment.filename = file.filename
+    attachment.content_type = file.mimetype or guess_type(file.filename)[0] or 'application/octet-stream'
     db.session.add(attachment)
     db.session.commit()
     return attachment
 
 
+def migrate_attachment_to_blob(attachment: Attachment, file_path: str) -> None:
+    reserve_blob(attachment.checksum, attachment.size)
+    put_blob_file(file_path, attachment.checksum)
+    attachment.blob = attachment.checksum
+    db.session.merge(attachment)
+    db.session.commit()
+    remove_attachment_file_by_id(attachment.id)
+
+
+def sweep_unreferenced_blobs(limit: int) -> int:
+    """
+    Removes up to 'limit' blobs without attachments. Files are removed before the commit
+    while the rows are locked, so a concurrent upload of the same file waits and writes it again
+    """
+    blobs = db.session.query(Blob).\
+        filter(Blob.ref_count == 0).\
+        with_for_update(skip_locked=True).\
+        limit(limit).\
+        all()
+    for blob in blobs:
+        if path.exists(blob_path(blob.checksum)):
+            remove(blob_path(blob.checksum))
+        db.session.delete(blob)
+    db.session.commit()
+    return len(blobs)
+
+
 def edit_attachment(attachment: Attachment):
     db.session.merge(attachment)
     db.session.commit()
 
 
+def edit_attachments(attachments: List[Attachment]):
+    for attachment in attachments:
+        db.session.merge(attachment)
+    db.session.commit()
+
+
 def delete_attachment(attachment: Attachment) -> None:
-    remove_attachment_file_by_id(attachment.id)
+    """
+    Deletes the attachment row and subtracts its size from the size of its post in the same transaction,
+    a file in the legacy tree is left to remove_attachment_file_by_id
+    """
+    if attachment.post:
+        db.session.query(Post).\
+            filter(Post.id == attachment.post).\
+            update({"size": Post.size - (attachment.size or 0)}, synchronize_session=False)
     db.session.delete(attachment)
     db.session.commit()
 
@@ -70,7 +224,8 @@ def get_attachment_by_id(attachment_id: str) -> Attachment:
 
 
 def delete_attachment_by_id(attachment_id: str) -> None:
-    remove_attachment_file_by_id(attachment_id)
+    if not db.session.query(Attachment.blob).filter(Attachment.id == attachment_id).scalar():
+        remove_attachment_file_by_id(attachment_id)
     db.session.query(Attachment).filter(Attachment.id == attachment_id).delete()
     db.session.commit()
 
@@ -82,8 +237,24 @@ def get_user_attachments(user_id: str, page: int, page_size: int) -> List[Attach
         all()
 
 
+def get_legacy_attachments(after_id: str or None, limit: int) -> List[Attachment]:
+    """Attachments that are not moved to the blob store yet, ordered by ID"""
+    base_request = db.session.query(Attachment).filter(Attachment.blob.is_(None))
+    if after_id:
+        base_request = base_request.filter(Attachment.id > after_id)
+    return base_request.order_by(Attachment.id).limit(limit).all()
+
+
+def get_attachments_without_metadata(limit: int) -> List[Attachment]:
+    return db.session.query(Attachment).\
+        filter(Attachment.size.is_(None)).\
+        limit(limit).\
+        all()
+
+
 def get_user_attachments_count(user_id: str) -> int:
-    return db.session.query(Attachment).filter(Attachment.author == user_id).count()
+    counter = db.session.query(AttachmentCounter).filter(AttachmentCounter.author == user_id).first()
+    return counter.count if counter else 0
 
 
 def ensure_attachments_exist(attachment_ids: List[str]) -> bool:
@@ -93,8 +264,19 @@ def ensure_attachments_exist(attachment_ids: List[str]) -> bool:
     return True
 
 
-def add_attachments_to_post(post_id: str or None, attachment_ids: List[str]) -> None:
+def add_attachments_to_post(post_id: str or None, attachment_ids: List[str]) -> List[str]:
+    """
+    Links the attachments to the post (or unlinks them if it is None), returns IDs of other posts
+    they were linked to: sizes of those posts change too
+    """
+    previous_request = db.session.query(Attachment.post).\
+        filter(Attachment.id.in_(attachment_ids)).\
+        filter(Attachment.post.isnot(None))
+    if post_id:
+        previous_request = previous_request.filter(Attachment.post != post_id)
+    previous_post_ids = list(dict.fromkeys(str(row.post) for row in previous_request.with_for_update().all()))
     db.session.query(Attachment).\
         filter(Attachment.id.in_(attachment_ids)).\
         update({"post": post_id}, synchronize_session='fetch')
     db.session.commit()
+    return previous_post_ids
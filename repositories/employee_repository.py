@@ -1,4 +1,9 @@
-from typing import List, Iterable
+from typing import List, Iterable, Set, Tuple
+from datetime import datetime
+from io import StringIO
+import csv
+
+from psycopg2 import IntegrityError
 
 from . import db, Employee
 from models.employee_model import EmployeeType
@@ -14,6 +19,18 @@ def get_employee_by_id(employee_id: str) -> Employee:
     return db.session.query(Employee).filter(Employee.id == employee_id).first()
 
 
+def get_employee_version(employee_id: str) -> datetime or None:
+    return db.session.query(Employee.updated_on).filter(Employee.id == employee_id).scalar()
+
+
+def get_employee_permissions(employee_id: str) -> Tuple[int, bool, int] or None:
+    """User type, fired flag and permission version of the employee"""
+    permissions = db.session.query(Employee.user_type, Employee.fired, Employee.permission_version).\
+        filter(Employee.id == employee_id).\
+        first()
+    return tuple(permissions) if permissions else None
+
+
 def get_employee_by_id_list(employee_ids: Iterable[str]) -> List[Employee]:
     return db.session.query(Employee).filter(Employee.id.in_(employee_ids)).all()
 
@@ -22,6 +39,13 @@ def get_employee_by_email(email: str) -> Employee:
     return db.session.query(Employee).filter(Employee.email == email).first()
 
 
+def set_password_hash(employee_id: str, password_hash: str) -> None:
+    db.session.query(Employee).\
+        filter(Employee.id == employee_id).\
+        update({"password_hash": password_hash}, synchronize_session=False)
+    db.session.commit()
+
+
 def delete_employee(employee: Employee) -> None:
     db.session.delete(employee)
     db.session.commit()
@@ -33,3 +57,32 @@ def fired_users_of_subunit(subunit_id: str, types: Iterable[EmployeeType]) -> Li
         filter(Employee.user_type.in_(e_type.value for e_type in types)).\
         filter(Employee.fired).\
         all()
+
+
+def get_existing_emails(emails: Iterable[str]) -> Set[str]:
+    return {
+        email for email, in db.session.query(Employee.email).filter(Employee.email.in_(list(emails))).all()
+    }
+
+
+def copy_employees(rows: Iterable[Tuple[str, str, str, int, str]]) -> bool:
+    """
+    Loads employees (email, full_name, subunit, user_type, password_hash) with a single COPY.
+    Returns False (and loads nothing) if any of the rows violates a constraint
+    """
+    data = StringIO()
+    csv.writer(data).writerows(rows)
+    data.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY public.employees (email, full_name, subunit, user_type, password_hash) FROM STDIN WITH (FORMAT csv)",
+            data
+        )
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    finally:
+        cursor.close()
+    db.session.commit()
+    return True
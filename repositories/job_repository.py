@@ -0,0 +1,97 @@
+from typing import List, Tuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, or_, and_, func
+from sqlalchemy.dialects.postgresql import insert
+
+from . import db, Job
+from models.job_model import JobStatus
+
+
+def add_job(
+        name: str, arguments: dict = None, run_at: datetime = None, dedup_key: str = None, max_attempts: int = 5
+) -> bool:
+    """
+    Adds the job to the queue in the current transaction without committing it,
+    returns False if a job with the same dedup key already exists
+    """
+    statement = insert(Job).values(
+        name=name,
+        arguments=arguments or {},
+        run_at=run_at or datetime.utcnow(),
+        dedup_key=dedup_key,
+        max_attempts=max_attempts
+    )
+    if dedup_key:
+        statement = statement.on_conflict_do_nothing(index_elements=[Job.dedup_key])
+    return db.session.execute(statement.returning(Job.id)).first() is not None
+
+
+def enqueue_job(
+        name: str, arguments: dict = None, run_at: datetime = None, dedup_key: str = None, max_attempts: int = 5
+) -> bool:
+    """Adds the job to the queue and commits, returns False if a job with the same dedup key already exists"""
+    added = add_job(name, arguments, run_at, dedup_key, max_attempts)
+    db.session.commit()
+    return added
+
+
+def claim_job(lock_seconds: int) -> tuple or None:
+    """
+    Marks the earliest due job (or a running one whose lock has expired) as running for 'lock_seconds'
+    and commits; jobs locked by other workers are skipped. Returns (ID, name, arguments, attempts, max_attempts)
+    """
+    now = datetime.utcnow()
+    claimable = db.session.query(Job.id.label("id")).\
+        filter(or_(
+            and_(Job.status == JobStatus.queued.value, Job.run_at <= now),
+            and_(Job.status == JobStatus.running.value, Job.locked_until < now)
+        )).\
+        order_by(Job.run_at).\
+        limit(1).\
+        with_for_update(skip_locked=True).\
+        subquery()
+    claimed = db.session.execute(
+        update(Job.__table__).
+        where(Job.id == claimable.c.id).
+        values(
+            status=JobStatus.running.value,
+            attempts=Job.attempts + 1,
+            locked_until=now + timedelta(seconds=lock_seconds)
+        ).
+        returning(Job.id, Job.name, Job.arguments, Job.attempts, Job.max_attempts)
+    ).first()
+    db.session.commit()
+    return claimed
+
+
+def finish_job(job_id: str, status: JobStatus, error: str = None, run_at: datetime = None) -> None:
+    """Completes or fails the job, or returns it to the queue to run again at 'run_at'"""
+    values = {"status": status.value, "locked_until": None, "last_error": error}
+    if status == JobStatus.queued:
+        values["run_at"] = run_at
+    else:
+        values["finished_on"] = datetime.utcnow()
+    db.session.query(Job).filter(Job.id == job_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def prune_jobs(finished_before: datetime, limit: int) -> int:
+    """Removes up to 'limit' jobs finished before the given time"""
+    old_jobs = db.session.query(Job.id).\
+        filter(Job.finished_on < finished_before).\
+        limit(limit).\
+        subquery()
+    removed = db.session.query(Job).\
+        filter(Job.id.in_(old_jobs)).\
+        delete(synchronize_session=False)
+    db.session.commit()
+    return removed
+
+
+def get_jobs_stats() -> List[Tuple[str, int, int, datetime]]:
+    """Count of jobs and the earliest run time by name and status"""
+    return db.session.query(Job.name, Job.status, func.count(Job.id), func.min(Job.run_at)).\
+        group_by(Job.name, Job.status).\
+        order_by(Job.name, Job.status).\
+        all()
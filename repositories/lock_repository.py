@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+from typing import Iterator
+from zlib import crc32
+
+from sqlalchemy import select, func
+
+from . import db
+
+
+def lock_key(name: str) -> int:
+    return crc32(name.encode())
+
+
+@contextmanager
+def advisory_lock(name: str) -> Iterator[bool]:
+    """
+    Tries to take the transaction-level advisory lock 'name' on a dedicated connection and yields whether it is taken.
+    The transaction (and so the lock) lasts till the end of the block and is not affected by commits of the session;
+    if the process dies, the lock is released with its connection
+    """
+    connection = db.engine.connect()
+    try:
+        with connection.begin():
+            yield connection.execute(select([func.pg_try_advisory_xact_lock(lock_key(name))])).scalar()
+    finally:
+        connection.close()
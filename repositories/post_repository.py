@@ -1,12 +1,14 @@
-from typing import List, Set
-from datetime import date, datetime
+from typing import List, Set, Tuple, Iterator
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
-from sqlalchemy import Date
+from sqlalchemy import tuple_, select, union_all, func, update, case, cast, Numeric
+from sqlalchemy.orm import joinedload, selectinload, aliased
 from flask_sqlalchemy import BaseQuery
 
-from models.post_model import PostType, PostStatus
-from . import db, Post, Employee
-from utils import get_current_app
+from models.post_enums import PostType, PostStatus
+from utils.config import SEARCH_CONFIG, SEARCH_HEADLINE_OPTIONS
+from . import db, read_session, estimate_count, Post, Employee, Attachment, PostCounter, PostStatsMonthly
 
 
 def add_or_edit_post(post: Post) -> Post:
@@ -15,17 +17,86 @@ def add_or_edit_post(post: Post) -> Post:
     return post
 
 
+def with_relations(base_request: BaseQuery) -> BaseQuery:
+    """Loads authors, approvers and attachments (with their authors) of posts in a fixed number of SELECTs"""
+    return base_request.options(
+        joinedload(Post.creator),
+        joinedload(Post.approver),
+        selectinload(Post.attachments).joinedload(Attachment.author_ref)
+    )
+
+
 def get_post_by_id(post_id: str) -> Post:
     return db.session.query(Post).filter(Post.id == post_id).first()
 
 
+def get_post_version(post_id: str) -> tuple or None:
+    """Update times of the post and of every employee embedded into it"""
+    creator, approver = aliased(Employee), aliased(Employee)
+    attachment_authors_version = select([func.max(Employee.updated_on)]).\
+        where(Attachment.post == Post.id).\
+        where(Attachment.author == Employee.id).\
+        as_scalar()
+    return db.session.query(Post.updated_on, creator.updated_on, approver.updated_on, attachment_authors_version).\
+        join(creator, Post.author == creator.id).\
+        outerjoin(approver, Post.approved_by == approver.id).\
+        filter(Post.id == post_id).\
+        first()
+
+
+def get_posts_version() -> tuple:
+    """Changes whenever any post is created, edited or deleted, or any employee is edited"""
+    return read_session().query(
+        select([func.max(Post.updated_on)]).as_scalar(),
+        select([func.coalesce(func.sum(PostCounter.count), 0)]).as_scalar(),
+        select([func.max(Employee.updated_on)]).as_scalar()
+    ).one()
+
+
+def set_posts_status(post_ids: List[str], status: PostStatus, setter_id: str) -> List[Tuple[str, int, int, str]]:
+    """
+    Sets the status of posts (with the same dates and approver changes as post_service.set_post_status does)
+    in one UPDATE and commits it. Posts that already have the status are not changed.
+    Returns (ID, previous status, type, author`s subunit) of changed posts
+    """
+    now = datetime.utcnow()
+    previous = db.session.query(Post.id.label("id"), Post.status.label("status"), Employee.subunit.label("subunit")).\
+        join(Employee, Post.author == Employee.id).\
+        filter(Post.id.in_(post_ids)).\
+        filter(Post.status != status.value).\
+        with_for_update(of=Post).\
+        subquery()
+    values = {"status": status.value}
+    if status == PostStatus.archived:
+        values["archived_on"] = now
+    elif status == PostStatus.posted:
+        values["published_on"] = now
+        values["approved_by"] = setter_id
+    if status != PostStatus.archived:
+        values["archived_on"] = case(
+            [(previous.c.status == PostStatus.archived.value, now + timedelta(hours=4380))], else_=Post.archived_on
+        )
+    changed = db.session.execute(
+        update(Post.__table__).
+        where(Post.id == previous.c.id).
+        values(values).
+        returning(Post.id, previous.c.status, Post.type, previous.c.subunit)
+    ).fetchall()
+    db.session.commit()
+    return [tuple(row) for row in changed]
+
+
+def get_existing_post_ids(post_ids: List[str]) -> Set[str]:
+    return {str(row.id) for row in db.session.query(Post.id).filter(Post.id.in_(post_ids)).all()}
+
+
 def delete_post(post: Post) -> None:
     db.session.delete(post)
     db.session.commit()
 
 
 def base_archive_request() -> BaseQuery:
-    return db.session.query(Post).filter(Post.status == PostStatus.archived.value)
+    return read_session().query(Post).filter(Post.status == PostStatus.archived.value)
 
 
 def base_posts_request_for_subunit(base_request: BaseQuery, subunit_id: str) -> BaseQuery:
@@ -34,41 +105,72 @@ def base_posts_request_for_subunit(base_request: BaseQuery, subunit_id: str) ->
         filter(Post.author == Employee.id)
 
 
-def base_posts_request_for_subunits(base_request: BaseQuery, subunit_ids: List[str]) -> BaseQuery:
-    return base_request.\
-        filter(Employee.subunit.in_(subunit_ids)).\
-        filter(Post.author == Employee.id)
+def paginate(
+        base_request: BaseQuery, page: int, page_size: int,
+        cursor: Tuple[datetime, str] = None, oldest_first: bool = False
+) -> BaseQuery:
+    if oldest_first:
+        base_request = base_request.order_by(Post.created_on.asc(), Post.id.asc())
+    else:
+        base_request = base_request.order_by(Post.created_on.desc(), Post.id.desc())
+    if cursor:
+        if oldest_first:
+            base_request = base_request.filter(tuple_(Post.created_on, Post.id) > tuple_(*cursor))
+        else:
+            base_request = base_request.filter(tuple_(Post.created_on, Post.id) < tuple_(*cursor))
+        return base_request.limit(page_size)
+    return base_request.limit(page_size).offset(page * page_size)
 
 
-def get_archived_posts(page: int, page_size: int) -> List[Post]:
-    return base_archive_request().\
-        limit(page_size).offset(page * page_size).\
-        all()
+def get_archived_posts(page: int, page_size: int, cursor: Tuple[datetime, str] = None) -> List[Post]:
+    return paginate(with_relations(base_archive_request()), page, page_size, cursor).all()
 
 
 def count_archived_posts() -> int:
-    return base_archive_request().count()
+    return get_posts_count(post_statuses={PostStatus.archived})
 
 
-def get_posts_by_date(day: date, include_archived: bool) -> List[Post]:
-    base_request = db.session.query(Post).\
-        filter(Post.published_on.cast(Date) == day)
-    if include_archived:
-        base_request = base_request.filter(Post.status.in_((PostStatus.archived.value, PostStatus.posted.value)))
-    else:
-        base_request = base_request.filter(Post.status == PostStatus.posted.value)
-    return base_request.all()
+def update_posts_size(post_ids: List[str] = None) -> None:
+    attachments_size = select([func.sum(Attachment.size)]).where(Attachment.post == Post.id).as_scalar()
+    base_request = db.session.query(Post)
+    if post_ids is not None:
+        base_request = base_request.filter(Post.id.in_(post_ids))
+    base_request.update(
+        {"size": func.octet_length(Post.title) + func.octet_length(Post.body) + func.coalesce(attachments_size, 0)},
+        synchronize_session=False
+    )
+    db.session.commit()
+
+
+def get_biggest_posts(start: datetime, end: datetime, include_archived: bool, count: int) -> List[Post]:
+    statuses = [PostStatus.posted.value] + ([PostStatus.archived.value] if include_archived else [])
+    # posts_status_size_id_published_on_idx returns each status in size order,
+    # so only the first count rows per status are left to sort
+    biggest = union_all(*(
+        select([Post.id]).
+        where(Post.status == status).
+        where(Post.published_on >= start).
+        where(Post.published_on < end).
+        order_by(Post.size.desc(), Post.id.asc()).
+        limit(count)
+        for status in statuses
+    ))
+    return with_relations(read_session().query(Post)).\
+        filter(Post.id.in_(biggest)).\
+        order_by(Post.size.desc(), Post.id.asc()).\
+        limit(count).\
+        all()
 
 
 def get_posts_of_employee(employee_id: str) -> List[Post]:
-    return db.session.query(Post).\
+    return with_relations(db.session.query(Post)).\
         filter(Post.author == employee_id).\
         all()
 
 
 def base_posts_request(posts_type: PostType = None, subunit_id: str = None, post_statuses: Set[PostStatus] = None) -> BaseQuery:
     post_statuses_int = [status.value for status in post_statuses]
-    base_request = db.session.query(Post)
+    base_request = read_session().query(Post)
     if post_statuses:
         base_request = base_request.filter(Post.status.in_(post_statuses_int))
     if posts_type:
@@ -80,34 +182,158 @@ def base_posts_request(posts_type: PostType = None, subunit_id: str = None, post
 
 def get_posts(
         page: int, page_size: int, posts_type: PostType = None,
-        post_statuses: Set[PostStatus] = None, subunit_id: str = None, oldest_first: bool = False
+        post_statuses: Set[PostStatus] = None, subunit_id: str = None, oldest_first: bool = False,
+        cursor: Tuple[datetime, str] = None
 ) -> List[Post]:
     base_request = base_posts_request(posts_type, subunit_id, post_statuses)
-    if oldest_first:
-        base_request = base_request.order_by(Post.created_on.asc())
-    else:
-        base_request = base_request.order_by(Post.created_on.desc())
-    return base_request.limit(page_size).offset(page * page_size).all()
+    return paginate(with_relations(base_request), page, page_size, cursor, oldest_first).all()
 
 
 def get_posts_count(posts_type: PostType = None, post_statuses: Set[PostStatus] = None, subunit_id: str = None) -> int:
-    base_request = base_posts_request(posts_type, subunit_id, post_statuses)
+    base_request = read_session().query(func.coalesce(func.sum(PostCounter.count), 0))
+    if post_statuses:
+        base_request = base_request.filter(PostCounter.status.in_([status.value for status in post_statuses]))
+    if posts_type:
+        base_request = base_request.filter(PostCounter.type == posts_type.value)
+    if subunit_id:
+        base_request = base_request.filter(PostCounter.subunit == subunit_id)
+    return int(base_request.scalar())
+
+
+def filter_search_results(
+        base_request: BaseQuery, query, post_types: Set[PostType] = None, post_statuses: Set[PostStatus] = None,
+        subunit_id: str = None, start: datetime = None, end: datetime = None
+) -> BaseQuery:
+    base_request = base_request.filter(Post.search_vector.op("@@")(query))
+    if post_types:
+        base_request = base_request.filter(Post.type.in_([post_type.value for post_type in post_types]))
+    if post_statuses:
+        base_request = base_request.filter(Post.status.in_([status.value for status in post_statuses]))
+    if subunit_id:
+        base_request = base_posts_request_for_subunit(base_request, subunit_id)
+    if start:
+        base_request = base_request.filter(Post.created_on >= start)
+    if end:
+        base_request = base_request.filter(Post.created_on < end)
+    return base_request
+
+
+def count_search_results(
+        ts_query: str, post_types: Set[PostType] = None, post_statuses: Set[PostStatus] = None, subunit_id: str = None,
+        start: datetime = None, end: datetime = None, estimate: bool = False
+) -> int:
+    """
+    Count of the full-text search results. No counters cover its filters, so the exact count scans all matches;
+    with 'estimate' the planner's estimate is returned instead
+    """
+    base_request = filter_search_results(
+        read_session().query(Post.id), func.to_tsquery(SEARCH_CONFIG, ts_query),
+        post_types, post_statuses, subunit_id, start, end
+    )
+    if estimate:
+        return estimate_count(base_request)
     return base_request.count()
 
 
-def get_posts_by_period(start: date, end: date, subunit_ids: List[str] = None) -> List:
-    base_request = db.session.query(Post).\
-        filter(Post.status.in_((PostStatus.posted.value, PostStatus.archived.value))).\
-        filter(Post.published_on >= start).\
-        filter(Post.published_on < end)
+def search_posts(
+        ts_query: str, page_size: int or None, post_types: Set[PostType] = None, post_statuses: Set[PostStatus] = None,
+        subunit_id: str = None, start: datetime = None, end: datetime = None, cursor: Tuple[Decimal, str] = None
+) -> List[tuple]:
+    """
+    Full-text search ordered by rank. Returns rows of post columns (without body), author (Employee),
+    rank and a snippet of the HTML-escaped body; snippets are built only for the rows of the page
+    """
+    query = func.to_tsquery(SEARCH_CONFIG, ts_query)
+    # ts_rank is real, which does not survive a round trip through a float cursor exactly;
+    # ranks are selected, ordered and compared as numeric, so cursors hold them exactly
+    rank = cast(func.ts_rank(Post.search_vector, query), Numeric)
+    session = read_session()
+    base_request = filter_search_results(
+        session.query(Post.id.label("id"), rank.label("rank")), query, post_types, post_statuses, subunit_id, start, end
+    )
+    if cursor:
+        base_request = base_request.filter(tuple_(rank, Post.id) < tuple_(*cursor))
+    ranked = base_request.order_by(rank.desc(), Post.id.desc()).limit(page_size).subquery()
+    escaped_body = func.replace(func.replace(func.replace(Post.body, '&', '&amp;'), '<', '&lt;'), '>', '&gt;')
+    return session.query(
+        Post.id, Post.title, Post.type, Post.status, Post.created_on, Post.published_on, Employee,
+        ranked.c.rank.label("rank"),
+        func.ts_headline(SEARCH_CONFIG, escaped_body, query, SEARCH_HEADLINE_OPTIONS).label("snippet")
+    ).\
+        join(ranked, ranked.c.id == Post.id).\
+        join(Employee, Post.author == Employee.id).\
+        order_by(ranked.c.rank.desc(), Post.id.desc()).\
+        all()
+
+
+def iter_posts_for_export(
+        post_statuses: Set[PostStatus], subunit_id: str = None, start: datetime = None, end: datetime = None,
+        cursor: Tuple[datetime, str] = None, embed: bool = False, batch_size: int = 256
+) -> Iterator[Post]:
+    """
+    Posts (the oldest first, after the cursor if given) read through a server-side cursor
+    'batch_size' rows at a time, so memory usage does not depend on the count of exported posts.
+    Authors and approvers are loaded only if 'embed' is set
+    """
+    base_request = base_posts_request(subunit_id=subunit_id, post_statuses=post_statuses)
+    if start:
+        base_request = base_request.filter(Post.created_on >= start)
+    if end:
+        base_request = base_request.filter(Post.created_on < end)
+    if cursor:
+        base_request = base_request.filter(tuple_(Post.created_on, Post.id) > tuple_(*cursor))
+    if embed:
+        base_request = with_relations(base_request)
+    else:
+        base_request = base_request.options(selectinload(Post.attachments))
+    return iter(base_request.order_by(Post.created_on.asc(), Post.id.asc()).yield_per(batch_size))
+
+
+def rebuild_search_vectors() -> None:
+    db.session.execute("SELECT public.rebuild_posts_search_vectors()")
+    db.session.commit()
+
+
+def rebuild_counters() -> None:
+    db.session.execute("SELECT public.rebuild_counters()")
+    db.session.commit()
+
+
+def count_posts_by_months(start: date, end: date, subunit_ids: List[str] = None) -> List[Tuple[str, int, date, int]]:
+    """Returns (subunit, post type, month, count) of published (and archived) posts from the monthly rollup"""
+    base_request = read_session().query(
+        PostStatsMonthly.subunit, PostStatsMonthly.post_type, PostStatsMonthly.month, PostStatsMonthly.count
+    ).\
+        filter(PostStatsMonthly.month >= start).\
+        filter(PostStatsMonthly.month < end)
     if subunit_ids:
-        base_request = base_posts_request_for_subunits(base_request, subunit_ids)
+        base_request = base_request.filter(PostStatsMonthly.subunit.in_(subunit_ids))
     return base_request.all()
 
 
-def archive_expired_posts() -> None:
-    with get_current_app().app_context():
-        db.session.query(Post).\
-            filter(Post.status != PostStatus.archived.value).\
-            filter(Post.archived_on < datetime.utcnow()).\
-            update({"status": PostStatus.archived.value}, synchronize_session='fetch')
+def rebuild_post_stats() -> None:
+    db.session.execute("SELECT public.rebuild_post_stats_monthly()")
+    db.session.commit()
+
+
+def archive_expired_posts(limit: int) -> List[Tuple[int, str]]:
+    """
+    Archives up to 'limit' posts with expired archivation date and commits, posts locked by other transactions
+    are skipped till the next run. Returns (type, author`s subunit) of the archived posts
+    """
+    expired = db.session.query(Post.id.label("id"), Employee.subunit.label("subunit")).\
+        join(Employee, Post.author == Employee.id).\
+        filter(Post.status != PostStatus.archived.value).\
+        filter(Post.archived_on < datetime.utcnow()).\
+        order_by(Post.archived_on).\
+        limit(limit).\
+        with_for_update(of=Post, skip_locked=True).\
+        subquery()
+    archived = db.session.execute(
+        update(Post.__table__).
+        where(Post.id == expired.c.id).
+        values(status=PostStatus.archived.value).
+        returning(Post.type, expired.c.subunit)
+    ).fetchall()
+    db.session.commit()
+    return [tuple(row) for row in archived]
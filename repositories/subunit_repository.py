@@ -1,6 +1,8 @@
-from typing import List
+from typing import List, Iterable, Set
 
-from . import db, Subunit
+from sqlalchemy import select, func
+
+from . import db, read_session, Subunit, Employee
 
 
 def add_or_edit_subunit(subunit: Subunit) -> Subunit:
@@ -13,6 +15,23 @@ def get_subunit_by_id(subunit_id: str) -> Subunit:
     return db.session.query(Subunit).filter(Subunit.id == subunit_id).first()
 
 
+def get_subunit_version(subunit_id: str) -> tuple or None:
+    """Update times of the subunit and its employees, and count of the employees"""
+    return db.session.query(
+        Subunit.updated_on,
+        select([func.max(Employee.updated_on)]).where(Employee.subunit == Subunit.id).as_scalar(),
+        select([func.count(Employee.id)]).where(Employee.subunit == Subunit.id).as_scalar()
+    ).\
+        filter(Subunit.id == subunit_id).\
+        first()
+
+
+def get_existing_subunit_ids(subunit_ids: Iterable[str]) -> Set[str]:
+    return {
+        subunit_id for subunit_id, in db.session.query(Subunit.id).filter(Subunit.id.in_(list(subunit_ids))).all()
+    }
+
+
 def get_subunit_by_email(email: str) -> Subunit:
     return db.session.query(Subunit).filter(Subunit.email == email).first()
 
@@ -27,7 +46,7 @@ def delete_subunit(subunit: Subunit) -> None:
 
 
 def get_subunits(subunit_ids: List[str] = None) -> List[Subunit]:
-    base_request = db.session.query(Subunit)
+    base_request = read_session().query(Subunit)
     if subunit_ids:
         base_request = base_request.filter(Subunit.id.in_(subunit_ids))
     return base_request.all()
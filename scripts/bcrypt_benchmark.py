@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Measures how many logins (bcrypt checks) per second a single core and the whole pool of threads
+can do at each cost, to choose BCRYPT_COST and BCRYPT_WORKERS in config.json
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import bcrypt
+
+
+PASSWORD = b"Qwerty123"
+
+
+def checks_per_second(password_hash: bytes, seconds: float, threads: int) -> float:
+    def check_for(deadline: float) -> int:
+        checks = 0
+        while perf_counter() < deadline:
+            bcrypt.checkpw(PASSWORD, password_hash)
+            checks += 1
+        return checks
+
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        checks = sum(executor.map(check_for, [started + seconds] * threads))
+    return checks / (perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--costs", default="10,11,12,13,14", help="bcrypt costs to measure, separated by commas")
+    parser.add_argument("--seconds", type=float, default=3.0, help="time to measure each cost for")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="threads for the pool measurement")
+    args = parser.parse_args()
+
+    print(f"{'cost':>4} {'ms/login':>9} {'logins/s/core':>14} {f'logins/s ({args.threads} threads)':>24}")
+    for cost in (int(cost) for cost in args.costs.split(',')):
+        password_hash = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(cost))
+        per_core = checks_per_second(password_hash, args.seconds, 1)
+        pool = checks_per_second(password_hash, args.seconds, args.threads)
+        print(f"{cost:>4} {1000 / per_core:>9.1f} {per_core:>14.2f} {pool:>24.2f}")
+
+
+if __name__ == "__main__":
+    main()
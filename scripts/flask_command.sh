@@ -0,0 +1,15 @@
+#!/bin/bash
+
+export start_pwd=$PWD
+while [[ $PWD == *"scripts"* ]]; do
+    cd ..
+done
+
+source ./scripts/auxiliary/prepare_launch.sh
+
+if $(password_check); then
+    source ./.venv/bin/activate
+    FLASK_APP=server.py flask "$@"
+fi
+
+cd $start_pwd
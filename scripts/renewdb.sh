@@ -12,6 +12,7 @@ if $(password_check); then
     createdb -U orgfeed_user orgfeed_db
     psql orgfeed_db -U orgfeed_user < ./sql/orgfeed_db.sql
     pg_restore -U orgfeed_user --data-only --disable-triggers -d orgfeed_db ./sql/data.pgdump
+    psql orgfeed_db -U orgfeed_user -c "SELECT public.rebuild_counters(), public.rebuild_post_stats_monthly(), public.rebuild_posts_search_vectors()"
 fi
 
 cd $start_pwd
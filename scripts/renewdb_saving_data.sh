@@ -15,6 +15,7 @@ if $(password_check); then
     psql orgfeed_db -U orgfeed_user < ./sql/orgfeed_db.sql
 
     pg_restore -U orgfeed_user --data-only -d orgfeed_db ./sql/orgfeed_db_data.pgdump
+    psql orgfeed_db -U orgfeed_user -c "SELECT public.rebuild_counters(), public.rebuild_post_stats_monthly(), public.rebuild_posts_search_vectors()"
     rm -f ./orgfeed_db_data.pgdump
 fi
 
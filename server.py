@@ -1,23 +1,27 @@
 import os
 import json
-import atexit
+import logging
 
-from flask import Flask, request, Response
+from flask import Flask, request, Response, g
 from flask_sqlalchemy import SQLAlchemy
 from injector import Module, singleton
 from flask_jwt_extended import JWTManager
 from flask_restx.api import Api
 from flask_injector import FlaskInjector
-from werkzeug.datastructures import Headers
-from apscheduler.schedulers.background import BackgroundScheduler
 
 from apis import api, cors_headers
+from apis.utils import get_optional_jwt_identity
 from frontend_bindings.pages import bind_frontend_pages
 from frontend_bindings.errors import bind_error_pages
-from repositories import db, post_repository
+from commands import bind_commands
+from repositories import db, replica_session
+from services import cache_service
 from utils import config
+from utils.database import engine_options, timeouts_config, replica_binds, replica_bind_keys
+from utils.upload import UploadRequest
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.register_blueprint(api.blueprint, url_prefix='/api/v1')
 
 
@@ -31,9 +35,19 @@ app.config['JWT_SECRET_KEY'] = app.config['SECRET_KEY'] = os.environ.get('JWT_KE
 app.config['SQLALCHEMY_DATABASE_URI'] = config.DB_CONNECTION_TEMPLATE.format(
     'orgfeed_user', os.environ.get("PGPASSWORD"), 'orgfeed_db'
 )
+# PGHOST and PGPORT variables may point libpq to PgBouncer (in transaction mode)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+app.config['DB_TIMEOUTS'] = timeouts_config(app.config['DB_TIMEOUTS'])
+app.config['SQLALCHEMY_BINDS'] = replica_binds(app.config.get('DB_REPLICA_URLS', []))
+# a mistyped mode would make every download an empty response
+if app.config.get('ATTACHMENT_OFFLOAD', 'none') not in config.ATTACHMENT_OFFLOAD_MODES:
+    raise ValueError(
+        f"Unknown ATTACHMENT_OFFLOAD '{app.config['ATTACHMENT_OFFLOAD']}' (allowed: {config.ATTACHMENT_OFFLOAD_MODES})"
+    )
 
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 app.config["MAX_CONTENT_PATH"] = app.config["MAX_CONTENT_LENGTH"] = 1024 * 1024 * 5
+app.logger.setLevel(logging.INFO)  # jobs of worker.py log their metrics
 
 
 class AppModule(Module):
@@ -57,16 +71,34 @@ class AppModule(Module):
 FlaskInjector(app=app, modules=[AppModule(app)])
 bind_frontend_pages(app)
 bind_error_pages(app)
+bind_commands(app)
+
+
+def sticks_to_primary() -> bool:
+    """Whether the employee of the request has written something recently, so replicas may not have it yet"""
+    employee_id = get_optional_jwt_identity()
+    return bool(employee_id) and cache_service.was_written(cache_service.written_key(employee_id))
+
+
+@app.before_request
+def before_request():
+    g.read_from_replica = (
+        request.method in ("GET", "HEAD") and bool(replica_bind_keys(app.config)) and not sticks_to_primary()
+    )
 
 
 @app.after_request
 def after_request(response: Response):
     db.session.rollback()
+    written = request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400
+    if written and replica_bind_keys(app.config):
+        employee_id = get_optional_jwt_identity()
+        if employee_id:
+            cache_service.mark_written(cache_service.written_key(employee_id))
 
-    headers = dict(response.headers)
-    headers["Cache-Control"] = "no-transform"
-    headers.update(**cors_headers)
-    response.headers = Headers(headers)
+    response.cache_control.no_transform = True
+    for header, value in cors_headers.items():
+        response.headers[header] = value
 
     path = request.path
     if path.startswith("/api/v") and path.endswith("/") and path.count("/") == 3:
@@ -75,10 +107,9 @@ def after_request(response: Response):
     return response
 
 
-scheduler = BackgroundScheduler()
-scheduler.add_job(post_repository.archive_expired_posts, 'cron', hour=2, max_instances=1, replace_existing=True)
-scheduler.start()
-atexit.register(scheduler.shutdown)
+@app.teardown_appcontext
+def remove_replica_session(exception=None):
+    replica_session.remove()
 
 
 if __name__ == "__main__":
@@ -1,5 +1,10 @@
-from typing import Iterable
+from typing import Iterable, Tuple
 from uuid import UUID
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as Base64Error
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from hashlib import sha1
 
 from flask import abort
 
@@ -19,6 +24,48 @@ def get_page(request) -> int:
     return page
 
 
+def encode_cursor(created_on: datetime, item_id: str) -> str:
+    return urlsafe_b64encode(f"{created_on.isoformat()}|{item_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_on, item_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_on), str(UUID(item_id))
+    except (ValueError, UnicodeError, Base64Error):
+        abort(400, "Incorrect cursor parameter")
+
+
+def encode_rank_cursor(rank: Decimal, item_id: str) -> str:
+    return urlsafe_b64encode(f"{rank}|{item_id}".encode()).decode()
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[Decimal, str]:
+    try:
+        rank, item_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return Decimal(rank), str(UUID(item_id))
+    except (ValueError, UnicodeError, Base64Error, InvalidOperation):
+        abort(400, "Incorrect cursor parameter")
+
+
+def get_cursor(request) -> Tuple[datetime, str] or None:
+    cursor = request.args.get("cursor", '')
+    if not cursor:
+        return None
+    return decode_cursor(cursor)
+
+
+def get_page_or_cursor(request) -> Tuple[int, Tuple[datetime, str] or None]:
+    cursor = get_cursor(request)
+    if cursor:
+        return 0, cursor
+    return get_page(request), None
+
+
+def make_etag(*parts) -> str:
+    return sha1(repr(parts).encode()).hexdigest()
+
+
 def get_uuid(request, allow_empty: bool = False) -> str:
     if isinstance(request, str):
         value = request
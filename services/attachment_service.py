@@ -1,24 +1,32 @@
 from typing import List, Dict
 from math import ceil
+from datetime import timedelta
 from uuid import uuid4
+from os import path, replace
+from time import sleep
+from unicodedata import normalize
 
-from flask import abort, Response, send_from_directory
+from flask import abort, request, current_app, Response, send_file
 from werkzeug.datastructures import FileStorage
+from werkzeug.urls import url_quote
 
-from models.employee_model import EmployeeType
+from models.attachment_model import AttachmentModel
 from repositories import attachment_repository, employee_repository, Attachment
-from . import default_page_size
-from .employee_service import prepare_employee
+from utils.serializer import compile_serializer
+from utils.config import ATTACHMENT_CACHE_MAX_AGE, ATTACHMENT_OFFLOAD_MODES
+from . import default_page_size, cache_service, job_service
+from .employee_service import serialize_employee, is_admin
+
+
+serialize_attachment = compile_serializer(
+    AttachmentModel(),
+    getters={"author": lambda attachment: attachment.author_ref, "size": lambda attachment: attachment.size or 0},
+    nested={"author": serialize_employee}
+)
 
 
 def prepare_attachment(attachment: Attachment) -> dict:
-    result = attachment.get_dict()
-    result["author"] = prepare_employee(attachment.author_ref)
-    result["size"] = attachment_repository.get_attachment_size(attachment.id)
-    result["filename"] = attachment_repository.get_attachment_path_and_filename(attachment.id)[1]
-    result["post"] = attachment.post
-    result["id"] = attachment.id
-    return result
+    return serialize_attachment(attachment)
 
 
 def save_attachment(employee_id: str, attachment_file: FileStorage) -> dict:
@@ -29,14 +37,56 @@ def save_attachment(employee_id: str, attachment_file: FileStorage) -> dict:
     return prepare_attachment(attachment_repository.add_attachment(attachment, attachment_file))
 
 
+def download_filename_options(filename: str) -> Dict[str, str]:
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        return {
+            "filename": normalize("NFKD", filename).encode("ascii", "ignore").decode(),
+            "filename*": "UTF-8''" + url_quote(filename, safe="")
+        }
+    return {"filename": filename}
+
+
 def get_attachment(attachment_id: str) -> Response:
-    if not attachment_repository.get_attachment_by_id(attachment_id):
+    attachment = attachment_repository.get_attachment_by_id(attachment_id)
+    if not attachment:
         abort(404, "Attachment not found")
-    return send_from_directory(
-        attachment_repository.path_from_id(attachment_id),
-        attachment_repository.get_attachment_path_and_filename(attachment_id)[1],
-        as_attachment=True
-    )
+    file_path = attachment_repository.get_attachment_file_path(attachment)
+    if not file_path or not path.isfile(file_path):
+        abort(404, "Attachment file not found")
+    filename = attachment.filename or path.basename(file_path)
+    offload = current_app.config.get("ATTACHMENT_OFFLOAD", "none")
+    if offload not in ATTACHMENT_OFFLOAD_MODES:
+        raise ValueError(f"Unknown attachment offload mode '{offload}'")
+    if offload == "none":
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            attachment_filename=filename,
+            mimetype=attachment.content_type,
+            conditional=False,
+            add_etags=False,
+            cache_timeout=ATTACHMENT_CACHE_MAX_AGE
+        )
+    else:
+        response = Response(mimetype=attachment.content_type or 'application/octet-stream')
+        response.headers.set("Content-Disposition", "attachment", **download_filename_options(filename))
+    # attachments are never changed after upload, so their versions are immutable
+    response.set_etag(attachment.checksum or attachment.id)
+    response.headers["Cache-Control"] = f"private, max-age={ATTACHMENT_CACHE_MAX_AGE}, immutable"
+    if offload == "none":
+        return response.make_conditional(request, accept_ranges=True, complete_length=attachment.size)
+    response.make_conditional(request)
+    if response.status_code == 200:
+        if offload == "x-accel-redirect":
+            response.headers["X-Accel-Redirect"] = url_quote(
+                current_app.config.get("ATTACHMENT_OFFLOAD_PREFIX", "/user_data/") +
+                path.relpath(file_path, current_app.config["UPLOAD_FOLDER"])
+            )
+        elif offload == "x-sendfile":
+            response.headers["X-Sendfile"] = file_path
+    return response
 
 
 def delete_attachment(employee_id: str, attachment_id: str) -> None:
@@ -44,10 +94,15 @@ def delete_attachment(employee_id: str, attachment_id: str) -> None:
     if not attachment:
         abort(404, "Attachment not found")
     if attachment.author != employee_id:
-        employee = employee_repository.get_employee_by_id(employee_id)
-        if not employee or employee.user_type != EmployeeType.admin.value:
+        if not is_admin(employee_id):
             abort(403, "You can not remove attachments of other users")
+    post = attachment.post_ref
+    if not attachment.blob:
+        # committed with the deletion, so the file is removed if and only if its attachment is
+        job_service.enqueue_with_changes("remove_legacy_attachment_files", attachment_id=attachment_id)
     attachment_repository.delete_attachment(attachment)
+    if post:
+        cache_service.invalidate_post(post.type, post.creator.subunit)
 
 
 def attachments_pages_count(employee_id: str) -> int:
@@ -66,3 +121,82 @@ def get_all_attachments(employee_id: str, page: int) -> Dict[str, List[Dict] or
         "attachments": [prepare_attachment(attachment) for attachment in attachments],
         "pages_count": pages_count
     }
+
+
+def backfill_attachments_metadata(batch_size: int = 256) -> Dict[str, int]:
+    """Fills filename, content type, size and checksum of attachments uploaded before they were stored in DB"""
+    result = {"filled": 0, "missing": 0}
+    attachments = attachment_repository.get_attachments_without_metadata(batch_size)
+    while attachments:
+        for attachment in attachments:
+            attachment_path, filename = attachment_repository.get_attachment_path_and_filename(attachment.id)
+            if filename:
+                attachment_repository.fill_attachment_metadata(attachment, path.join(attachment_path, filename))
+                result["filled"] += 1
+            else:
+                attachment.size = 0
+                result["missing"] += 1
+        attachment_repository.edit_attachments(attachments)
+        attachments = attachment_repository.get_attachments_without_metadata(batch_size)
+    return result
+
+
+@job_service.job(every=timedelta(minutes=10))
+def sweep_unreferenced_blobs(batch_size: int = 256) -> int:
+    """Removes blobs that are not referenced by attachments anymore"""
+    removed = 0
+    while True:
+        removed_in_batch = attachment_repository.sweep_unreferenced_blobs(batch_size)
+        removed += removed_in_batch
+        if removed_in_batch < batch_size:
+            return removed
+
+
+@job_service.job()
+def remove_legacy_attachment_files(attachment_id: str) -> None:
+    """Removes the file of a deleted attachment that was not moved to the blob store"""
+    attachment_repository.remove_attachment_file_by_id(attachment_id)
+
+
+def read_migration_checkpoint(checkpoint_path: str) -> str or None:
+    if not path.isfile(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r') as checkpoint:
+        return checkpoint.read().strip() or None
+
+
+def write_migration_checkpoint(checkpoint_path: str, last_id: str) -> None:
+    with open(checkpoint_path + ".tmp", 'w') as checkpoint:
+        checkpoint.write(last_id)
+    replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def migrate_attachments_to_blobs(
+        batch_size: int = 256, pause: float = 0.0, checkpoint_path: str = None, restart: bool = False
+) -> Dict[str, int]:
+    """
+    Moves files of attachments from the legacy per-attachment directories to the blob store.
+    Every attachment is committed separately, so it can run while the server works; the last processed ID
+    is saved to the checkpoint after each batch, so an interrupted migration continues from there.
+    Sleeps for 'pause' seconds between batches to limit the load
+    """
+    checkpoint_path = checkpoint_path or path.join(current_app.config["UPLOAD_FOLDER"], ".blobs_migration")
+    result = {"migrated": 0, "missing": 0}
+    last_id = None if restart else read_migration_checkpoint(checkpoint_path)
+    attachments = attachment_repository.get_legacy_attachments(last_id, batch_size)
+    while attachments:
+        for attachment in attachments:
+            file_path = attachment_repository.get_attachment_file_path(attachment)
+            if not file_path or not path.isfile(file_path):
+                result["missing"] += 1
+                continue
+            if not attachment.checksum:
+                attachment_repository.fill_attachment_metadata(attachment, file_path, attachment.content_type)
+            attachment_repository.migrate_attachment_to_blob(attachment, file_path)
+            result["migrated"] += 1
+        last_id = attachments[-1].id
+        write_migration_checkpoint(checkpoint_path, last_id)
+        if pause:
+            sleep(pause)
+        attachments = attachment_repository.get_legacy_attachments(last_id, batch_size)
+    return result
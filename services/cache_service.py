@@ -0,0 +1,82 @@
+from typing import Callable, Iterable, TypeVar
+
+from flask import current_app
+
+from repositories import primary_reads
+from utils.cache import CacheBackend, NoCache, create_cache
+
+
+T = TypeVar('T')
+
+cache: CacheBackend or None = None
+
+all_posts_tag = "posts"
+archive_tag = "archive"
+posts_written_key = "written:posts"
+
+
+def get_cache() -> CacheBackend:
+    global cache
+    if cache is None:
+        cache = create_cache(
+            current_app.config.get("FEED_CACHE_BACKEND", "memory"),
+            current_app.config.get("FEED_CACHE_MAX_ENTRIES", 1024),
+            current_app.config.get("FEED_CACHE_PATH")
+        )
+    return cache
+
+
+def feed_tag(post_type: int, subunit_id: str = None) -> str:
+    return f"feed:{post_type}:{subunit_id or ''}"
+
+
+def cached(tag: str, params: Iterable, producer: Callable[[], T]) -> T:
+    """
+    Returns the cached result of the producer or calls it and caches the result.
+    Entries are invalidated by bumping the generation of their tag or the generation of all posts
+    """
+    backend = get_cache()
+    key = str.join(':', (
+        tag, str(backend.get_generation(all_posts_tag)), str(backend.get_generation(tag)), *(str(p) for p in params)
+    ))
+    result = backend.get(key)
+    if result is None:
+        if was_written(posts_written_key):
+            # replicas may not have the change that invalidated the entry yet, so it is refilled from the primary
+            with primary_reads():
+                result = producer()
+        else:
+            result = producer()
+        backend.set(key, result, current_app.config.get("FEED_CACHE_TTL", 60))
+    return result
+
+
+def invalidate_post(post_type: int, subunit_id: str, in_feed: bool = True, in_archive: bool = True) -> None:
+    """Invalidates pages that contain (or contained) a post of given type and author's subunit"""
+    backend = get_cache()
+    if in_feed:
+        backend.bump_generation(feed_tag(post_type))
+        backend.bump_generation(feed_tag(post_type, subunit_id))
+    if in_archive:
+        backend.bump_generation(archive_tag)
+    mark_written(posts_written_key)
+
+
+def invalidate_all() -> None:
+    get_cache().bump_generation(all_posts_tag)
+    mark_written(posts_written_key)
+
+
+def written_key(employee_id: str) -> str:
+    return f"written:employee:{employee_id}"
+
+
+def mark_written(key: str) -> None:
+    """Makes reads that depend on the key go to the primary for 'READ_YOUR_WRITES_SECONDS' (replicas may lag)"""
+    get_cache().set_mark(key, True, current_app.config.get("READ_YOUR_WRITES_SECONDS", 10))
+
+
+def was_written(key: str) -> bool:
+    backend = get_cache()
+    # without a cache backend writes can not be tracked, so they are assumed to be recent
+    return isinstance(backend, NoCache) or bool(backend.get_mark(key))
@@ -1,15 +1,27 @@
-from typing import List, Iterable
+from typing import List, Iterable, Dict, Tuple, IO
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from uuid import UUID
+import csv
+import json
+import re
 
 import bcrypt
-from flask import abort
-from flask_jwt_extended import create_access_token, create_refresh_token
+from flask import Flask, abort, current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, get_jwt_claims
 
 from repositories import employee_repository, subunit_repository, Employee
-from models.employee_model import EmployeeType
-from . import any_non_nones
+from models import EMAIL_PATTERN
+from models.employee_model import EmployeeType, FullEmployeeModel
+from utils.serializer import compile_serializer
+from utils.config import (MAX_IMPORT_ROWS, PASSWORD_HASHING_WORKERS, PERMISSIONS_CACHE_TTL,
+                          PERMISSIONS_CACHE_MAX_ENTRIES)
+from utils.cache import MemoryCache
+from utils.executor import BoundedExecutor, ExecutorBusy
+from . import any_non_nones, cache_service, make_etag
 
 
-def check_password(password: str):
+def password_error(password: str) -> str or None:
     letters = bytes(range(b'a'[0], b'z'[0]+1)).decode()
     lower = False
     upper = False
@@ -28,34 +40,182 @@ def check_password(password: str):
             check = True
             digit = True
         if not check:
-            abort(422, f"Password cannot contain symbols like this: '{letter}'")
+            return f"Password cannot contain symbols like this: '{letter}'"
     if not lower:
-        abort(422, "Password must contain at least one lowercase letter")
+        return "Password must contain at least one lowercase letter"
     if not upper:
-        abort(422, "Password must contain at least one uppercase letter")
+        return "Password must contain at least one uppercase letter"
     if not digit:
-        abort(422, "Password must contain at least one digit")
+        return "Password must contain at least one digit"
+    return None
+
+
+def check_password(password: str):
+    error = password_error(password)
+    if error:
+        abort(422, error)
+
+
+password_executor: BoundedExecutor or None = None
+rehash_executor: BoundedExecutor or None = None
+
+
+def get_password_executor() -> BoundedExecutor:
+    """
+    Pool that checks passwords of logins, so at most BCRYPT_WORKERS threads of the process burn CPU on bcrypt.
+    Every login in the pool holds its request thread, so BCRYPT_WORKERS + BCRYPT_QUEUE_LIMIT is kept above
+    the threads of a gunicorn worker (--threads in Dockerfile.api): concurrent logins of a process wait for a free
+    worker instead of getting 503, ExecutorBusy is raised only when the pool gets more work than the request threads
+    """
+    global password_executor
+    if password_executor is None:
+        password_executor = BoundedExecutor(
+            current_app.config.get("BCRYPT_WORKERS", 2), current_app.config.get("BCRYPT_QUEUE_LIMIT", 2), "bcrypt"
+        )
+    return password_executor
+
+
+def get_rehash_executor() -> BoundedExecutor:
+    """
+    One thread apart from the login pool for rehashes after logins: a rehash never takes the slot of a login,
+    and while one runs the next ones are refused (and skipped until a later login of the employee)
+    """
+    global rehash_executor
+    if rehash_executor is None:
+        rehash_executor = BoundedExecutor(1, 0, "bcrypt-rehash")
+    return rehash_executor
+
+
+def bcrypt_cost() -> int:
+    return current_app.config.get("BCRYPT_COST", 12)
+
+
+def hash_cost(password_hash: str) -> int or None:
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def hash_password(password: str, cost: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(cost)).decode()
+
+
+def check_password_hash(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def rehash_password(app: Flask, employee_id: str, password: str, cost: int) -> None:
+    """Moves the password hash to the given cost, runs on the rehash pool after the login is answered"""
+    password_hash = hash_password(password, cost)
+    with app.app_context():
+        try:
+            employee_repository.set_password_hash(employee_id, password_hash)
+        except Exception:
+            app.logger.exception("Can not store the rehashed password of %s", employee_id)
+
+
+def hash_passwords(
+        passwords: Iterable[str], workers: int = PASSWORD_HASHING_WORKERS, executor: BoundedExecutor = None
+) -> List[str]:
+    """
+    Hashes the passwords on a pool of 'workers' threads (bcrypt releases the GIL while hashing), or one at a time
+    on the given shared pool. Raises ExecutorBusy if the shared pool refuses a password
+    """
+    cost = bcrypt_cost()
+    if executor:
+        return [executor.run(hash_password, password, cost) for password in passwords]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda password: hash_password(password, cost), passwords))
+
+
+def employee_type_name(employee: Employee) -> str or int:
+    try:
+        return EmployeeType(employee.user_type).name
+    except ValueError:
+        return employee.user_type
+
+
+serialize_employee = compile_serializer(FullEmployeeModel(), getters={"user_type": employee_type_name})
+
+# employee ID: (user type, fired flag, permission version), per process
+permissions_cache = MemoryCache(PERMISSIONS_CACHE_MAX_ENTRIES)
+
+
+def permission_version_key(employee_id: str) -> str:
+    return f"permission_version:{employee_id}"
+
+
+def known_permission_version(employee_id: str) -> int or None:
+    """
+    The newest permission version of the employee known without the database: the one written to the shared cache
+    by edit_employee in the last PERMISSIONS_CACHE_TTL seconds or the one of the access token of the employee
+    """
+    versions = [cache_service.get_cache().get_mark(permission_version_key(employee_id))]
+    if get_jwt_identity() == employee_id:
+        versions.append(get_jwt_claims().get("perm_version"))
+    versions = [version for version in versions if isinstance(version, int)]
+    return max(versions) if versions else None
+
+
+def get_permissions(employee_id: str) -> Tuple[int, bool, int] or None:
+    """
+    User type, fired flag and permission version of the employee, cached in the process for PERMISSIONS_CACHE_TTL
+    seconds. An entry older than the known permission version is fetched again, so a change made by edit_employee
+    is seen by other processes at once if FEED_CACHE_BACKEND is shared by them ('sqlite'), otherwise when the entry
+    expires or when the employee comes with a token issued after the change
+    """
+    permissions = permissions_cache.get(employee_id)
+    if permissions is not None:
+        known_version = known_permission_version(employee_id)
+        if known_version is not None and known_version > permissions[2]:
+            permissions = None
+    if permissions is None:
+        permissions = employee_repository.get_employee_permissions(employee_id)
+        if permissions is None:
+            return None
+        permissions_cache.set(employee_id, permissions, PERMISSIONS_CACHE_TTL)
+    return permissions
+
+
+def employee_type(employee_id: str) -> EmployeeType or None:
+    """Type of the employee for permission checks, None if the employee does not exist or is fired"""
+    permissions = get_permissions(employee_id)
+    if not permissions or permissions[1]:
+        return None
+    return EmployeeType(permissions[0])
+
+
+def is_admin(employee_id: str) -> bool:
+    return employee_type(employee_id) == EmployeeType.admin
+
+
+def is_moderator(employee_id: str) -> bool:
+    """Moderators and admins"""
+    return employee_type(employee_id) in (EmployeeType.moderator, EmployeeType.admin)
+
+
+def create_tokens(employee: Employee) -> Dict[str, str]:
+    """Access and refresh tokens, the access token carries the role and the permission version of the employee"""
+    claims = {"role": employee_type_name(employee), "perm_version": employee.permission_version}
+    return {
+        "access_token": create_access_token(identity=employee.id, user_claims=claims),
+        "refresh_token": create_refresh_token(identity=employee.id),
+        "user_id": employee.id
+    }
 
 
 def prepare_employee(employee: Employee, renew: bool = False) -> dict:
     if renew:
         employee = employee_repository.get_employee_by_email(employee.email)
-    result = employee.get_dict()
-    try:
-        result["user_type"] = EmployeeType(employee.user_type).name
-    except ValueError:
-        pass
-    if result.get("password_hash"):
-        del result["password_hash"]
-    return result
+    return serialize_employee(employee)
 
 
 def register_employee(
         registrar_id: str, email: str, full_name: str, subunit: str, user_type: int, password: str, **kwargs
 ) -> dict:
     check_password(password)
-    registrar = employee_repository.get_employee_by_id(registrar_id)
-    if not registrar or registrar.user_type != EmployeeType.admin.value:
+    if not is_admin(registrar_id):
         abort(403, "Non-admins can not register new employees")
     if employee_repository.get_employee_by_email(email):
         abort(409, "User with this email already exists")
@@ -66,7 +226,7 @@ def register_employee(
     employee.full_name = full_name
     employee.subunit = subunit
     employee.user_type = EmployeeType[user_type].value
-    employee.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(12)).decode()
+    employee.password_hash = hash_password(password, bcrypt_cost())
     return prepare_employee(employee_repository.add_or_edit_employee(employee), renew=True)
 
 
@@ -74,13 +234,35 @@ def get_token(email: str, password: str, **kwargs):
     employee = employee_repository.get_employee_by_email(email)
     if not employee:
         abort(404, "User not found")
-    if not bcrypt.checkpw(password.encode('utf-8'), employee.password_hash.encode('utf-8')):
-        abort(401, "Invalid credentials given")
-    return {
-        "access_token": create_access_token(identity=employee.id),
-        "refresh_token": create_refresh_token(identity=employee.id),
-        "user_id": employee.id
-    }
+    try:
+        if not get_password_executor().run(check_password_hash, password, employee.password_hash):
+            abort(401, "Invalid credentials given")
+    except ExecutorBusy:
+        abort(503, "Too many logins at the moment, please try again in a few seconds")
+    cost = bcrypt_cost()
+    if hash_cost(employee.password_hash) != cost:
+        # the password is known only now, so hashes are moved to the configured cost on logins. The rehash is not
+        # waited for, but it is not put into the job queue either (the queue would store the password in its
+        # arguments); it is skipped until a later login if the rehash pool is busy
+        try:
+            get_rehash_executor().submit(
+                rehash_password, current_app._get_current_object(), employee.id, password, cost
+            )
+        except ExecutorBusy:
+            pass
+    return create_tokens(employee)
+
+
+def refresh_tokens(employee_id: str) -> Dict[str, str]:
+    employee = employee_repository.get_employee_by_id(employee_id)
+    if not employee:
+        abort(401, "User not found")
+    return create_tokens(employee)
+
+
+def get_employee_etag(employee_id: str) -> str or None:
+    version = employee_repository.get_employee_version(employee_id)
+    return make_etag(employee_id, version) if version else None
 
 
 def get_employee(employee_id: str) -> dict:
@@ -97,8 +279,7 @@ def edit_employee(
 ) -> dict:
     if not any_non_nones((email, full_name, subunit, fired, user_type)):
         abort(422, "You must specify at least one field to edit")
-    editor = employee_repository.get_employee_by_id(editor_id)
-    if not editor or editor.user_type != EmployeeType.admin.value:
+    if not is_admin(editor_id):
         abort(403, "Non-admins can not edit employees")
     if subunit and not subunit_repository.get_subunit_by_id(subunit):
         abort(404, "Subunit not found")
@@ -109,11 +290,23 @@ def edit_employee(
         abort(409, "User with this email already exists")
     for existing, new in (('email', email), ('full_name', full_name), ('subunit', subunit)):
         setattr(employee, existing, new or getattr(employee, existing))
+    permissions = employee.user_type, employee.fired
     if user_type is not None:
         employee.user_type = EmployeeType[user_type].value
     if fired is not None:
         employee.fired = fired
-    return prepare_employee(employee_repository.add_or_edit_employee(employee), renew=True)
+    if (employee.user_type, employee.fired) != permissions:
+        employee.permission_version += 1
+    employee_repository.add_or_edit_employee(employee)
+    permissions_cache.set(
+        employee.id, (employee.user_type, employee.fired, employee.permission_version), PERMISSIONS_CACHE_TTL
+    )
+    # older entries of other processes expire by then anyway
+    cache_service.get_cache().set_mark(
+        permission_version_key(employee.id), employee.permission_version, PERMISSIONS_CACHE_TTL
+    )
+    cache_service.invalidate_all()
+    return prepare_employee(employee, renew=True)
 
 
 def get_fired_moderators(subunit_id: str, types: Iterable[EmployeeType]) -> List[dict]:
@@ -124,3 +317,108 @@ def get_fired_moderators(subunit_id: str, types: Iterable[EmployeeType]) -> List
 
 def get_multiple_employees(employee_ids: Iterable[str]) -> List[dict]:
     return [prepare_employee(employee) for employee in employee_repository.get_employee_by_id_list(employee_ids)]
+
+
+import_fields = ("email", "full_name", "subunit", "user_type", "password")
+
+
+class ImportConflict(Exception):
+    """Some of the employees were added or changed during the import, so none of them were imported"""
+
+
+def parse_import_rows(data: str, data_format: str) -> List[dict or str]:
+    """Rows of CSV (with a header) or NDJSON data, a row that can not be parsed is replaced with the error"""
+    if data_format == "csv":
+        return list(csv.DictReader(StringIO(data)))
+    rows = []
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            rows.append("Incorrect JSON")
+            continue
+        rows.append(row if isinstance(row, dict) else "Row must be a JSON object")
+    return rows
+
+
+def import_row_error(row: dict) -> str or None:
+    for field in import_fields:
+        if not isinstance(row.get(field), str) or not row[field]:
+            return f"Field '{field}' must be a non-empty string"
+    if not 5 <= len(row["email"]) <= 256 or not re.fullmatch(EMAIL_PATTERN, row["email"]):
+        return "Incorrect email"
+    if not 2 <= len(row["full_name"]) <= 512:
+        return "Full name must be from 2 to 512 characters long"
+    try:
+        UUID(row["subunit"])
+    except ValueError:
+        return "Incorrect subunit ID"
+    if row["user_type"] not in EmployeeType.__members__:
+        return f"Incorrect user type '{row['user_type']}'"
+    if not 8 <= len(row["password"]) <= 64:
+        return "Password must be from 8 to 64 characters long"
+    return password_error(row["password"])
+
+
+def import_employees(
+        rows: List[dict or str], hashing_workers: int = PASSWORD_HASHING_WORKERS,
+        hashing_executor: BoundedExecutor = None
+) -> Dict[str, int or List[dict]]:
+    """
+    Validates all the rows, then hashes passwords of the valid ones (see hash_passwords) and loads them
+    with one COPY. Rows are numbered from 1 (the CSV header is not counted), invalid rows are reported and skipped.
+    Raises ImportConflict if the COPY clashes with concurrent changes of employees
+    """
+    errors = []
+    valid_rows = {}
+    for number, row in enumerate(rows, 1):
+        error = row if isinstance(row, str) else import_row_error(row)
+        if not error and row["email"] in valid_rows:
+            error = f"Email is already used in row {valid_rows[row['email']][0]}"
+        if error:
+            email = row.get("email") if isinstance(row, dict) else None
+            errors.append({"row": number, "email": email if isinstance(email, str) else None, "error": error})
+        else:
+            valid_rows[row["email"]] = number, row
+    existing_emails = employee_repository.get_existing_emails(valid_rows.keys())
+    existing_subunits = subunit_repository.get_existing_subunit_ids({row["subunit"] for _, row in valid_rows.values()})
+    for email, (number, row) in list(valid_rows.items()):
+        if email in existing_emails:
+            errors.append({"row": number, "email": email, "error": "User with this email already exists"})
+        elif row["subunit"] not in existing_subunits:
+            errors.append({"row": number, "email": email, "error": "Subunit not found"})
+        else:
+            continue
+        del valid_rows[email]
+    importing = [row for _, row in valid_rows.values()]
+    password_hashes = hash_passwords((row["password"] for row in importing), hashing_workers, hashing_executor)
+    if importing and not employee_repository.copy_employees(
+        (row["email"], row["full_name"], row["subunit"], EmployeeType[row["user_type"]].value, password_hash)
+        for row, password_hash in zip(importing, password_hashes)
+    ):
+        raise ImportConflict()
+    errors.sort(key=lambda error: error["row"])
+    return {"imported": len(importing), "errors": errors}
+
+
+def import_employees_file(importer_id: str, file: IO[bytes], data_format: str) -> Dict[str, int or List[dict]]:
+    """
+    Import through HTTP: the file is read only for admins and limited to MAX_IMPORT_ROWS, passwords are hashed
+    one at a time on the login pool, so an import takes no more bcrypt CPU of the web process than a login does.
+    Bulk loads go to 'import-employees'
+    """
+    if not is_admin(importer_id):
+        abort(403, "Non-admins can not import employees")
+    try:
+        rows = parse_import_rows(file.read().decode('utf-8-sig'), data_format)
+    except (UnicodeDecodeError, csv.Error):
+        abort(400, f"Can not parse the file as {data_format.upper()}")
+    if len(rows) > MAX_IMPORT_ROWS:
+        abort(413, f"Can not import more than {MAX_IMPORT_ROWS} employees at a time, bigger files are imported "
+                   f"with the 'import-employees' command")
+    try:
+        return import_employees(rows, hashing_executor=get_password_executor())
+    except ExecutorBusy:
+        abort(503, "Too many logins at the moment, please try again in a few seconds")
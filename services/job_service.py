@@ -0,0 +1,162 @@
+from typing import Callable, Dict, List, Tuple
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+from traceback import format_exc
+
+from flask import current_app
+
+from repositories import job_repository, lock_repository, db
+from models.job_model import JobStatus
+from utils.config import (JOB_POLL_INTERVAL, JOB_SCHEDULE_INTERVAL, JOB_LOCK_SECONDS, JOB_RETRY_BASE_DELAY,
+                          JOB_RETRY_MAX_DELAY, JOB_RETENTION_DAYS)
+
+
+handlers: Dict[str, Callable] = {}
+
+# name: (period, offset of runs from the midnight UTC, max attempts)
+periodic_jobs: Dict[str, Tuple[timedelta, timedelta, int]] = {}
+
+
+def job(every: timedelta = None, offset: timedelta = timedelta(), max_attempts: int = 5):
+    """
+    Registers the function as a handler of jobs named after it; jobs are run by worker.py with their arguments.
+    If 'every' is given, the job is also enqueued by the scheduler once per period
+    """
+    def decorator(func: Callable) -> Callable:
+        handlers[func.__name__] = func
+        if every:
+            periodic_jobs[func.__name__] = every, offset, max_attempts
+        return func
+    return decorator
+
+
+def enqueue(name: str, **arguments) -> None:
+    """Adds the job to the queue, the arguments must be serializable to JSON"""
+    if name not in handlers:
+        raise LookupError(f"Unknown job '{name}'")
+    job_repository.enqueue_job(name, arguments)
+
+
+def enqueue_with_changes(name: str, **arguments) -> None:
+    """
+    Adds the job to the current transaction without committing it, so the job is enqueued
+    only when the changes it belongs to are committed (by the caller)
+    """
+    if name not in handlers:
+        raise LookupError(f"Unknown job '{name}'")
+    job_repository.add_job(name, arguments)
+
+
+def retry_delay(attempts: int) -> int:
+    return min(JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+
+
+def run_next_job() -> bool:
+    """Claims and runs one due job, retries it later with exponential backoff if it fails; False if there is none"""
+    claimed = job_repository.claim_job(JOB_LOCK_SECONDS)
+    if not claimed:
+        return False
+    job_id, name, arguments, attempts, max_attempts = claimed
+    started = monotonic()
+    try:
+        if name not in handlers:
+            raise LookupError(f"Unknown job '{name}'")
+        if attempts > max_attempts:
+            raise RuntimeError("The job was abandoned by its workers too many times")
+        handlers[name](**arguments)
+    except Exception:
+        db.session.rollback()
+        error = format_exc()
+        if attempts < max_attempts and name in handlers:
+            delay = retry_delay(attempts)
+            job_repository.finish_job(job_id, JobStatus.queued, error, datetime.utcnow() + timedelta(seconds=delay))
+            current_app.logger.warning(
+                "Job %s (%s) failed, attempt %d of %d, retrying in %d s:\n%s",
+                name, job_id, attempts, max_attempts, delay, error
+            )
+        else:
+            job_repository.finish_job(job_id, JobStatus.failed, error)
+            current_app.logger.error("Job %s (%s) failed after %d attempts:\n%s", name, job_id, attempts, error)
+        return True
+    job_repository.finish_job(job_id, JobStatus.done)
+    current_app.logger.info("Job %s (%s) is done in %.3f s", name, job_id, monotonic() - started)
+    return True
+
+
+def current_run(every: timedelta, offset: timedelta, now: datetime) -> datetime:
+    epoch = datetime(1970, 1, 1) + offset
+    return epoch + (now - epoch) // every * every
+
+
+def schedule_periodic_jobs(now: datetime = None) -> int:
+    """
+    Enqueues the current run of every periodic job unless it was enqueued before (by its dedup key).
+    Only the process holding the scheduler lock does it, others return at once. Returns the count of enqueued jobs
+    """
+    with lock_repository.advisory_lock("job_scheduler") as leader:
+        if not leader:
+            return 0
+        now = now or datetime.utcnow()
+        enqueued = 0
+        for name, (every, offset, max_attempts) in periodic_jobs.items():
+            run_at = current_run(every, offset, now)
+            enqueued += job_repository.enqueue_job(name, {}, run_at, f"{name}@{run_at.isoformat()}", max_attempts)
+        return enqueued
+
+
+def pause(seconds: float, should_stop: Callable[[], bool]) -> None:
+    """Sleeps for 'seconds', but wakes up every JOB_POLL_INTERVAL to return at once if the worker is stopping"""
+    wake_at = monotonic() + seconds
+    while not should_stop() and monotonic() < wake_at:
+        sleep(min(JOB_POLL_INTERVAL, wake_at - monotonic()))
+
+
+def run_worker(should_stop: Callable[[], bool]) -> None:
+    """
+    Runs due jobs one by one and schedules periodic jobs until 'should_stop' returns True.
+    Errors of the queue itself (e.g. a lost database connection) are logged and retried with backoff
+    """
+    next_scheduling = 0.0
+    failures = 0
+    while not should_stop():
+        try:
+            if monotonic() >= next_scheduling:
+                schedule_periodic_jobs()
+                next_scheduling = monotonic() + JOB_SCHEDULE_INTERVAL
+            found = run_next_job()
+            failures = 0
+        except Exception:
+            # the connection may be broken, so it is discarded with the session rather than rolled back
+            db.session.remove()
+            failures += 1
+            delay = min(JOB_POLL_INTERVAL * 2 ** failures, JOB_SCHEDULE_INTERVAL)
+            current_app.logger.exception("Job queue is unavailable (failure %d), retrying in %.1f s", failures, delay)
+            pause(delay, should_stop)
+            continue
+        if not found:
+            sleep(JOB_POLL_INTERVAL)
+
+
+@job(every=timedelta(days=1), offset=timedelta(hours=3))
+def prune_jobs(batch_size: int = 1000) -> int:
+    """Removes jobs finished more than JOB_RETENTION_DAYS ago"""
+    finished_before = datetime.utcnow() - timedelta(days=JOB_RETENTION_DAYS)
+    removed = 0
+    while True:
+        removed_in_batch = job_repository.prune_jobs(finished_before, batch_size)
+        removed += removed_in_batch
+        if removed_in_batch < batch_size:
+            return removed
+
+
+def get_jobs_stats() -> List[Dict[str, str or int]]:
+    now = datetime.utcnow()
+    return [
+        {
+            "name": name,
+            "status": JobStatus(status).name,
+            "count": count,
+            "lag": max((now - earliest_run).total_seconds(), 0) if status == JobStatus.queued.value else None
+        }
+        for name, status, count, earliest_run in job_repository.get_jobs_stats()
+    ]
@@ -0,0 +1,14 @@
+from typing import Dict
+
+from flask import abort
+
+from repositories import db
+from utils.database import pool_metrics
+from .employee_service import is_admin
+
+
+def get_db_pool_metrics(employee_id: str) -> Dict[str, int or float or dict]:
+    """Metrics of the connection pool of the process that handles the request (every worker has its own pool)"""
+    if not is_admin(employee_id):
+        abort(403, "Non-admins can not get metrics")
+    return pool_metrics.snapshot(db.engine.pool)
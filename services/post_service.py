@@ -1,15 +1,58 @@
-from typing import List, Dict, Set
-from datetime import date, datetime, timedelta
-from uuid import uuid4
+import re
+from typing import List, Dict, Set, Tuple, Iterator
+from datetime import date, datetime, timedelta, time
+from decimal import Decimal
+from uuid import uuid4, UUID
 from math import ceil, floor
+from time import monotonic
+
+from flask import abort, current_app
+
+from repositories import (post_repository, attachment_repository, employee_repository, subunit_repository,
+                          lock_repository, Post, db)
+from models.post_model import PostStatus, PostType, PostFullModel, PostSearchResultModel, PostExportModel
+from utils.config import MAX_TOP_POSTS_COUNT, MAX_SEARCH_TERMS, MAX_BATCH_SIZE, ARCHIVE_BATCH_SIZE
+from utils.serializer import compile_serializer
+from . import (attachment_service, cache_service, job_service, any_non_nones, default_page_size,
+               encode_cursor, encode_rank_cursor, make_etag, get_uuid)
+from .employee_service import serialize_employee, is_admin, is_moderator
+
+
+serialize_post = compile_serializer(
+    PostFullModel(),
+    getters={
+        "post_type": lambda post: PostType(post.type).name,
+        "status": lambda post: PostStatus(post.status).name,
+        "author": lambda post: post.creator,
+        "approved_by": lambda post: post.approver
+    },
+    nested={
+        "author": serialize_employee,
+        "approved_by": serialize_employee,
+        "attachments": attachment_service.serialize_attachment
+    }
+)
+
+serialize_exported_post = compile_serializer(
+    PostExportModel(),
+    getters={
+        "post_type": lambda post: PostType(post.type).name,
+        "status": lambda post: PostStatus(post.status).name,
+        "attachments": lambda post: [attachment.id for attachment in post.attachments]
+    }
+)
 
-from flask import abort
+serialize_search_result = compile_serializer(
+    PostSearchResultModel(),
+    getters={
+        "post_type": lambda row: PostType(row.type).name,
+        "status": lambda row: PostStatus(row.status).name,
+        "author": lambda row: row.Employee
+    },
+    nested={"author": serialize_employee}
+)
 
-from repositories import post_repository, attachment_repository, employee_repository, subunit_repository, Post, db
-from models.post_model import PostStatus, PostType
-from models.employee_model import EmployeeType
-from . import attachment_service, any_non_nones, default_page_size
-from .employee_service import prepare_employee
+public_statuses = {PostStatus.posted, PostStatus.archived}
 
 
 def prepare_post(post: Post, refresh: bool = True) -> dict:
@@ -17,25 +60,23 @@ def prepare_post(post: Post, refresh: bool = True) -> dict:
         return {}
     if refresh:
         db.session.refresh(post)
-    result = post.get_dict()
-    result['post_type'] = PostType(post.type).name
-    result['status'] = PostStatus(post.status).name
-    result['size'] = calculate_post_size(post)
-    result['attachments'] = [attachment_service.prepare_attachment(attachment) for attachment in post.attachments]
-    result['author'] = prepare_employee(post.creator)
-    result['approved_by'] = prepare_employee(post.approver) if post.approver else None
-    return result
+    return serialize_post(post)
 
 
 def prepare_posts_list(posts: List[Post]) -> List[dict]:
     return [prepare_post(post, refresh=False) for post in posts]
 
 
-def calculate_post_size(post: Post) -> int:
-    size = len(post.body.encode())
-    size += len(post.title.encode())
-    size += sum(attachment_repository.get_attachment_size(attachment.id) for attachment in post.attachments)
-    return size
+def invalidate_post_pages(post_type: int, subunit_id: str, statuses: Set[int]) -> None:
+    cache_service.invalidate_post(
+        post_type, subunit_id, PostStatus.posted.value in statuses, PostStatus.archived.value in statuses
+    )
+
+
+def next_page_cursor(posts: List[Post]) -> str or None:
+    if len(posts) < default_page_size:
+        return None
+    return encode_cursor(posts[-1].created_on, posts[-1].id)
 
 
 def archive_pages_count():
@@ -57,6 +98,27 @@ def get_post(post_id: str) -> dict:
     return prepare_post(post, refresh=False)
 
 
+def get_post_etag(post_id: str) -> str or None:
+    version = post_repository.get_post_version(post_id)
+    return make_etag(post_id, *version) if version else None
+
+
+def get_posts_etag(request_key: str) -> str:
+    """ETag of a posts listing (the request key should identify the listing and its page)"""
+    return make_etag(request_key, *post_repository.get_posts_version())
+
+
+def update_posts_size(post_ids: List[str], previous_post_ids: List[str]) -> None:
+    """
+    Updates sizes of the posts and of the posts their attachments were taken from; pages with the latter
+    are invalidated here (and their monthly statistics are corrected by the trigger on the size)
+    """
+    post_repository.update_posts_size(post_ids + previous_post_ids)
+    for previous_post_id in previous_post_ids:
+        previous_post = post_repository.get_post_by_id(previous_post_id)
+        invalidate_post_pages(previous_post.type, previous_post.creator.subunit, {previous_post.status})
+
+
 def create_post(creator_id: str, title: str, body: str, post_type: str, attachments: List[str] = None, **kwargs) -> dict:
     if attachments and not attachment_repository.ensure_attachments_exist(attachments):
         abort(404, "Attachment not found")
@@ -66,16 +128,16 @@ def create_post(creator_id: str, title: str, body: str, post_type: str, attachme
     post.title = title
     post.body = body
     post.id = str(uuid4())
-    creator = employee_repository.get_employee_by_id(creator_id)
-    if not creator or creator.user_type == EmployeeType.user.value:
+    if not is_moderator(creator_id):
         post.status = PostStatus.under_consideration.value
     else:
         post.status = PostStatus.posted.value
         post.published_on = datetime.utcnow() + timedelta(seconds=1)
         post.approved_by = creator_id
     post_repository.add_or_edit_post(post)
-    if attachments:
-        attachment_repository.add_attachments_to_post(post.id, attachments)
+    previous_post_ids = attachment_repository.add_attachments_to_post(post.id, attachments) if attachments else []
+    update_posts_size([post.id], previous_post_ids)
+    invalidate_post_pages(post.type, post.creator.subunit, {post.status})
     return get_post(post.id)
 
 
@@ -89,22 +151,26 @@ def edit_post(
     if not post:
         abort(404, "Post not found")
     if post.author != editor_id:
-        editor = employee_repository.get_employee_by_id(editor_id)
-        if not editor or editor.user_type != EmployeeType.admin.value:
+        if not is_admin(editor_id):
             abort(403, "Non-admins can not edit posts of other users")
     if post_type:
         try:
             post_type = PostType[post_type].value
         except KeyError:
             abort(400, "Incorrect post type")
+    old_type = post.type
     for existing, new in (('title', title), ('body', body), ('type', post_type)):
         setattr(post, existing, new or getattr(post, existing))
     post_repository.add_or_edit_post(post)
+    previous_post_ids = []
     if attachments is not None:
         current_attachments = [attachment.id for attachment in post.attachments]
         if current_attachments:
             attachment_repository.add_attachments_to_post(None, current_attachments)
-        attachment_repository.add_attachments_to_post(post.id, attachments)
+        previous_post_ids = attachment_repository.add_attachments_to_post(post.id, attachments)
+    update_posts_size([post.id], previous_post_ids)
+    for changed_type in {old_type, post.type}:
+        invalidate_post_pages(changed_type, post.creator.subunit, {post.status})
     return get_post(post.id)
 
 
@@ -112,9 +178,9 @@ def set_post_status(setter_id: str, post_id: str, status: PostStatus) -> dict:
     post = post_repository.get_post_by_id(post_id)
     if not post:
         abort(404, "Post not found")
-    editor = employee_repository.get_employee_by_id(setter_id)
-    if not editor or editor.user_type == EmployeeType.user.value:
+    if not is_moderator(setter_id):
         abort(403, "Non-(admins/moderators) can not change post statuses")
+    old_status = post.status
     if post.status != status.value:
         if status == PostStatus.archived:
             post.archived_on = datetime.utcnow()
@@ -124,7 +190,30 @@ def set_post_status(setter_id: str, post_id: str, status: PostStatus) -> dict:
         if post.status == PostStatus.archived.value:
             post.archived_on = datetime.utcnow() + timedelta(hours=4380)
         post.status = status.value
-    return prepare_post(post_repository.add_or_edit_post(post))
+    post_repository.add_or_edit_post(post)
+    invalidate_post_pages(post.type, post.creator.subunit, {old_status, post.status})
+    return prepare_post(post)
+
+
+def set_posts_status(setter_id: str, post_ids: List[str], status: PostStatus) -> Dict[str, List[Dict[str, str]]]:
+    """Changes status of many posts at once, returns what happened to each of them"""
+    if not 0 < len(post_ids) <= MAX_BATCH_SIZE:
+        abort(422, f"Count of posts must be between 1 and {MAX_BATCH_SIZE}")
+    post_ids = list(dict.fromkeys(str(UUID(get_uuid(post_id))) for post_id in post_ids))
+    if not is_moderator(setter_id):
+        abort(403, "Non-(admins/moderators) can not change post statuses")
+    changed = post_repository.set_posts_status(post_ids, status, setter_id)
+    changed_pages: Dict[Tuple[int, str], Set[int]] = {}
+    for post_id, old_status, post_type, subunit_id in changed:
+        changed_pages.setdefault((post_type, str(subunit_id)), {status.value}).add(old_status)
+    for (post_type, subunit_id), statuses in changed_pages.items():
+        invalidate_post_pages(post_type, subunit_id, statuses)
+    changed_ids = {str(post_id) for post_id, *_ in changed}
+    existing_ids = post_repository.get_existing_post_ids([post_id for post_id in post_ids if post_id not in changed_ids])
+    return {"results": [{
+        "id": post_id,
+        "outcome": "updated" if post_id in changed_ids else "unchanged" if post_id in existing_ids else "not_found"
+    } for post_id in post_ids]}
 
 
 def delete_post(deleter_id: str, post_id: str) -> None:
@@ -132,10 +221,41 @@ def delete_post(deleter_id: str, post_id: str) -> None:
     if not post:
         abort(404, "Post not found")
     if post.author != deleter_id:
-        editor = employee_repository.get_employee_by_id(deleter_id)
-        if not editor or editor.user_type == EmployeeType.user.value:
+        if not is_moderator(deleter_id):
             abort(403, "Non-(admins/moderators) can not delete posts of other users")
-    return post_repository.delete_post(post)
+    post_type, subunit_id, status = post.type, post.creator.subunit, post.status
+    post_repository.delete_post(post)
+    invalidate_post_pages(post_type, subunit_id, {status})
+
+
+@job_service.job(every=timedelta(days=1), offset=timedelta(hours=2))
+def archive_expired_posts(batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int or float] or None:
+    """
+    Archives expired posts batch by batch, only in one process at a time (returns None if it runs elsewhere).
+    Logs and returns the count of archived posts and batches and the duration
+    """
+    with lock_repository.advisory_lock("archive_expired_posts") as locked:
+        if not locked:
+            current_app.logger.info("Archivation of expired posts is already running in another process")
+            return None
+        started = monotonic()
+        result = {"archived": 0, "batches": 0}
+        invalidated = set()
+        while True:
+            archived = post_repository.archive_expired_posts(batch_size)
+            result["archived"] += len(archived)
+            result["batches"] += 1
+            for post_type, subunit_id in set(archived) - invalidated:
+                cache_service.invalidate_post(post_type, subunit_id)
+                invalidated.add((post_type, subunit_id))
+            if len(archived) < batch_size:
+                break
+        result["seconds"] = round(monotonic() - started, 3)
+        current_app.logger.info(
+            "Archived %d expired posts in %d batches in %.3f s",
+            result["archived"], result["batches"], result["seconds"]
+        )
+        return result
 
 
 def get_all_employee_posts(employee_id: str) -> List[dict]:
@@ -144,16 +264,27 @@ def get_all_employee_posts(employee_id: str) -> List[dict]:
     return prepare_posts_list(post_repository.get_posts_of_employee(employee_id))
 
 
+def get_biggest_posts(start: date, end: date, include_archived: bool, count: int) -> List[dict]:
+    if end < start:
+        abort(422, "End is earlier than start")
+    if not 0 < count <= MAX_TOP_POSTS_COUNT:
+        abort(422, f"Count must be between 1 and {MAX_TOP_POSTS_COUNT}")
+    return prepare_posts_list(post_repository.get_biggest_posts(
+        datetime.combine(start, time()), datetime.combine(end + timedelta(days=1), time()), include_archived, count
+    ))
+
+
 def get_biggest_post(day: date, include_archived: bool) -> dict:
-    posts_of_day = prepare_posts_list(post_repository.get_posts_by_date(day, include_archived))
+    posts_of_day = get_biggest_posts(day, day, include_archived, 1)
     if not posts_of_day:
         abort(404, "Post not found")
-    return max(posts_of_day, key=lambda post: post["size"])
+    return posts_of_day[0]
 
 
 def get_statistics(
-        start_year: int, start_month: int, end_year: int, end_month: int, subunit_ids: List[str] = None
-) -> Dict[str, Dict[str, Dict[str, int]]]:
+        start_year: int, start_month: int, end_year: int, end_month: int,
+        subunit_ids: List[str] = None, by_type: bool = False
+) -> Dict[str, Dict[str, int or Dict[str, int]]]:
     def calculate_iso_month(day: date) -> str:
         return str.join('-', day.isoformat().split('-')[:-1])
 
@@ -175,59 +306,162 @@ def get_statistics(
         current_year = (start_year + floor((start_month - 1 + month) / 12))
         months_full.append(date(current_year, current_month, 1))
     months = [calculate_iso_month(month) for month in months_full]
-    all_posts = post_repository.get_posts_by_period(start_date, end_date, subunit_ids)
     all_subunits = subunit_repository.get_subunits(subunit_ids)
+    subunit_names = {subunit.id: subunit.name for subunit in all_subunits}
     posts_by_months = {
         subunit.name: {
-            month: 0 for month in months
+            month: {post_type.name: 0 for post_type in PostType} if by_type else 0 for month in months
         } for subunit in all_subunits
     }
-    for post in all_posts:
-        month = calculate_iso_month(post.published_on.date())
-        posts_by_months[post.creator.subunit_ref.name][month] += 1
+    for subunit_id, post_type, month, count in post_repository.count_posts_by_months(start_date, end_date, subunit_ids):
+        if subunit_id not in subunit_names:
+            continue
+        subunit_months = posts_by_months[subunit_names[subunit_id]]
+        if by_type:
+            subunit_months[calculate_iso_month(month)][PostType(post_type).name] += count
+        else:
+            subunit_months[calculate_iso_month(month)] += count
     return posts_by_months
 
 
-def get_feed(post_type: PostType, page: int, subunit_id: str = None) -> Dict[str, int or dict]:
+def get_feed(
+        post_type: PostType, page: int, subunit_id: str = None, cursor: Tuple[datetime, str] = None
+) -> Dict[str, int or dict]:
     if (not subunit_id) and (post_type in (PostType.subunit_announcement, PostType.subunit_news)):
         abort(422, "You must specify subunit for this post type")
+    return cache_service.cached(
+        cache_service.feed_tag(post_type.value, subunit_id),
+        (page, cursor and encode_cursor(*cursor)),
+        lambda: build_feed(post_type, page, subunit_id, cursor)
+    )
+
+
+def build_feed(
+        post_type: PostType, page: int, subunit_id: str = None, cursor: Tuple[datetime, str] = None
+) -> Dict[str, int or dict]:
     pages_count = feed_pages_count(post_type, subunit_id)
-    if page <= pages_count:
-        posts = prepare_posts_list(
-            post_repository.get_posts(page, default_page_size, post_type, {PostStatus.posted}, subunit_id)
+    if cursor or page <= pages_count:
+        posts = post_repository.get_posts(
+            page, default_page_size, post_type, {PostStatus.posted}, subunit_id, cursor=cursor
         )
     else:
         posts = []
     return {
-        "posts": posts,
-        "pages_count": pages_count
+        "posts": prepare_posts_list(posts),
+        "pages_count": pages_count,
+        "next_cursor": next_page_cursor(posts)
     }
 
 
-def get_archived_posts(page: int) -> Dict[str, str or dict]:
+def get_archived_posts(page: int, cursor: Tuple[datetime, str] = None) -> Dict[str, str or dict]:
+    return cache_service.cached(
+        cache_service.archive_tag,
+        (page, cursor and encode_cursor(*cursor)),
+        lambda: build_archived_posts(page, cursor)
+    )
+
+
+def build_archived_posts(page: int, cursor: Tuple[datetime, str] = None) -> Dict[str, str or dict]:
     pages_count = archive_pages_count()
-    if page <= pages_count:
-        posts = prepare_posts_list(post_repository.get_archived_posts(page, default_page_size))
+    if cursor or page <= pages_count:
+        posts = post_repository.get_archived_posts(page, default_page_size, cursor)
     else:
         posts = []
     return {
-        "posts": posts,
-        "pages_count": pages_count
+        "posts": prepare_posts_list(posts),
+        "pages_count": pages_count,
+        "next_cursor": next_page_cursor(posts)
     }
 
 
-def get_all_posts(employee_id: str, page: int, posts_statuses: Set[PostStatus], reverse: bool = True) -> Dict[str, int or dict]:
-    moderator = employee_repository.get_employee_by_id(employee_id)
-    if not moderator or moderator.user_type == EmployeeType.user.value:
+def get_all_posts(
+        employee_id: str, page: int, posts_statuses: Set[PostStatus],
+        reverse: bool = True, cursor: Tuple[datetime, str] = None
+) -> Dict[str, int or dict]:
+    if not is_moderator(employee_id):
         abort(403, "You're not allowed to see this data")
     pages_count = moderation_pages_count(posts_statuses=posts_statuses)
-    if page <= pages_count:
-        posts = prepare_posts_list(post_repository.get_posts(
-            page, default_page_size, post_statuses=posts_statuses, oldest_first=reverse
-        ))
+    if cursor or page <= pages_count:
+        posts = post_repository.get_posts(
+            page, default_page_size, post_statuses=posts_statuses, oldest_first=reverse, cursor=cursor
+        )
     else:
         posts = []
     return {
-        "posts": posts,
-        "pages_count": pages_count
+        "posts": prepare_posts_list(posts),
+        "pages_count": pages_count,
+        "next_cursor": next_page_cursor(posts)
     }
+
+
+def build_ts_query(query: str) -> str:
+    """Matches posts containing all words of the query (each word is also matched as a prefix)"""
+    terms = re.findall(r"\w+", query)[:MAX_SEARCH_TERMS]
+    if not terms:
+        abort(422, "Search query must contain at least one word")
+    return str.join(' & ', (f"{term}:*" for term in terms))
+
+
+def search_posts(
+        employee_id: str, query: str, post_types: Set[PostType] = None, post_statuses: Set[PostStatus] = None,
+        subunit_id: str = None, start: date = None, end: date = None, cursor: Tuple[Decimal, str] = None,
+        total: str = None
+) -> Dict[str, List[dict] or str or int]:
+    """Page of the search results; their total count is given only if asked, 'exact' or 'estimate' (approximate)"""
+    post_statuses = post_statuses or {PostStatus.posted}
+    if not post_statuses.issubset(public_statuses):
+        if not is_moderator(employee_id):
+            abort(403, "You're not allowed to search posts of these statuses")
+    if start and end and end < start:
+        abort(422, "End is earlier than start")
+    if total not in (None, "exact", "estimate"):
+        abort(422, "Total must be 'exact' or 'estimate'")
+    ts_query = build_ts_query(query)
+    start = start and datetime.combine(start, time())
+    end = end and datetime.combine(end + timedelta(days=1), time())
+    rows = post_repository.search_posts(
+        ts_query, default_page_size, post_types, post_statuses, subunit_id, start, end, cursor
+    )
+    return {
+        "posts": [serialize_search_result(row) for row in rows],
+        "next_cursor": encode_rank_cursor(rows[-1].rank, rows[-1].id) if len(rows) == default_page_size else None,
+        "total": post_repository.count_search_results(
+            ts_query, post_types, post_statuses, subunit_id, start, end, estimate=total == "estimate"
+        ) if total else None
+    }
+
+
+def export_posts(
+        post_statuses: Set[PostStatus] = None, subunit_id: str = None, start: date = None, end: date = None,
+        after_id: str = None, embed: bool = False
+) -> Iterator[dict]:
+    """
+    Serialized posts to export (the oldest first), authors and attachments are embedded if 'embed' is set.
+    Arguments are checked at once and posts are read while the result is iterated;
+    an interrupted export is continued by passing the ID of the last exported post as 'after_id'
+    """
+    if start and end and end < start:
+        abort(422, "End is earlier than start")
+    cursor = None
+    if after_id:
+        post = post_repository.get_post_by_id(after_id)
+        if not post:
+            abort(404, "Post to continue the export after is not found")
+        cursor = post.created_on, post.id
+    serialize = serialize_post if embed else serialize_exported_post
+
+    def generate_export() -> Iterator[dict]:
+        for post in post_repository.iter_posts_for_export(
+            post_statuses or set(PostStatus), subunit_id,
+            start and datetime.combine(start, time()),
+            end and datetime.combine(end + timedelta(days=1), time()),
+            cursor, embed
+        ):
+            yield serialize(post)
+    return generate_export()
+
+
+def get_posts_export(exporter_id: str, *args, **kwargs) -> Iterator[dict]:
+    if not is_admin(exporter_id):
+        abort(403, "Non-admins can not export posts")
+    return export_posts(*args, **kwargs)
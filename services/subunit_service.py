@@ -3,9 +3,8 @@ from typing import List
 from flask import abort
 
 from repositories import subunit_repository, employee_repository, Subunit
-from models.employee_model import EmployeeType
-from . import any_non_nones
-from .employee_service import prepare_employee
+from . import any_non_nones, make_etag
+from .employee_service import prepare_employee, is_admin
 
 
 def prepare_subunit(subunit: Subunit) -> dict:
@@ -15,8 +14,7 @@ def prepare_subunit(subunit: Subunit) -> dict:
 
 
 def subunit_write_access(writer_id: str, leader_id: str) -> None:
-    writer = employee_repository.get_employee_by_id(writer_id)
-    if not writer or writer.user_type != EmployeeType.admin.value:
+    if not is_admin(writer_id):
         abort(403, "Non-admins can not create new subunits or edit existing ones")
 
 
@@ -59,6 +57,11 @@ def edit_subunit(
     return prepare_subunit(subunit_repository.add_or_edit_subunit(subunit))
 
 
+def get_subunit_etag(subunit_id: str) -> str or None:
+    version = subunit_repository.get_subunit_version(subunit_id)
+    return make_etag(subunit_id, *version) if version else None
+
+
 def get_subunit(subunit_id: str) -> dict:
     subunit = subunit_repository.get_subunit_by_id(subunit_id)
     if not subunit:
@@ -27,6 +27,321 @@ CREATE FUNCTION public.uuid() RETURNS uuid
 
 ALTER FUNCTION public.uuid() OWNER TO orgfeed_user;
 
+--
+-- Name: change_post_counter(smallint, smallint, uuid, integer); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.change_post_counter(post_type smallint, post_status smallint, post_author uuid, delta integer) RETURNS void
+    LANGUAGE sql
+    AS $$
+INSERT INTO public.post_counters (type, status, subunit, count)
+    SELECT post_type, post_status, employees.subunit, delta FROM public.employees WHERE employees.id = post_author
+ON CONFLICT (type, status, subunit) DO UPDATE SET count = post_counters.count + EXCLUDED.count
+$$;
+
+
+ALTER FUNCTION public.change_post_counter(post_type smallint, post_status smallint, post_author uuid, delta integer) OWNER TO orgfeed_user;
+
+--
+-- Name: posts_update_counters(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.posts_update_counters() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.type = NEW.type AND OLD.status = NEW.status AND OLD.author = NEW.author THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM public.change_post_counter(OLD.type, OLD.status, OLD.author, -1);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM public.change_post_counter(NEW.type, NEW.status, NEW.author, 1);
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+
+ALTER FUNCTION public.posts_update_counters() OWNER TO orgfeed_user;
+
+--
+-- Name: employees_move_post_counters(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.employees_move_post_counters() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    INSERT INTO public.post_counters (type, status, subunit, count)
+        SELECT posts.type, posts.status, OLD.subunit, -count(*) FROM public.posts WHERE posts.author = OLD.id
+        GROUP BY posts.type, posts.status
+    ON CONFLICT (type, status, subunit) DO UPDATE SET count = post_counters.count + EXCLUDED.count;
+    INSERT INTO public.post_counters (type, status, subunit, count)
+        SELECT posts.type, posts.status, NEW.subunit, count(*) FROM public.posts WHERE posts.author = NEW.id
+        GROUP BY posts.type, posts.status
+    ON CONFLICT (type, status, subunit) DO UPDATE SET count = post_counters.count + EXCLUDED.count;
+    RETURN NULL;
+END
+$$;
+
+
+ALTER FUNCTION public.employees_move_post_counters() OWNER TO orgfeed_user;
+
+--
+-- Name: attachments_update_counters(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.attachments_update_counters() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.author = NEW.author THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE public.attachment_counters SET count = count - 1 WHERE author = OLD.author;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        INSERT INTO public.attachment_counters (author, count) VALUES (NEW.author, 1)
+        ON CONFLICT (author) DO UPDATE SET count = attachment_counters.count + 1;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+
+ALTER FUNCTION public.attachments_update_counters() OWNER TO orgfeed_user;
+
+--
+-- Name: attachments_update_blob_refs(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.attachments_update_blob_refs() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.blob IS NOT DISTINCT FROM NEW.blob THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.blob IS NOT NULL THEN
+        UPDATE public.blobs SET ref_count = ref_count - 1 WHERE checksum = OLD.blob;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.blob IS NOT NULL THEN
+        UPDATE public.blobs SET ref_count = ref_count + 1 WHERE checksum = NEW.blob;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+
+ALTER FUNCTION public.attachments_update_blob_refs() OWNER TO orgfeed_user;
+
+--
+-- Name: rebuild_counters(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.rebuild_counters() RETURNS void
+    LANGUAGE sql
+    AS $$
+LOCK TABLE public.posts, public.employees, public.attachments, public.blobs IN SHARE MODE;
+DELETE FROM public.post_counters;
+INSERT INTO public.post_counters (type, status, subunit, count)
+    SELECT posts.type, posts.status, employees.subunit, count(*)
+    FROM public.posts JOIN public.employees ON employees.id = posts.author
+    GROUP BY posts.type, posts.status, employees.subunit;
+DELETE FROM public.attachment_counters;
+INSERT INTO public.attachment_counters (author, count)
+    SELECT attachments.author, count(*) FROM public.attachments GROUP BY attachments.author;
+UPDATE public.blobs SET ref_count = (SELECT count(*) FROM public.attachments WHERE attachments.blob = blobs.checksum);
+$$;
+
+
+ALTER FUNCTION public.rebuild_counters() OWNER TO orgfeed_user;
+
+--
+-- Name: change_post_stats(smallint, smallint, uuid, timestamp without time zone, integer, integer); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.change_post_stats(post_type smallint, post_status smallint, post_author uuid, post_published_on timestamp without time zone, post_size integer, delta integer) RETURNS void
+    LANGUAGE sql
+    AS $$
+INSERT INTO public.post_stats_monthly (subunit, post_type, month, count, bytes)
+    SELECT employees.subunit, post_type, date_trunc('month', post_published_on)::date, delta, delta * post_size
+    FROM public.employees
+    WHERE employees.id = post_author AND post_status IN (1, 2) AND post_published_on IS NOT NULL
+ON CONFLICT (subunit, post_type, month) DO UPDATE SET
+    count = post_stats_monthly.count + EXCLUDED.count,
+    bytes = post_stats_monthly.bytes + EXCLUDED.bytes
+$$;
+
+
+ALTER FUNCTION public.change_post_stats(post_type smallint, post_status smallint, post_author uuid, post_published_on timestamp without time zone, post_size integer, delta integer) OWNER TO orgfeed_user;
+
+--
+-- Name: posts_update_stats(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.posts_update_stats() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.type = NEW.type AND OLD.status = NEW.status AND OLD.author = NEW.author
+            AND OLD.published_on IS NOT DISTINCT FROM NEW.published_on AND OLD.size = NEW.size THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM public.change_post_stats(OLD.type, OLD.status, OLD.author, OLD.published_on, OLD.size, -1);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM public.change_post_stats(NEW.type, NEW.status, NEW.author, NEW.published_on, NEW.size, 1);
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+
+ALTER FUNCTION public.posts_update_stats() OWNER TO orgfeed_user;
+
+--
+-- Name: employees_move_post_stats(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.employees_move_post_stats() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    INSERT INTO public.post_stats_monthly (subunit, post_type, month, count, bytes)
+        SELECT OLD.subunit, posts.type, date_trunc('month', posts.published_on)::date, -count(*), -sum(posts.size)
+        FROM public.posts
+        WHERE posts.author = OLD.id AND posts.status IN (1, 2) AND posts.published_on IS NOT NULL
+        GROUP BY posts.type, date_trunc('month', posts.published_on)::date
+    ON CONFLICT (subunit, post_type, month) DO UPDATE SET
+        count = post_stats_monthly.count + EXCLUDED.count,
+        bytes = post_stats_monthly.bytes + EXCLUDED.bytes;
+    INSERT INTO public.post_stats_monthly (subunit, post_type, month, count, bytes)
+        SELECT NEW.subunit, posts.type, date_trunc('month', posts.published_on)::date, count(*), sum(posts.size)
+        FROM public.posts
+        WHERE posts.author = NEW.id AND posts.status IN (1, 2) AND posts.published_on IS NOT NULL
+        GROUP BY posts.type, date_trunc('month', posts.published_on)::date
+    ON CONFLICT (subunit, post_type, month) DO UPDATE SET
+        count = post_stats_monthly.count + EXCLUDED.count,
+        bytes = post_stats_monthly.bytes + EXCLUDED.bytes;
+    RETURN NULL;
+END
+$$;
+
+
+ALTER FUNCTION public.employees_move_post_stats() OWNER TO orgfeed_user;
+
+--
+-- Name: rebuild_post_stats_monthly(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.rebuild_post_stats_monthly() RETURNS void
+    LANGUAGE sql
+    AS $$
+LOCK TABLE public.posts, public.employees IN SHARE MODE;
+DELETE FROM public.post_stats_monthly;
+INSERT INTO public.post_stats_monthly (subunit, post_type, month, count, bytes)
+    SELECT employees.subunit, posts.type, date_trunc('month', posts.published_on)::date, count(*), sum(posts.size)
+    FROM public.posts JOIN public.employees ON employees.id = posts.author
+    WHERE posts.status IN (1, 2) AND posts.published_on IS NOT NULL
+    GROUP BY employees.subunit, posts.type, date_trunc('month', posts.published_on)::date;
+$$;
+
+
+ALTER FUNCTION public.rebuild_post_stats_monthly() OWNER TO orgfeed_user;
+
+--
+-- Name: post_search_vector(text, text); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.post_search_vector(post_title text, post_body text) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE
+    AS $$
+SELECT setweight(to_tsvector('pg_catalog.english', post_title), 'A') ||
+    setweight(to_tsvector('pg_catalog.english', post_body), 'B');
+$$;
+
+
+ALTER FUNCTION public.post_search_vector(post_title text, post_body text) OWNER TO orgfeed_user;
+
+--
+-- Name: posts_update_search_vector(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.posts_update_search_vector() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    NEW.search_vector := public.post_search_vector(NEW.title, NEW.body);
+    RETURN NEW;
+END
+$$;
+
+
+ALTER FUNCTION public.posts_update_search_vector() OWNER TO orgfeed_user;
+
+--
+-- Name: rebuild_posts_search_vectors(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.rebuild_posts_search_vectors() RETURNS void
+    LANGUAGE sql
+    AS $$
+UPDATE public.posts SET search_vector = public.post_search_vector(posts.title, posts.body);
+$$;
+
+
+ALTER FUNCTION public.rebuild_posts_search_vectors() OWNER TO orgfeed_user;
+
+--
+-- Name: posts_notify_events(); Type: FUNCTION; Schema: public; Owner: orgfeed_user
+--
+
+CREATE FUNCTION public.posts_notify_events() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    post record;
+    event text;
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.status = 1 THEN
+        event := 'published';
+    ELSIF TG_OP = 'DELETE' AND OLD.status = 1 THEN
+        event := 'removed';
+    ELSIF TG_OP = 'UPDATE' AND OLD.status <> 1 AND NEW.status = 1 THEN
+        event := 'published';
+    ELSIF TG_OP = 'UPDATE' AND OLD.status = 1 AND NEW.status = 2 THEN
+        event := 'archived';
+    ELSIF TG_OP = 'UPDATE' AND OLD.status = 1 AND NEW.status <> 1 THEN
+        event := 'removed';
+    ELSIF TG_OP = 'UPDATE' AND NEW.status = 1
+            AND (OLD.title <> NEW.title OR OLD.body <> NEW.body OR OLD.type <> NEW.type) THEN
+        event := 'edited';
+    ELSE
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        post := OLD;
+    ELSE
+        post := NEW;
+    END IF;
+    PERFORM pg_notify('post_events', json_build_object(
+        'event', event,
+        'id', post.id,
+        'type', post.type,
+        'subunit', (SELECT employees.subunit FROM public.employees WHERE employees.id = post.author)
+    )::text);
+    RETURN NULL;
+END
+$$;
+
+
+ALTER FUNCTION public.posts_notify_events() OWNER TO orgfeed_user;
+
 SET default_tablespace = '';
 
 SET default_with_oids = false;
@@ -38,12 +353,43 @@ SET default_with_oids = false;
 CREATE TABLE public.attachments (
     id uuid DEFAULT public.uuid() NOT NULL,
     author uuid NOT NULL,
-    post uuid
+    post uuid,
+    filename text,
+    content_type text,
+    size integer,
+    checksum text,
+    blob text
 );
 
 
 ALTER TABLE public.attachments OWNER TO orgfeed_user;
 
+--
+-- Name: attachment_counters; Type: TABLE; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TABLE public.attachment_counters (
+    author uuid NOT NULL,
+    count bigint DEFAULT 0 NOT NULL
+);
+
+
+ALTER TABLE public.attachment_counters OWNER TO orgfeed_user;
+
+--
+-- Name: blobs; Type: TABLE; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TABLE public.blobs (
+    checksum text NOT NULL,
+    size integer NOT NULL,
+    ref_count integer DEFAULT 0 NOT NULL,
+    created_on timestamp without time zone DEFAULT timezone('utc'::text, now()) NOT NULL
+);
+
+
+ALTER TABLE public.blobs OWNER TO orgfeed_user;
+
 --
 -- Name: employees; Type: TABLE; Schema: public; Owner: orgfeed_user
 --
@@ -55,12 +401,36 @@ CREATE TABLE public.employees (
     user_type smallint DEFAULT 0 NOT NULL,
     fired boolean DEFAULT false NOT NULL,
     email text NOT NULL,
-    password_hash text NOT NULL
+    password_hash text NOT NULL,
+    updated_on timestamp without time zone DEFAULT timezone('utc'::text, now()) NOT NULL,
+    permission_version integer DEFAULT 0 NOT NULL
 );
 
 
 ALTER TABLE public.employees OWNER TO orgfeed_user;
 
+--
+-- Name: jobs; Type: TABLE; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TABLE public.jobs (
+    id uuid DEFAULT public.uuid() NOT NULL,
+    name text NOT NULL,
+    arguments jsonb DEFAULT '{}'::jsonb NOT NULL,
+    status smallint DEFAULT 0 NOT NULL,
+    dedup_key text,
+    attempts integer DEFAULT 0 NOT NULL,
+    max_attempts integer DEFAULT 5 NOT NULL,
+    run_at timestamp without time zone DEFAULT timezone('utc'::text, now()) NOT NULL,
+    locked_until timestamp without time zone,
+    last_error text,
+    created_on timestamp without time zone DEFAULT timezone('utc'::text, now()) NOT NULL,
+    finished_on timestamp without time zone
+);
+
+
+ALTER TABLE public.jobs OWNER TO orgfeed_user;
+
 --
 -- Name: posts; Type: TABLE; Schema: public; Owner: orgfeed_user
 --
@@ -75,12 +445,44 @@ CREATE TABLE public.posts (
     author uuid NOT NULL,
     approved_by uuid,
     status smallint DEFAULT 0 NOT NULL,
-    body text NOT NULL
+    body text NOT NULL,
+    size integer DEFAULT 0 NOT NULL,
+    updated_on timestamp without time zone DEFAULT timezone('utc'::text, now()) NOT NULL,
+    search_vector tsvector
 );
 
 
 ALTER TABLE public.posts OWNER TO orgfeed_user;
 
+--
+-- Name: post_counters; Type: TABLE; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TABLE public.post_counters (
+    type smallint NOT NULL,
+    status smallint NOT NULL,
+    subunit uuid NOT NULL,
+    count bigint DEFAULT 0 NOT NULL
+);
+
+
+ALTER TABLE public.post_counters OWNER TO orgfeed_user;
+
+--
+-- Name: post_stats_monthly; Type: TABLE; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TABLE public.post_stats_monthly (
+    subunit uuid NOT NULL,
+    post_type smallint NOT NULL,
+    month date NOT NULL,
+    count bigint DEFAULT 0 NOT NULL,
+    bytes bigint DEFAULT 0 NOT NULL
+);
+
+
+ALTER TABLE public.post_stats_monthly OWNER TO orgfeed_user;
+
 --
 -- Name: subunits; Type: TABLE; Schema: public; Owner: orgfeed_user
 --
@@ -91,12 +493,21 @@ CREATE TABLE public.subunits (
     address text NOT NULL,
     leader uuid NOT NULL,
     email text NOT NULL,
-    phone text NOT NULL
+    phone text NOT NULL,
+    updated_on timestamp without time zone DEFAULT timezone('utc'::text, now()) NOT NULL
 );
 
 
 ALTER TABLE public.subunits OWNER TO orgfeed_user;
 
+--
+-- Name: attachment_counters attachment_counters_pkey; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
+--
+
+ALTER TABLE ONLY public.attachment_counters
+    ADD CONSTRAINT attachment_counters_pkey PRIMARY KEY (author);
+
+
 --
 -- Name: attachments attachments_pkey; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
 --
@@ -105,6 +516,14 @@ ALTER TABLE ONLY public.attachments
     ADD CONSTRAINT attachments_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: blobs blobs_pkey; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
+--
+
+ALTER TABLE ONLY public.blobs
+    ADD CONSTRAINT blobs_pkey PRIMARY KEY (checksum);
+
+
 --
 -- Name: employees employees_email_key; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
 --
@@ -121,6 +540,38 @@ ALTER TABLE ONLY public.employees
     ADD CONSTRAINT employees_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: jobs jobs_dedup_key_key; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
+--
+
+ALTER TABLE ONLY public.jobs
+    ADD CONSTRAINT jobs_dedup_key_key UNIQUE (dedup_key);
+
+
+--
+-- Name: jobs jobs_pkey; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
+--
+
+ALTER TABLE ONLY public.jobs
+    ADD CONSTRAINT jobs_pkey PRIMARY KEY (id);
+
+
+--
+-- Name: post_counters post_counters_pkey; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
+--
+
+ALTER TABLE ONLY public.post_counters
+    ADD CONSTRAINT post_counters_pkey PRIMARY KEY (type, status, subunit);
+
+
+--
+-- Name: post_stats_monthly post_stats_monthly_pkey; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
+--
+
+ALTER TABLE ONLY public.post_stats_monthly
+    ADD CONSTRAINT post_stats_monthly_pkey PRIMARY KEY (subunit, post_type, month);
+
+
 --
 -- Name: posts posts_pkey; Type: CONSTRAINT; Schema: public; Owner: orgfeed_user
 --
@@ -160,6 +611,13 @@ ALTER TABLE ONLY public.subunits
 CREATE INDEX attachments_author_idx ON public.attachments USING btree (author);
 
 
+--
+-- Name: attachments_blob_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX attachments_blob_idx ON public.attachments USING btree (blob);
+
+
 --
 -- Name: attachments_post_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
 --
@@ -167,6 +625,13 @@ CREATE INDEX attachments_author_idx ON public.attachments USING btree (author);
 CREATE INDEX attachments_post_idx ON public.attachments USING btree (post);
 
 
+--
+-- Name: blobs_unreferenced_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX blobs_unreferenced_idx ON public.blobs USING btree (checksum) WHERE (ref_count = 0);
+
+
 --
 -- Name: employees_full_name_subunit_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
 --
@@ -181,6 +646,48 @@ CREATE INDEX employees_full_name_subunit_idx ON public.employees USING btree (fu
 CREATE INDEX employees_subunit_fired_user_type_idx ON public.employees USING btree (subunit, fired, user_type);
 
 
+--
+-- Name: employees_updated_on_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX employees_updated_on_idx ON public.employees USING btree (updated_on);
+
+
+--
+-- Name: jobs_finished_on_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX jobs_finished_on_idx ON public.jobs USING btree (finished_on) WHERE (finished_on IS NOT NULL);
+
+
+--
+-- Name: jobs_status_run_at_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX jobs_status_run_at_idx ON public.jobs USING btree (status, run_at) WHERE (status < 2);
+
+
+--
+-- Name: post_stats_monthly_month_subunit_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX post_stats_monthly_month_subunit_idx ON public.post_stats_monthly USING btree (month, subunit);
+
+
+--
+-- Name: posts_archived_on_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX posts_archived_on_idx ON public.posts USING btree (archived_on) WHERE (status <> 2);
+
+
+--
+-- Name: posts_search_vector_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX posts_search_vector_idx ON public.posts USING gin (search_vector);
+
+
 --
 -- Name: posts_status_author_published_on_created_on_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
 --
@@ -188,6 +695,34 @@ CREATE INDEX employees_subunit_fired_user_type_idx ON public.employees USING btr
 CREATE INDEX posts_status_author_published_on_created_on_idx ON public.posts USING btree (status, author, published_on, created_on);
 
 
+--
+-- Name: posts_status_created_on_id_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX posts_status_created_on_id_idx ON public.posts USING btree (status, created_on, id);
+
+
+--
+-- Name: posts_status_published_on_size_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX posts_status_published_on_size_idx ON public.posts USING btree (status, published_on, size);
+
+
+--
+-- Name: posts_status_size_id_published_on_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX posts_status_size_id_published_on_idx ON public.posts USING btree (status, size DESC, id, published_on);
+
+
+--
+-- Name: posts_status_type_created_on_id_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX posts_status_type_created_on_id_idx ON public.posts USING btree (status, type, created_on, id);
+
+
 --
 -- Name: posts_title_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
 --
@@ -195,6 +730,13 @@ CREATE INDEX posts_status_author_published_on_created_on_idx ON public.posts USI
 CREATE INDEX posts_title_idx ON public.posts USING btree (title);
 
 
+--
+-- Name: posts_updated_on_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
+--
+
+CREATE INDEX posts_updated_on_idx ON public.posts USING btree (updated_on);
+
+
 --
 -- Name: subunits_address_leader_phone_idx; Type: INDEX; Schema: public; Owner: orgfeed_user
 --
@@ -202,6 +744,62 @@ CREATE INDEX posts_title_idx ON public.posts USING btree (title);
 CREATE INDEX subunits_address_leader_phone_idx ON public.subunits USING btree (address, leader, phone);
 
 
+--
+-- Name: attachments attachments_update_blob_refs; Type: TRIGGER; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TRIGGER attachments_update_blob_refs AFTER INSERT OR DELETE OR UPDATE OF blob ON public.attachments FOR EACH ROW EXECUTE PROCEDURE public.attachments_update_blob_refs();
+
+
+--
+-- Name: attachments attachments_update_counters; Type: TRIGGER; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TRIGGER attachments_update_counters AFTER INSERT OR DELETE OR UPDATE OF author ON public.attachments FOR EACH ROW EXECUTE PROCEDURE public.attachments_update_counters();
+
+
+--
+-- Name: employees employees_move_post_counters; Type: TRIGGER; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TRIGGER employees_move_post_counters AFTER UPDATE OF subunit ON public.employees FOR EACH ROW WHEN ((old.subunit IS DISTINCT FROM new.subunit)) EXECUTE PROCEDURE public.employees_move_post_counters();
+
+
+--
+-- Name: employees employees_move_post_stats; Type: TRIGGER; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TRIGGER employees_move_post_stats AFTER UPDATE OF subunit ON public.employees FOR EACH ROW WHEN ((old.subunit IS DISTINCT FROM new.subunit)) EXECUTE PROCEDURE public.employees_move_post_stats();
+
+
+--
+-- Name: posts posts_notify_events; Type: TRIGGER; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TRIGGER posts_notify_events AFTER INSERT OR DELETE OR UPDATE OF type, status, title, body ON public.posts FOR EACH ROW EXECUTE PROCEDURE public.posts_notify_events();
+
+
+--
+-- Name: posts posts_update_counters; Type: TRIGGER; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TRIGGER posts_update_counters AFTER INSERT OR DELETE OR UPDATE OF type, status, author ON public.posts FOR EACH ROW EXECUTE PROCEDURE public.posts_update_counters();
+
+
+--
+-- Name: posts posts_update_search_vector; Type: TRIGGER; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TRIGGER posts_update_search_vector BEFORE INSERT OR UPDATE OF title, body ON public.posts FOR EACH ROW EXECUTE PROCEDURE public.posts_update_search_vector();
+
+
+--
+-- Name: posts posts_update_stats; Type: TRIGGER; Schema: public; Owner: orgfeed_user
+--
+
+CREATE TRIGGER posts_update_stats AFTER INSERT OR DELETE OR UPDATE OF type, status, author, published_on, size ON public.posts FOR EACH ROW EXECUTE PROCEDURE public.posts_update_stats();
+
+
 --
 -- Name: attachments attachments_author_fkey; Type: FK CONSTRAINT; Schema: public; Owner: orgfeed_user
 --
@@ -210,6 +808,14 @@ ALTER TABLE ONLY public.attachments
     ADD CONSTRAINT attachments_author_fkey FOREIGN KEY (author) REFERENCES public.employees(id);
 
 
+--
+-- Name: attachments attachments_blob_fkey; Type: FK CONSTRAINT; Schema: public; Owner: orgfeed_user
+--
+
+ALTER TABLE ONLY public.attachments
+    ADD CONSTRAINT attachments_blob_fkey FOREIGN KEY (blob) REFERENCES public.blobs(checksum);
+
+
 --
 -- Name: attachments attachments_post_fkey; Type: FK CONSTRAINT; Schema: public; Owner: orgfeed_user
 --
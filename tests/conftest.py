@@ -0,0 +1,124 @@
+"""
+Tests run against a PostgreSQL database loaded from sql/orgfeed_db.sql, found like the server finds it
+(PGPASSWORD and the usual libpq variables such as PGHOST), and are skipped without it:
+
+    PGPASSWORD=... python -m pytest tests
+
+Every test runs in a transaction that is rolled back at its end, commits of repositories only release savepoints
+"""
+import os
+import uuid
+import warnings
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+import apis  # noqa: F401 (the apis must be imported before the models and services, they import each other)
+
+os.environ.setdefault("JWT_KEY", "test-key")
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not os.environ.get("PGPASSWORD"):
+        pytest.skip("PGPASSWORD of the test database is not set")
+    from server import app
+    # the shared cache of config.json lives in a system directory, tests use the in-process one
+    app.config["FEED_CACHE_BACKEND"] = "memory"
+    return app
+
+
+@pytest.fixture
+def session(app):
+    from repositories import db
+    with app.app_context():
+        try:
+            connection = db.engine.connect()
+        except OperationalError as e:
+            pytest.skip(f"Can not connect to the test database: {e}")
+        transaction = connection.begin()
+        # subunits and their leaders reference each other, the check is deferred to the commit that never happens
+        connection.execute("ALTER TABLE public.subunits ALTER CONSTRAINT subunits_leader_fkey DEFERRABLE")
+        connection.execute("SET CONSTRAINTS public.subunits_leader_fkey DEFERRED")
+        test_session = db.create_scoped_session(options={"bind": connection, "binds": {}})
+        test_session.begin_nested()
+
+        @event.listens_for(test_session(), "after_transaction_end")
+        def restart_savepoint(db_session, ended):
+            if ended.nested and not ended._parent.nested:
+                db_session.expire_all()
+                db_session.begin_nested()
+
+        app_session, db.session = db.session, test_session
+        try:
+            yield test_session
+        finally:
+            db.session = app_session
+            test_session.remove()
+            transaction.rollback()
+            with warnings.catch_warnings():
+                # the pool of SQLAlchemy 1.3 does not expect the transaction to be ended by the savepoints of a session
+                warnings.filterwarnings("ignore", "Reset agent is not active")
+                connection.close()
+
+
+@contextmanager
+def count_queries() -> Iterator[List[str]]:
+    """Collects the queries sent to the database inside the block (without savepoints and per transaction settings)"""
+    from repositories import db
+    statements = []
+
+    def collect(connection, cursor, statement, parameters, context, executemany):
+        if not statement.startswith(("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT", "SELECT set_config(")):
+            statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", collect)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", collect)
+
+
+def add_subunit(session, name: str = None):
+    """Subunit with its leader, returns the subunit"""
+    from repositories import Subunit, Employee
+    subunit_id, leader_id = str(uuid.uuid4()), str(uuid.uuid4())
+    name = name or f"Subunit {subunit_id[:8]}"
+    session.add(Subunit(id=subunit_id, name=name, address="Address", leader=leader_id, phone="1",
+                        email=f"{subunit_id}@subunits.test"))
+    session.flush()
+    session.add(Employee(id=leader_id, full_name=f"Leader of {name}", email=f"{leader_id}@employees.test",
+                         password_hash="-", subunit=subunit_id, user_type=2))
+    session.flush()
+    return session.query(Subunit).get(subunit_id)
+
+
+def add_employee(session, subunit, user_type: int = 0):
+    from repositories import Employee
+    employee_id = str(uuid.uuid4())
+    employee = Employee(id=employee_id, full_name=f"Employee {employee_id[:8]}",
+                        email=f"{employee_id}@employees.test", password_hash="-", subunit=subunit.id,
+                        user_type=user_type)
+    session.add(employee)
+    session.flush()
+    return employee
+
+
+def add_post(session, author, approver=None, status: int = 1, post_type: int = 0, title: str = "Title",
+             body: str = "Body", attachment_authors=(), attachment_size: int = 1, created_on: datetime = None):
+    from repositories import Post, Attachment
+    post_id = str(uuid.uuid4())
+    created_on = created_on or datetime.utcnow() - timedelta(minutes=1)
+    session.add(Post(id=post_id, type=post_type, title=title, body=body, author=author.id, status=status,
+                     approved_by=approver and approver.id, created_on=created_on,
+                     published_on=created_on if status in (1, 2) else None))
+    session.flush()
+    for attachment_author in attachment_authors:
+        session.add(Attachment(author=attachment_author.id, post=post_id, filename="file.txt",
+                               content_type="text/plain", size=attachment_size))
+    session.flush()
+    return session.query(Post).get(post_id)
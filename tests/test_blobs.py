@@ -0,0 +1,34 @@
+import io
+import uuid
+from os import path
+
+import pytest
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import FileStorage
+
+from repositories import attachment_repository, Attachment, Blob
+from .conftest import add_subunit, add_employee
+
+
+@pytest.fixture
+def upload_folder(session, tmp_path, monkeypatch):
+    monkeypatch.setitem(current_app.config, "UPLOAD_FOLDER", str(tmp_path))
+    return tmp_path
+
+
+def test_blob_of_a_failed_attachment_is_swept(session, upload_folder):
+    author = add_employee(session, add_subunit(session))
+    session.commit()
+    # the attachment row fails on commit, after its file is written
+    attachment = Attachment(id=str(uuid.uuid4()), author=author.id, post=str(uuid.uuid4()))
+    file = FileStorage(io.BytesIO(b"orphaned file"), filename="file.txt", content_type="text/plain")
+    with pytest.raises(IntegrityError):
+        attachment_repository.add_attachment(attachment, file)
+    session.rollback()
+    file_path = attachment_repository.blob_path(attachment.checksum)
+    assert path.exists(file_path)
+    assert session.query(Blob).get(attachment.checksum).ref_count == 0
+
+    assert attachment_repository.sweep_unreferenced_blobs(10) == 1
+    assert not path.exists(file_path)
@@ -0,0 +1,36 @@
+import pytest
+
+from utils.cache import MemoryCache, SqliteCache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache(4)
+    return SqliteCache(str(tmp_path / "cache.sqlite3"), 4)
+
+
+def test_entries_are_evicted_but_marks_are_not(cache):
+    cache.set_mark("written:employee:1", True, 10)
+    cache.set_mark("permission_version:1", 3, 10)
+    for number in range(10):
+        cache.set(f"feed:0::{number}", [number], 10)
+    assert cache.get("feed:0::0") is None
+    assert cache.get("feed:0::9") == [9]
+    assert cache.get_mark("written:employee:1") is True
+    assert cache.get_mark("permission_version:1") == 3
+
+
+def test_marks_expire(cache):
+    cache.set_mark("written:employee:1", True, -1)
+    assert cache.get_mark("written:employee:1") is None
+    assert cache.get_mark("written:employee:2") is None
+
+
+def test_expired_marks_are_purged():
+    cache = MemoryCache(4)
+    for number in range(5000):
+        cache.set_mark(f"written:employee:{number}", True, -1)
+    cache.set_mark("written:employee:live", True, 10)
+    assert len(cache.marks) < 1024
+    assert cache.get_mark("written:employee:live") is True
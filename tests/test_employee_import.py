@@ -0,0 +1,53 @@
+import io
+
+import pytest
+from werkzeug.exceptions import Forbidden
+
+from repositories import employee_repository
+from services import employee_service
+from .conftest import add_subunit, add_employee
+
+
+class UnreadableFile(io.RawIOBase):
+    def read(self, *args):
+        raise AssertionError("The file is read before the permissions are checked")
+
+
+def import_file(subunit, *emails) -> io.BytesIO:
+    lines = ["email,full_name,subunit,user_type,password"]
+    lines += [f"{email},Imported Employee,{subunit.id},user,Import-Password-1" for email in emails]
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def test_file_of_non_admin_is_not_read(session):
+    employee = add_employee(session, add_subunit(session))
+    with pytest.raises(Forbidden):
+        employee_service.import_employees_file(employee.id, UnreadableFile(), "csv")
+
+
+def test_passwords_are_hashed_on_the_login_pool(session, monkeypatch):
+    subunit = add_subunit(session)
+    admin = add_employee(session, subunit, user_type=2)
+    pool = employee_service.get_password_executor()
+    hashed = []
+    run = pool.run
+
+    def run_and_record(func, password, *args):
+        hashed.append(password)
+        return run(func, password, *args)
+
+    monkeypatch.setattr(pool, "run", run_and_record)
+    file = import_file(subunit, "a@import.test", "b@import.test")
+    result = employee_service.import_employees_file(admin.id, file, "csv")
+    assert result == {"imported": 2, "errors": []}
+    assert hashed == ["Import-Password-1", "Import-Password-1"]
+
+
+def test_concurrent_changes_raise_import_conflict(session, monkeypatch):
+    subunit = add_subunit(session)
+    existing = add_employee(session, subunit)
+    # the email is taken after the check for existing emails and before the COPY
+    monkeypatch.setattr(employee_repository, "get_existing_emails", lambda emails: set())
+    rows = employee_service.parse_import_rows(import_file(subunit, existing.email).read().decode(), "csv")
+    with pytest.raises(employee_service.ImportConflict):
+        employee_service.import_employees(rows, hashing_workers=1)
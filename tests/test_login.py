@@ -0,0 +1,11 @@
+from services import employee_service
+from .conftest import add_subunit, add_employee
+
+
+def test_login_is_not_refused_while_a_rehash_runs(session):
+    employee = add_employee(session, add_subunit(session))
+    employee.password_hash = employee_service.hash_password("Password-1", 4)
+    session.flush()
+    # the first login starts a rehash to BCRYPT_COST that outlives it, the next ones come during the rehash
+    for _ in range(3):
+        assert employee_service.get_token(employee.email, "Password-1")["user_id"] == employee.id
@@ -0,0 +1,62 @@
+import pytest
+
+from repositories import post_repository
+from models.post_enums import PostStatus, PostType
+from services import post_service
+from .conftest import count_queries, add_subunit, add_employee, add_post
+
+
+@pytest.fixture
+def posts(session):
+    """
+    Posts of every status with a creator, an approver and attachments of other employees
+    (all different, so lazy loads could not be served by the identity map), returns an author ID
+    """
+    subunit = add_subunit(session)
+    author = add_employee(session, subunit)
+    for number in range(5):
+        for status in (PostStatus.posted, PostStatus.archived, PostStatus.under_consideration):
+            add_post(
+                session, add_employee(session, subunit) if number % 2 else author,
+                add_employee(session, subunit, user_type=1), status.value, PostType.organization_news.value,
+                attachment_authors=[add_employee(session, subunit) for _ in range(2)]
+            )
+    author_id = author.id
+    session.commit()
+    session.expunge_all()
+    return author_id
+
+
+def serialized_queries(load_posts) -> int:
+    """Count of queries that load and serialize the posts"""
+    with count_queries() as statements:
+        serialized = post_service.prepare_posts_list(load_posts())
+    assert serialized and all(post["attachments"] for post in serialized)
+    return len(statements)
+
+
+@pytest.mark.parametrize("post_statuses", [{PostStatus.posted}, {PostStatus.archived}, set(PostStatus)])
+def test_page_queries_do_not_grow_with_page_size(session, posts, post_statuses):
+    def page_of(page_size):
+        return lambda: post_repository.get_posts(0, page_size, PostType.organization_news, post_statuses)
+
+    queries = serialized_queries(page_of(1))
+    session.expunge_all()
+    assert serialized_queries(page_of(5)) == queries
+
+
+def test_archive_queries_do_not_grow_with_page_size(session, posts):
+    queries = serialized_queries(lambda: post_repository.get_archived_posts(0, 1))
+    session.expunge_all()
+    assert serialized_queries(lambda: post_repository.get_archived_posts(0, 5)) == queries
+
+
+def test_employee_posts_queries_do_not_grow_with_posts_count(session, posts):
+    single = add_employee(session, add_subunit(session))
+    add_post(session, single, attachment_authors=[single])
+    single_id = single.id
+    session.commit()
+    session.expunge_all()
+    queries = serialized_queries(lambda: post_repository.get_posts_of_employee(single_id))
+    session.expunge_all()
+    assert serialized_queries(lambda: post_repository.get_posts_of_employee(posts)) == queries
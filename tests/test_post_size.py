@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from repositories import attachment_repository, post_repository, PostStatsMonthly
+from services import post_service
+from .conftest import add_subunit, add_employee, add_post
+
+
+def test_moved_attachment_changes_size_of_both_posts(session):
+    subunit = add_subunit(session)
+    author = add_employee(session, subunit)
+    source = add_post(session, author, title="a", body="b", attachment_authors=[author], attachment_size=1000)
+    target = add_post(session, author, title="c", body="d")
+    source_id, target_id, attachment_id = source.id, target.id, source.attachments[0].id
+    post_repository.update_posts_size([source_id, target_id])
+
+    previous_post_ids = attachment_repository.add_attachments_to_post(target_id, [attachment_id])
+    post_service.update_posts_size([target_id], previous_post_ids)
+
+    assert previous_post_ids == [str(source_id)]
+    assert post_repository.get_post_by_id(source_id).size == 2
+    assert post_repository.get_post_by_id(target_id).size == 1002
+    assert sum(stats.bytes for stats in session.query(PostStatsMonthly).filter_by(subunit=subunit.id)) == 1004
+
+
+def test_attachments_kept_by_their_post_do_not_count_as_moved(session):
+    author = add_employee(session, add_subunit(session))
+    post = add_post(session, author, attachment_authors=[author])
+    assert attachment_repository.add_attachments_to_post(post.id, [post.attachments[0].id]) == []
+    assert attachment_repository.add_attachments_to_post(None, [post.attachments[0].id]) == [str(post.id)]
+
+
+def test_biggest_posts_merge_statuses_in_size_order(session):
+    author = add_employee(session, add_subunit(session))
+    day = datetime(2025, 6, 1, 12)
+    sizes = {}
+    for number, (status, size) in enumerate([(1, 50), (2, 70), (1, 90), (2, 30), (0, 100), (1, 10)]):
+        post = add_post(session, author, status=status, title=f"t{number}", body="b",
+                        attachment_authors=[author], attachment_size=size, created_on=day)
+        sizes[post.id] = size
+    add_post(session, author, title="later", body="b", attachment_authors=[author], attachment_size=1000,
+             created_on=day + timedelta(days=1))
+    post_repository.update_posts_size(list(sizes))
+
+    def biggest(include_archived: bool, count: int):
+        start, end = day - timedelta(hours=1), day + timedelta(hours=1)
+        posts = post_repository.get_biggest_posts(start, end, include_archived, count)
+        return [sizes[post.id] for post in posts]
+
+    assert biggest(False, 10) == [90, 50, 10]
+    assert biggest(True, 3) == [90, 70, 50]
+    assert biggest(True, 10) == [90, 70, 50, 30, 10]
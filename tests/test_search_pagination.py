@@ -0,0 +1,30 @@
+from repositories import post_repository
+from models.post_enums import PostStatus
+from services import post_service, encode_rank_cursor, decode_rank_cursor
+from .conftest import add_subunit, add_employee, add_post
+
+
+def test_pages_over_tied_ranks_return_every_post_once(session):
+    author = add_employee(session, add_subunit(session))
+    # equal texts have equal ranks, the longer ones rank differently
+    for number in range(13):
+        add_post(session, author, title="Quarterly report", body="The report is ready. " * (1 + number % 3 // 2))
+    session.commit()
+    ts_query = post_service.build_ts_query("report")
+    statuses = {PostStatus.posted}
+
+    everything = post_repository.search_posts(ts_query, None, post_statuses=statuses)
+    assert len(everything) == 13
+    assert len({row.rank for row in everything}) < len(everything)
+
+    paged, cursor = [], None
+    for _ in range(len(everything)):
+        rows = post_repository.search_posts(ts_query, 3, post_statuses=statuses, cursor=cursor)
+        paged.extend(row.id for row in rows)
+        if len(rows) < 3:
+            break
+        # the cursor takes the same round trip as in the API
+        cursor = decode_rank_cursor(encode_rank_cursor(rows[-1].rank, rows[-1].id))
+
+    assert len(paged) == len(set(paged))
+    assert paged == [row.id for row in everything]
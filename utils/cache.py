@@ -0,0 +1,203 @@
+import time
+import pickle
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from os import path, makedirs
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+
+class CacheBackend(ABC):
+    """
+    Key-value store with bounded size and LRU eviction.
+    Generations are plain counters that are never evicted; they are used to invalidate groups of entries.
+    Marks are small values that are kept apart from the entries and are never evicted, only expire;
+    they are used for state that must last its TTL (e.g. recent writes), unlike cached results
+    """
+    @abstractmethod
+    def get(self, key: str) -> Any or None:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        pass
+
+    @abstractmethod
+    def get_generation(self, tag: str) -> int:
+        pass
+
+    @abstractmethod
+    def bump_generation(self, tag: str) -> None:
+        pass
+
+    @abstractmethod
+    def get_mark(self, key: str) -> Any or None:
+        pass
+
+    @abstractmethod
+    def set_mark(self, key: str, value: Any, ttl: float) -> None:
+        pass
+
+
+class NoCache(CacheBackend):
+    def get(self, key: str) -> Any or None:
+        return None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        pass
+
+    def get_generation(self, tag: str) -> int:
+        return 0
+
+    def bump_generation(self, tag: str) -> None:
+        pass
+
+    def get_mark(self, key: str) -> Any or None:
+        return None
+
+    def set_mark(self, key: str, value: Any, ttl: float) -> None:
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """In-process cache, invalidations are visible only inside the current process"""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generations: Dict[str, int] = {}
+        self.marks: Dict[str, Tuple[Any, float]] = {}
+        self.marks_purge_size = 1024
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any or None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_generation(self, tag: str) -> int:
+        return self.generations.get(tag, 0)
+
+    def bump_generation(self, tag: str) -> None:
+        with self.lock:
+            self.generations[tag] = self.generations.get(tag, 0) + 1
+
+    def get_mark(self, key: str) -> Any or None:
+        mark = self.marks.get(key)
+        if mark is None or mark[1] < time.monotonic():
+            return None
+        return mark[0]
+
+    def set_mark(self, key: str, value: Any, ttl: float) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.marks[key] = (value, now + ttl)
+            # expired marks are purged whenever their count doubles, so the purges take O(1) per mark
+            if len(self.marks) >= self.marks_purge_size:
+                self.marks = {key: mark for key, mark in self.marks.items() if mark[1] >= now}
+                self.marks_purge_size = max(1024, len(self.marks) * 2)
+
+
+class SqliteCache(CacheBackend):
+    """Cache in a local SQLite file, shared by all the worker processes of the host"""
+    def __init__(self, file_path: str, max_entries: int):
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        makedirs(path.dirname(file_path), exist_ok=True)
+        connection = self.connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_used_at_idx ON entries (used_at)")
+        connection.execute("CREATE TABLE IF NOT EXISTS generations (tag TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS marks (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS marks_expires_at_idx ON marks (expires_at)")
+
+    def connection(self) -> sqlite3.Connection:
+        if not getattr(self.local, 'connection', None):
+            self.local.connection = sqlite3.connect(self.file_path, timeout=5, isolation_level=None)
+            self.local.connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection.execute("PRAGMA synchronous=OFF")
+        return self.local.connection
+
+    def get(self, key: str) -> Any or None:
+        now = time.time()
+        connection = self.connection()
+        row = connection.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        if row[1] < now:
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        connection.execute("UPDATE entries SET used_at = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        connection = self.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + ttl, now)
+        )
+        connection.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def get_generation(self, tag: str) -> int:
+        row = self.connection().execute("SELECT value FROM generations WHERE tag = ?", (tag,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, tag: str) -> None:
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if not connection.execute("UPDATE generations SET value = value + 1 WHERE tag = ?", (tag,)).rowcount:
+                connection.execute("INSERT INTO generations (tag, value) VALUES (?, 1)", (tag,))
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    def get_mark(self, key: str) -> Any or None:
+        row = self.connection().execute(
+            "SELECT value FROM marks WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set_mark(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        connection = self.connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO marks (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + ttl)
+        )
+        connection.execute("DELETE FROM marks WHERE expires_at < ?", (now,))
+
+
+def create_cache(backend: str, max_entries: int, file_path: str = None) -> CacheBackend:
+    if backend == "memory":
+        return MemoryCache(max_entries)
+    if backend == "sqlite":
+        return SqliteCache(file_path, max_entries)
+    if backend == "none":
+        return NoCache()
+    raise ValueError(f"Unknown cache backend '{backend}'")
@@ -1,2 +1,26 @@
 MAX_FILE_SIZE = 1024 * 1024 * 5
 DB_CONNECTION_TEMPLATE = 'postgresql+psycopg2://{}:{}@/{}'
+FILE_READ_CHUNK_SIZE = 1024 * 64
+MAX_TOP_POSTS_COUNT = 100
+ATTACHMENT_CACHE_MAX_AGE = 3600 * 24 * 365
+ATTACHMENT_OFFLOAD_MODES = ('none', 'x-accel-redirect', 'x-sendfile')
+SEARCH_CONFIG = 'english'  # must be the same as in public.post_search_vector (see sql/orgfeed_db.sql)
+SEARCH_HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2'
+MAX_SEARCH_TERMS = 16
+MAX_BATCH_SIZE = 100
+MAX_IMPORT_ROWS = 100  # through HTTP, bigger files are loaded with the 'import-employees' command
+PASSWORD_HASHING_WORKERS = 4
+ARCHIVE_BATCH_SIZE = 500
+JOB_POLL_INTERVAL = 1.0
+JOB_SCHEDULE_INTERVAL = 30
+JOB_LOCK_SECONDS = 3600
+JOB_RETRY_BASE_DELAY = 30
+JOB_RETRY_MAX_DELAY = 3600
+JOB_RETENTION_DAYS = 14
+PERMISSIONS_CACHE_TTL = 30
+PERMISSIONS_CACHE_MAX_ENTRIES = 4096
+EVENTS_KEEPALIVE_INTERVAL = 15
+EVENTS_MAX_CLIENTS = 10000
+EVENTS_CLIENT_QUEUE_SIZE = 32
+EVENTS_RECONNECT_DELAY = 5
+EVENTS_REQUEST_TIMEOUT = 10
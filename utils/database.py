@@ -0,0 +1,154 @@
+import os
+import json
+from threading import Lock
+from time import monotonic
+from typing import Dict, List
+
+from flask import g, has_app_context, has_request_context
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, exc, text
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    """Checkout wait times and connection churn of the pools of the process"""
+    wait_buckets = (0.001, 0.01, 0.1, 1.0, 10.0)
+
+    def __init__(self):
+        self.lock = Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_histogram = [0] * (len(self.wait_buckets) + 1)
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+
+    def observe_checkout(self, wait: float, timed_out: bool) -> None:
+        with self.lock:
+            self.checkouts += 1
+            self.checkout_timeouts += timed_out
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.wait_histogram[sum(wait > bucket for bucket in self.wait_buckets)] += 1
+
+    def count(self, counter: str) -> None:
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self, pool: QueuePool) -> Dict[str, int or float or dict]:
+        with self.lock:
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            return {
+                "pid": os.getpid(),
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "saturation": round(pool.checkedout() / capacity, 3) if capacity else 0,
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "checkout_wait_avg": round(self.wait_total / self.checkouts, 6) if self.checkouts else 0,
+                "checkout_wait_max": round(self.wait_max, 6),
+                "checkout_wait_histogram": {
+                    **{f"le_{bucket}": count for bucket, count in zip(self.wait_buckets, self.wait_histogram)},
+                    "le_inf": self.wait_histogram[-1]
+                },
+                "connects": self.connects,
+                "closes": self.closes,
+                "invalidations": self.invalidations
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait (including connecting and the pre-ping) in pool_metrics"""
+    def connect(self):
+        started = monotonic()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            pool_metrics.observe_checkout(monotonic() - started, timed_out)
+
+
+@event.listens_for(TimedQueuePool, "connect")
+def count_connect(dbapi_connection, connection_record):
+    pool_metrics.count("connects")
+
+
+@event.listens_for(TimedQueuePool, "close")
+def count_close(dbapi_connection, connection_record):
+    pool_metrics.count("closes")
+
+
+@event.listens_for(TimedQueuePool, "invalidate")
+def count_invalidation(dbapi_connection, connection_record, exception):
+    pool_metrics.count("invalidations")
+
+
+engine_options_from_env = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", float),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", lambda value: value.lower() in ("1", "true", "yes"))
+}
+
+
+def engine_options(config_options: dict) -> dict:
+    """Engine options of SQLALCHEMY_ENGINE_OPTIONS config overridden by DB_* environment variables"""
+    options = dict(config_options)
+    for option, (variable, cast) in engine_options_from_env.items():
+        if os.environ.get(variable):
+            options[option] = cast(os.environ[variable])
+    options["poolclass"] = TimedQueuePool
+    return options
+
+
+def timeouts_config(config_timeouts: dict) -> Dict[str, Dict[str, int]]:
+    """Timeouts (in milliseconds) by endpoint class from DB_TIMEOUTS config, or from the JSON in DB_TIMEOUTS variable"""
+    if os.environ.get("DB_TIMEOUTS"):
+        return json.loads(os.environ["DB_TIMEOUTS"])
+    return config_timeouts
+
+
+def replica_binds(config_urls: List[str]) -> Dict[str, str]:
+    """
+    'SQLALCHEMY_BINDS' of read replicas from DB_REPLICA_URLS config, or from the comma-separated DB_REPLICA_URLS
+    variable. URLs without a password use PGPASSWORD (as the primary does)
+    """
+    if os.environ.get("DB_REPLICA_URLS") is not None:
+        config_urls = os.environ["DB_REPLICA_URLS"].split(',')
+    return {f"replica_{number}": url.strip() for number, url in enumerate(config_urls) if url.strip()}
+
+
+def replica_bind_keys(config: dict) -> List[str]:
+    return [key for key in config.get("SQLALCHEMY_BINDS") or () if key.startswith("replica_")]
+
+
+def timeouts_class() -> str:
+    """Endpoint class of the current request (set by apis.utils.db_timeouts), 'background' outside of requests"""
+    if has_app_context() and "db_timeouts_class" in g:
+        return g.db_timeouts_class
+    return "default" if has_request_context() else "background"
+
+
+@event.listens_for(SignallingSession, "after_begin")
+def set_timeouts(session, transaction, connection):
+    """
+    Sets the timeouts of the endpoint class for the transaction only (SET LOCAL), so they work through PgBouncer
+    in transaction mode, where the connection is shared with other clients and startup options are not allowed
+    """
+    timeouts = session.app.config["DB_TIMEOUTS"]
+    timeouts = timeouts.get(timeouts_class()) or timeouts["default"]
+    connection.execute(
+        text("SELECT set_config('statement_timeout', :statement, true), set_config('lock_timeout', :lock, true)"),
+        statement=str(timeouts["statement_timeout"]), lock=str(timeouts["lock_timeout"])
+    )
@@ -0,0 +1,29 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore
+from typing import Any, Callable
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """Pool of threads that refuses new tasks (raising ExecutorBusy) instead of queueing more than 'max_pending'"""
+    def __init__(self, max_workers: int, max_pending: int, name: str = ""):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.slots = BoundedSemaphore(max_workers + max_pending)
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        if not self.slots.acquire(blocking=False):
+            raise ExecutorBusy()
+        try:
+            future = self.executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Runs the function in the pool and waits for its result"""
+        return self.submit(func, *args, **kwargs).result()
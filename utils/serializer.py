@@ -0,0 +1,105 @@
+import json
+import zlib
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from flask_restx import fields
+
+from .config import FILE_READ_CHUNK_SIZE
+
+
+Serializer = Callable[[Any], dict]
+
+
+def compile_field(field: fields.Raw, nested: Serializer = None) -> Callable[[Any], Any]:
+    """Returns a function that formats a raw value exactly like 'field.output' does"""
+    if isinstance(field, fields.Nested):
+        serializer = nested or compile_serializer(field.nested)
+        if field.allow_null:
+            return lambda value: None if value is None else serializer(value)
+        return serializer
+    if isinstance(field, fields.List):
+        item = compile_field(field.container, nested)
+        return lambda value: None if value is None else [item(element) for element in value]
+    if isinstance(field, fields.String):
+        return lambda value: None if value is None else str(value)
+    if isinstance(field, fields.Integer):
+        return lambda value: None if value is None else int(value)
+    if isinstance(field, fields.Boolean):
+        return lambda value: None if value is None else bool(value)
+    if isinstance(field, fields.DateTime) and field.dt_format == "iso8601":
+        def format_datetime(value):
+            if value is None:
+                return None
+            if isinstance(value, datetime):
+                return value.isoformat()
+            if isinstance(value, date):
+                return datetime(value.year, value.month, value.day).isoformat()
+            return field.format(value)
+        return format_datetime
+    return lambda value: None if value is None else field.format(value)
+
+
+def compile_serializer(
+        model: Dict[str, fields.Raw],
+        getters: Dict[str, Callable[[Any], Any]] = None,
+        nested: Dict[str, Serializer] = None
+) -> Serializer:
+    """
+    Compiles the restx model (a dict of fields) into a function that builds the marshalled dict
+    of an object (or of None) directly, without 'marshal' and without an intermediate dict.
+    Values are read with 'getters' (attributes of the same name by default); nested
+    (and lists of nested) fields are formatted with 'nested' serializers if given
+    """
+    getters = getters or {}
+    nested = nested or {}
+    plan = []
+    for name, field in model.items():
+        getter = getters.get(name) or (lambda obj, attribute=field.attribute or name: getattr(obj, attribute, None))
+        plan.append((name, getter, compile_field(field, nested.get(name))))
+
+    def serialize(obj: Any) -> dict:
+        if obj is None:
+            return {name: format_value(None) for name, getter, format_value in plan}
+        return {name: format_value(getter(obj)) for name, getter, format_value in plan}
+    return serialize
+
+
+def dumps(data: Any, settings: dict, encoder: str = "json") -> str or bytes:
+    """Encodes marshalled data like flask-restx does ('orjson' is faster, but its output is compact)"""
+    if encoder == "orjson" and not settings:
+        try:
+            import orjson
+            return orjson.dumps(data) + b"\n"
+        except ImportError:
+            pass
+    return json.dumps(data, **settings) + "\n"
+
+
+def ndjson_chunks(
+        items: Iterable[Any], encoder: str = "json", chunk_size: int = FILE_READ_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Encodes the items as lines of JSON, joined into chunks of about 'chunk_size' bytes"""
+    chunk = []
+    length = 0
+    for item in items:
+        line = dumps(item, {}, encoder)
+        line = line if isinstance(line, bytes) else line.encode()
+        chunk.append(line)
+        length += len(line)
+        if length >= chunk_size:
+            yield b"".join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compresses the stream of chunks into a gzip stream on the fly"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,56 @@
+from os import path, makedirs, fchmod, umask
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from typing import IO
+
+from flask import Request, current_app
+
+
+def get_umask() -> int:
+    current = umask(0)
+    umask(current)
+    return current
+
+
+# temporary files are created with 0600, but they are linked into the attachments and read by a proxy with offload
+UPLOAD_FILE_MODE = 0o644 & ~get_umask()
+
+
+def upload_tmp_path() -> str:
+    return path.join(current_app.config["UPLOAD_FOLDER"], "tmp")
+
+
+class HashingFile:
+    """File wrapper that counts size and SHA-256 of everything written through it"""
+    def __init__(self, file: IO[bytes]):
+        self.file = file
+        self.checksum = sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.checksum.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def hexdigest(self) -> str:
+        return self.checksum.hexdigest()
+
+    def __getattr__(self, item):
+        return getattr(self.file, item)
+
+
+def create_upload_file(directory: str = None, delete: bool = True) -> HashingFile:
+    directory = directory or upload_tmp_path()
+    makedirs(directory, exist_ok=True)
+    file = NamedTemporaryFile("wb+", dir=directory, prefix=".upload-", delete=delete)
+    fchmod(file.fileno(), UPLOAD_FILE_MODE)
+    return HashingFile(file)
+
+
+class UploadRequest(Request):
+    """
+    Streams uploaded files chunk by chunk to temporary files next to the attachments
+    (so they can be linked into place) hashing them on the way, instead of buffering them
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return create_upload_file()
@@ -0,0 +1,21 @@
+import signal
+
+from server import app
+from services import job_service
+
+
+stopping = False
+
+
+def stop(signum, frame):
+    global stopping
+    stopping = True
+    app.logger.info("Stopping the worker after the current job")
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    with app.app_context():
+        app.logger.info("Worker is started with jobs: %s", ", ".join(sorted(job_service.handlers)))
+        job_service.run_worker(lambda: stopping)